@@ -2,6 +2,8 @@ from datetime import datetime
 from dataclasses import dataclass, asdict, field
 from typing import Optional, Union
 
+from src.utils import parse_datetime
+
 @dataclass
 class OperationDTO:
     date: Optional[Union[str, datetime]]
@@ -17,15 +19,15 @@ class OperationDTO:
     comment: Optional[str] = ""
     operation_id: Optional[str] = ""
     commission: Optional[float] = 0.0
-    _sort_key: Optional[str] = field(init=False, default=None)
+    _sort_key: Optional[datetime] = field(init=False, default=None, repr=False, compare=False)
 
     def __post_init__(self):
         if self.date:
             if isinstance(self.date, str) and len(self.date) == 10:
                 self.date += " 00:00:00"
-            self._sort_key = str(self.date)
+            self._sort_key = parse_datetime(self.date)
         else:
-            self._sort_key = ""
+            self._sort_key = None
 
         if isinstance(self.aci, str):
             try:
@@ -44,6 +46,16 @@ class OperationDTO:
         elif self.commission is None:
             self.commission = 0.0
 
+    @property
+    def parsed_date(self) -> Optional[datetime]:
+        """Дата операции, разобранная при создании DTO; None — дата не распознана."""
+        return self._sort_key
+
+    @property
+    def sort_key(self) -> datetime:
+        """Типизированный ключ хронологической сортировки; операции без даты — в конце."""
+        return self._sort_key or datetime.max
+
     def to_dict(self):
         result = asdict(self)
         if isinstance(self.date, datetime):
@@ -0,0 +1,365 @@
+# src/cli.py
+"""
+Пакетный парсинг выписок без HTTP-сервера:
+
+    python -m src reports/ archive/2023/*.xlsx -o out --format ndjson -j 8
+    python -m src reports/ -o out --format parquet --resume
+
+Файлы разбираются в пуле процессов напрямую через parse_full_statement.
+Каждый обработанный файл фиксируется в журнале <out>/_progress.ndjson,
+поэтому прерванный прогон можно продолжить с флагом --resume.
+"""
+from __future__ import annotations
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.services.columnar import operations_to_arrow, parquet_writer
+from src.services.full_statement import ORDER_MODES, parse_full_statement
+from src.utils import logger
+
+STATEMENT_SUFFIXES = (".xlsx", ".xls", ".xlsm")
+PER_FILE_FORMATS = ("json", "ndjson")
+COMBINED_FORMATS = ("parquet", "csv")
+
+JOURNAL_NAME = "_progress.ndjson"
+PARTS_DIR = "_parts"
+
+
+def collect_inputs(patterns: Iterable[str]) -> List[Path]:
+    """
+    Разворачивает аргументы командной строки в список файлов выписок:
+    каталоги обходятся рекурсивно, glob-шаблоны раскрываются, обычные пути берутся как есть.
+    Временные файлы Excel (~$...) пропускаются, дубликаты убираются.
+    """
+    found: Dict[str, Path] = {}
+
+    def add(p: Path) -> None:
+        if p.is_file() and p.suffix.lower() in STATEMENT_SUFFIXES and not p.name.startswith("~$"):
+            found.setdefault(str(p.resolve()), p)
+
+    for pattern in patterns:
+        p = Path(pattern)
+        if p.is_dir():
+            for child in sorted(p.rglob("*")):
+                add(child)
+        elif glob.has_magic(pattern):
+            for match in sorted(glob.glob(pattern, recursive=True)):
+                mp = Path(match)
+                if mp.is_dir():
+                    for child in sorted(mp.rglob("*")):
+                        add(child)
+                else:
+                    add(mp)
+        elif p.exists():
+            add(p)
+        else:
+            logger.warning("Путь не найден: %s", pattern)
+
+    return [found[k] for k in sorted(found)]
+
+
+def _output_names(files: List[Path]) -> Dict[str, str]:
+    """Имя выходного файла без расширения; при совпадении stem добавляется короткий хэш пути."""
+    stems: Dict[str, int] = {}
+    for f in files:
+        stems[f.stem] = stems.get(f.stem, 0) + 1
+    names = {}
+    for f in files:
+        key = str(f.resolve())
+        if stems[f.stem] > 1:
+            names[key] = f"{f.stem}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}"
+        else:
+            names[key] = f.stem
+    return names
+
+
+def _file_signature(path: Path) -> Dict[str, Any]:
+    st = path.stat()
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def _dump_json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _write_output(result: Dict, out_dir: Path, name: str, fmt: str, source: str) -> Path:
+    """
+    json   -> <out>/<name>.json: полный результат parse_full_statement
+    ndjson -> <out>/<name>.ndjson: по одной операции на строку
+    parquet/csv -> <out>/_parts/<name>.ndjson: промежуточная часть для итоговой сборки
+    """
+    if fmt == "json":
+        target = out_dir / f"{name}.json"
+        payload = _dump_json(result)
+    else:
+        target = (out_dir / PARTS_DIR / f"{name}.ndjson") if fmt in COMBINED_FORMATS else out_dir / f"{name}.ndjson"
+        extra = {"account_id": result.get("account_id"), "source_file": source} if fmt in COMBINED_FORMATS else {}
+        payload = "".join(_dump_json({**op, **extra}) + "\n" for op in result.get("operations", []))
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(payload, encoding="utf-8")
+    os.replace(tmp, target)
+    return target
+
+
+def _process_file(path: str, out_dir: str, name: str, fmt: str, order: str = "source") -> Dict[str, Any]:
+    """Выполняется в воркере: парсит один файл и сам пишет результат на диск."""
+    t0 = time.perf_counter()
+    try:
+        # файлы уже разнесены по процессам — секции внутри выписки параллелить незачем
+        result = parse_full_statement(path, mode="serial", order=order)
+        target = _write_output(result, Path(out_dir), name, fmt, path)
+        return {
+            "file": path,
+            "status": "ok",
+            "output": target.name,
+            "rows": len(result.get("operations", [])),
+            "elapsed": round(time.perf_counter() - t0, 4),
+        }
+    except Exception as e:
+        return {
+            "file": path,
+            "status": "error",
+            "error": f"{type(e).__name__}: {e}",
+            "rows": 0,
+            "elapsed": round(time.perf_counter() - t0, 4),
+        }
+
+
+def _init_worker(level: int) -> None:
+    logger.setLevel(level)
+
+
+def _load_journal(journal: Path) -> Dict[str, Dict[str, Any]]:
+    done: Dict[str, Dict[str, Any]] = {}
+    if not journal.exists():
+        return done
+    with journal.open(encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # хвост журнала мог оборваться при прерывании
+                continue
+            done[rec.get("file", "")] = rec
+    return done
+
+
+def _iter_parts(out_dir: Path, part_names: List[str]) -> Iterator[List[Dict[str, Any]]]:
+    """Записи каждой ndjson-части по очереди — в памяти не больше одной выписки."""
+    for name in part_names:
+        part = out_dir / PARTS_DIR / f"{name}.ndjson"
+        if not part.exists():
+            continue
+        with part.open(encoding="utf-8") as fh:
+            records = [json.loads(line) for line in fh if line.strip()]
+        if records:
+            yield records
+
+
+def _conform(table, schema):
+    """Приводит таблицу части к схеме первой части (недостающие колонки — null)."""
+    import pyarrow as pa
+
+    arrays = [
+        table.column(f.name).cast(f.type) if f.name in table.column_names else pa.nulls(table.num_rows, f.type)
+        for f in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _combine_parts(out_dir: Path, fmt: str, part_names: List[str]) -> Tuple[Path, int]:
+    """
+    Собирает промежуточные ndjson-части в единый файл операций потоково, по одной части:
+    parquet — через ParquetWriter с типизированной схемой из src.services.columnar
+    (row group на выписку), csv — дозаписью с заголовком по первой части.
+    """
+    target = out_dir / f"operations.{fmt}"
+    tmp = target.with_name(target.name + ".tmp")
+    total = 0
+    if fmt == "parquet":
+        writer = None
+        try:
+            for records in _iter_parts(out_dir, part_names):
+                table = operations_to_arrow(records)
+                if writer is None:
+                    writer = parquet_writer(str(tmp), table.schema)
+                writer.write_table(_conform(table, writer.schema))
+                total += table.num_rows
+            if writer is None:
+                writer = parquet_writer(str(tmp), operations_to_arrow([]).schema)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        import pandas as pd
+        columns: Optional[List[str]] = None
+        with tmp.open("w", encoding="utf-8", newline="") as fh:
+            for records in _iter_parts(out_dir, part_names):
+                frame = pd.DataFrame.from_records(records)
+                if columns is None:
+                    columns = list(frame.columns)
+                    frame.to_csv(fh, index=False)
+                else:
+                    frame.reindex(columns=columns).to_csv(fh, index=False, header=False)
+                total += len(frame)
+    os.replace(tmp, target)
+    return target, total
+
+
+class _Throughput:
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.rows = 0
+        self.started = time.perf_counter()
+        self.stream = stream
+
+    def update(self, rec: Dict[str, Any]) -> None:
+        self.done += 1
+        self.rows += rec.get("rows", 0)
+        if rec.get("status") != "ok":
+            self.failed += 1
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        status = "OK " if rec.get("status") == "ok" else "ERR"
+        print(
+            f"[{self.done}/{self.total}] {status} {Path(rec['file']).name}: {rec.get('rows', 0)} строк "
+            f"за {rec.get('elapsed', 0):.2f}s | {self.done / elapsed:.2f} файлов/с, {self.rows / elapsed:.0f} строк/с",
+            file=self.stream,
+        )
+        if rec.get("status") != "ok":
+            print(f"    {rec.get('error')}", file=self.stream)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "files": self.done,
+            "failed": self.failed,
+            "rows": self.rows,
+            "elapsed_s": round(elapsed, 3),
+            "files_per_s": round(self.done / elapsed, 3),
+            "rows_per_s": round(self.rows / elapsed, 1),
+        }
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m src", description="Пакетный парсинг брокерских выписок ВТБ")
+    ap.add_argument("inputs", nargs="+", help="файлы, каталоги или glob-шаблоны")
+    ap.add_argument("-o", "--output", required=True, help="каталог для результатов")
+    ap.add_argument(
+        "-f", "--format", default="json", choices=PER_FILE_FORMATS + COMBINED_FORMATS,
+        help="json/ndjson — файл на выписку; parquet/csv — единая таблица операций",
+    )
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="число процессов")
+    ap.add_argument("--resume", action="store_true", help="пропустить файлы, уже обработанные по журналу")
+    ap.add_argument("--order", default="source", choices=ORDER_MODES, help="порядок операций в выходе")
+    ap.add_argument("--cache-dir", help="каталог дискового кэша декодированных xlsx (PARSER_GRID_CACHE_DIR)")
+    ap.add_argument("--log-level", default="WARNING", help="уровень логов парсера (по умолчанию WARNING)")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+
+    level = getattr(logging, str(args.log_level).upper(), logging.WARNING)
+    os.environ["PARSER_LOGLEVEL"] = logging.getLevelName(level)
+    logger.setLevel(level)
+
+    if args.cache_dir:
+        os.environ["PARSER_GRID_CACHE_DIR"] = args.cache_dir
+
+    out_dir = Path(args.output)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    journal_path = out_dir / JOURNAL_NAME
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("Не найдено ни одного файла выписки", file=sys.stderr)
+        return 2
+
+    names = _output_names(files)
+    journal = _load_journal(journal_path) if args.resume else {}
+    if not args.resume:
+        journal_path.unlink(missing_ok=True)
+
+    pending: List[Path] = []
+    signatures: Dict[str, Dict[str, Any]] = {}
+    for f in files:
+        key = str(f.resolve())
+        signatures[key] = _file_signature(f)
+        rec = journal.get(key)
+        if (
+            rec and rec.get("status") == "ok" and rec.get("format") == args.format
+            and rec.get("size") == signatures[key]["size"] and rec.get("mtime") == signatures[key]["mtime"]
+        ):
+            continue
+        pending.append(f)
+
+    skipped = len(files) - len(pending)
+    if skipped:
+        print(f"Пропущено по журналу: {skipped} из {len(files)}", file=sys.stderr)
+
+    progress = _Throughput(len(pending))
+    jobs = max(1, int(args.jobs))
+
+    with journal_path.open("a", encoding="utf-8") as jf:
+        def record(rec: Dict[str, Any]) -> None:
+            rec.update(signatures[rec["file"]], format=args.format)
+            jf.write(_dump_json(rec) + "\n")
+            jf.flush()
+            progress.update(rec)
+
+        tasks = [
+            (str(f.resolve()), str(out_dir), names[str(f.resolve())], args.format, args.order)
+            for f in pending
+        ]
+        try:
+            if jobs == 1:
+                for t in tasks:
+                    record(_process_file(*t))
+            else:
+                with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(level,)) as pool:
+                    futures = [pool.submit(_process_file, *t) for t in tasks]
+                    try:
+                        for fut in as_completed(futures):
+                            record(fut.result())
+                    except KeyboardInterrupt:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        raise
+        except KeyboardInterrupt:
+            print(
+                f"\nПрервано: обработано {progress.done} из {len(pending)}. "
+                f"Продолжить: добавьте --resume к той же команде.",
+                file=sys.stderr,
+            )
+            return 130
+
+    summary = progress.summary()
+    summary["skipped_resume"] = skipped
+
+    if args.format in COMBINED_FORMATS:
+        final_journal = _load_journal(journal_path)
+        ok_names = [
+            names[str(f.resolve())] for f in files
+            if final_journal.get(str(f.resolve()), {}).get("status") == "ok"
+        ]
+        target, total_rows = _combine_parts(out_dir, args.format, ok_names)
+        summary["combined_output"] = str(target)
+        summary["combined_rows"] = total_rows
+
+    print(_dump_json(summary))
+    return 1 if progress.failed else 0
@@ -1,7 +1,23 @@
 from typing import Any, Callable, Dict, Optional
+from functools import lru_cache
+import os
 import re
+import sys
 
 _NBSP_PAT = re.compile(r"[\u00A0\u202F]")
+_WS_PAT = re.compile(r"\s+")
+
+# Ячейки выписки (валюты, названия операций, "Итого", инструменты) повторяются тысячи раз,
+# поэтому нормализованный текст кэшируется: каждая уникальная строка проходит регулярки один раз.
+NORM_CACHE_SIZE = int(os.getenv("PARSER_NORM_CACHE_SIZE", "65536"))
+
+
+@lru_cache(maxsize=NORM_CACHE_SIZE)
+def _norm_text(st: str) -> str:
+    st = _NBSP_PAT.sub(" ", st)
+    st = _WS_PAT.sub(" ", st)
+    return sys.intern(st.strip().lower())
+
 
 def norm_str(s: Any) -> str:
     """
@@ -10,13 +26,16 @@ def norm_str(s: Any) -> str:
     - заменяет NBSP на обычные пробелы
     - сводит множественные пробелы к одному
     - strip() и lower()
+    Результат кэшируется (LRU, PARSER_NORM_CACHE_SIZE).
     """
     if s is None:
         return ""
-    st = str(s)
-    st = _NBSP_PAT.sub(" ", st)
-    st = re.sub(r"\s+", " ", st)
-    return st.strip().lower()
+    return _norm_text(s if type(s) is str else str(s))
+
+
+def norm_cache_info() -> Dict[str, Any]:
+    """Статистика LRU-кэша norm_str (для /metrics)."""
+    return _norm_text.cache_info()._asdict()
 
 
 def _norm_key(s: str) -> str:
@@ -135,3 +154,13 @@ CURRENCY_DICT = {
     "SEK": "SEK", "TJS": "TJS", "TRY": "TRY", "USD": "USD", "UZS": "UZS",
     "XAG": "XAG", "XAU": "XAU", "ZAR": "ZAR", "₽": "RUB"
 }
+
+
+def normalize_currency(raw: str) -> str:
+    """
+    Код валюты по CURRENCY_DICT; неизвестные значения возвращаются в верхнем регистре.
+    Не кэшируется: CURRENCY_DICT можно дополнять во время работы, а upper() + поиск
+    в словаре не дороже обращения к lru_cache.
+    """
+    up = raw.upper()
+    return CURRENCY_DICT.get(up, up)
@@ -0,0 +1,256 @@
+# src/devtools/diffbench.py
+"""
+Дифференциальный бенчмарк парсеров: эталонная реализация против альтернативных движков.
+
+Для каждой выписки корпуса движки запускаются на одном и том же файле, результат
+(operations и meta) сравнивается с эталоном поле за полем, а время и пик памяти
+сводятся в таблицу рядом со speedup. Ненулевой код возврата — если есть расхождения.
+
+    python -m src.devtools.diffbench reports/*.xlsx --engine thread --engine process
+    python -m src.devtools.diffbench --synthetic 100,5000 --engine mypkg.fast:parse --repeat 5
+
+Движок — имя из ENGINES или "модуль:функция", где функция принимает путь к файлу
+и возвращает словарь в формате parse_full_statement.
+
+Golden-выходы позволяют сравнивать разные версии кода: --save-golden DIR сохраняет
+результат эталона, а --golden DIR сравнивает движки с сохранёнными файлами
+(ключ — sha256 содержимого выписки).
+
+    git stash && python -m src.devtools.diffbench reports/ --save-golden golden/ && git stash pop
+    python -m src.devtools.diffbench reports/ --golden golden/ --engine reference
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import importlib
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.parsers.layout_cache import LAYOUTS
+from src.services.full_statement import parse_full_statement
+from src.services.workbook_cache import file_digest
+from src.utils import logger
+
+Engine = Callable[[str], Dict[str, Any]]
+
+ENGINES: Dict[str, Engine] = {
+    "reference": lambda path: parse_full_statement(path, mode="serial"),
+    "thread": lambda path: parse_full_statement(path, mode="thread"),
+    "process": lambda path: parse_full_statement(path, mode="process"),
+}
+
+
+def resolve_engine(spec: str) -> Engine:
+    if spec in ENGINES:
+        return ENGINES[spec]
+    if ":" not in spec:
+        raise ValueError(f"Неизвестный движок {spec!r}: ожидается одно из {sorted(ENGINES)} или 'модуль:функция'")
+    module_name, func_name = spec.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+@contextlib.contextmanager
+def _env(name: str, value: Optional[str]) -> Iterator[None]:
+    old = os.environ.get(name)
+    if value is None:
+        os.environ.pop(name, None)
+    else:
+        os.environ[name] = value
+    try:
+        yield
+    finally:
+        if old is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = old
+
+
+def _normalized(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит результат к JSON-виду, чтобы datetime/float сравнивались одинаково у всех движков."""
+    return json.loads(json.dumps(result, ensure_ascii=False, default=str))
+
+
+def diff_values(ref: Any, alt: Any, path: str, out: List[str], limit: int, tol: float = 1e-9) -> None:
+    """Рекурсивное сравнение с путём до расхождения (operations[12].isin, meta.fin_stats.parsed, ...)."""
+    if len(out) >= limit:
+        return
+    if isinstance(ref, dict) and isinstance(alt, dict):
+        for k in list(dict.fromkeys([*ref.keys(), *alt.keys()])):
+            if k not in alt:
+                out.append(f"{path}.{k}: отсутствует у движка (эталон={ref[k]!r})")
+            elif k not in ref:
+                out.append(f"{path}.{k}: лишнее поле (движок={alt[k]!r})")
+            else:
+                diff_values(ref[k], alt[k], f"{path}.{k}", out, limit, tol)
+        return
+    if isinstance(ref, list) and isinstance(alt, list):
+        if len(ref) != len(alt):
+            out.append(f"{path}: длина {len(ref)} != {len(alt)}")
+        for i, (a, b) in enumerate(zip(ref, alt)):
+            diff_values(a, b, f"{path}[{i}]", out, limit, tol)
+        return
+    if isinstance(ref, (int, float)) and isinstance(alt, (int, float)) and not isinstance(ref, bool):
+        if abs(float(ref) - float(alt)) > tol * max(1.0, abs(float(ref))):
+            out.append(f"{path}: {ref!r} != {alt!r}")
+        return
+    if ref != alt:
+        out.append(f"{path}: {ref!r} != {alt!r}")
+
+
+def compare_results(ref: Dict[str, Any], alt: Dict[str, Any], limit: int = 50) -> List[str]:
+    diffs: List[str] = []
+    ref_n, alt_n = _normalized(ref), _normalized(alt)
+    for key in ("operations", "meta"):
+        diff_values(ref_n.get(key), alt_n.get(key), key, diffs, limit)
+    header_keys = [k for k in ref_n if k not in ("operations", "meta")]
+    diff_values({k: ref_n.get(k) for k in header_keys}, {k: alt_n.get(k) for k in header_keys}, "header", diffs, limit)
+    return diffs
+
+
+def measure(engine: Engine, path: str, repeat: int) -> Dict[str, Any]:
+    """
+    Прогоняет движок repeat раз для замера времени и ещё раз под tracemalloc для пика памяти
+    (tracemalloc сильно замедляет выполнение, поэтому время под ним не меряется).
+    """
+    timings: List[float] = []
+    result: Dict[str, Any] = {}
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = engine(path)
+        timings.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        engine(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"result": result, "median_s": statistics.median(timings), "min_s": min(timings), "peak_bytes": peak}
+
+
+def _golden_path(golden_dir: str, path: str) -> str:
+    return os.path.join(golden_dir, f"{file_digest(path)}.json")
+
+
+def run(
+    corpus: List[str],
+    reference: str,
+    engines: List[str],
+    repeat: int,
+    max_diffs: int,
+    golden_dir: Optional[str] = None,
+    save_golden: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    ref_engine = resolve_engine(reference)
+    alt_engines = {name: resolve_engine(name) for name in engines}
+    report: List[Dict[str, Any]] = []
+
+    for path in corpus:
+        # эталон всегда без дискового кэша сеток и кэша разметки — честное чтение xlsx
+        # и определение колонок по ключевым словам
+        with _env("PARSER_GRID_CACHE_DIR", None), LAYOUTS.disabled():
+            ref = measure(ref_engine, path, repeat)
+        ops = len(ref["result"].get("operations", []))
+        ref_diffs: List[str] = []
+        if save_golden:
+            os.makedirs(save_golden, exist_ok=True)
+            with open(_golden_path(save_golden, path), "w", encoding="utf-8") as fh:
+                json.dump(_normalized(ref["result"]), fh, ensure_ascii=False, sort_keys=True)
+        if golden_dir:
+            gp = _golden_path(golden_dir, path)
+            if os.path.exists(gp):
+                with open(gp, encoding="utf-8") as fh:
+                    golden = json.load(fh)
+                ref_diffs = compare_results(golden, ref["result"], max_diffs)
+                ref["result"] = golden
+            else:
+                ref_diffs = [f"нет golden-файла {gp}"]
+        report.append({
+            "file": path, "engine": reference, "operations": ops,
+            "median_s": ref["median_s"], "speedup": 1.0,
+            "peak_mib": ref["peak_bytes"] / 2 ** 20, "peak_delta_mib": 0.0, "diffs": ref_diffs,
+        })
+        for name, engine in alt_engines.items():
+            alt = measure(engine, path, repeat)
+            report.append({
+                "file": path, "engine": name, "operations": len(alt["result"].get("operations", [])),
+                "median_s": alt["median_s"],
+                "speedup": ref["median_s"] / alt["median_s"] if alt["median_s"] else float("inf"),
+                "peak_mib": alt["peak_bytes"] / 2 ** 20,
+                "peak_delta_mib": (alt["peak_bytes"] - ref["peak_bytes"]) / 2 ** 20,
+                "diffs": compare_results(ref["result"], alt["result"], max_diffs),
+            })
+    return report
+
+
+def print_report(report: List[Dict[str, Any]], stream=sys.stdout) -> None:
+    header = f"{'файл':<32} {'движок':<24} {'опер.':>7} {'медиана, s':>11} {'speedup':>8} {'пик, MiB':>9} {'Δпик':>8} {'расхожд.':>9}"
+    print(header, file=stream)
+    print("-" * len(header), file=stream)
+    for row in report:
+        print(
+            f"{os.path.basename(row['file'])[:32]:<32} {row['engine'][:24]:<24} {row['operations']:>7} "
+            f"{row['median_s']:>11.4f} {row['speedup']:>7.2f}x {row['peak_mib']:>9.1f} "
+            f"{row['peak_delta_mib']:>+8.1f} {len(row['diffs']):>9}",
+            file=stream,
+        )
+    for row in report:
+        if row["diffs"]:
+            print(f"\n{row['file']} [{row['engine']}]:", file=stream)
+            for d in row["diffs"]:
+                print(f"  {d}", file=stream)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Дифференциальный бенчмарк парсеров выписок")
+    ap.add_argument("corpus", nargs="*", help="файлы, каталоги или glob-шаблоны выписок")
+    ap.add_argument("--synthetic", help="сгенерировать синтетический корпус указанных размеров (100,1000)")
+    ap.add_argument("--reference", default="reference", help="эталонный движок")
+    ap.add_argument("--engine", action="append", default=[], help="альтернативный движок (можно несколько раз)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--max-diffs", type=int, default=20, help="сколько расхождений показывать на файл")
+    ap.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    ap.add_argument("--golden", help="каталог golden-выходов: эталон сверяется с ними, движки — тоже")
+    ap.add_argument("--save-golden", help="сохранить выход эталона как golden в каталог")
+    args = ap.parse_args(argv)
+
+    if logger.level < logging.WARNING:
+        logger.setLevel(logging.WARNING)
+
+    from src.cli import collect_inputs
+
+    corpus = [str(p) for p in collect_inputs(args.corpus)] if args.corpus else []
+    tmp_dir = None
+    if args.synthetic:
+        from src.devtools.synthetic import generate_corpus
+
+        tmp_dir = tempfile.TemporaryDirectory(prefix="vtb_diffbench_")
+        corpus += generate_corpus(tmp_dir.name, [int(x) for x in args.synthetic.split(",") if x])
+    if not corpus:
+        ap.error("пустой корпус: укажите файлы или --synthetic")
+
+    try:
+        report = run(
+            corpus, args.reference, args.engine or ["thread"], args.repeat, args.max_diffs,
+            golden_dir=args.golden, save_golden=args.save_golden,
+        )
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+    return 1 if any(row["diffs"] for row in report) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
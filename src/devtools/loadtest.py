@@ -0,0 +1,386 @@
+# src/devtools/loadtest.py
+"""
+Нагрузочный прогон FastAPI-сервиса: пропускная способность, p50/p95/p99, RSS во времени.
+
+По умолчанию приложение src.main:app поднимается в этом же процессе и опрашивается через
+httpx.ASGITransport — без сети, но с тем же event loop, admission-контролем и
+asyncio.to_thread, что и под uvicorn. С --url нагружается уже запущенный сервер.
+
+Нагрузка — замкнутый цикл: C клиентов шлют выписки из смеси синтетических размеров
+(--mix размер:вес), пока не отправлено --requests запросов. Сценарии — декартово
+произведение режимов секций (--modes), уровней параллелизма (--concurrency) и эндпоинтов
+(--endpoint parse: синхронный /parse-report, jobs: POST /jobs + опрос результата).
+
+    python -m src.devtools.loadtest --mix 100:5,2000:2,10000:1 --concurrency 1,8,32 --modes serial,thread,process
+    python -m src.devtools.loadtest --endpoint parse --endpoint jobs --to-thread-workers 4 --json load.json
+    python -m src.devtools.loadtest --url http://127.0.0.1:8000 --concurrency 16 --requests 500
+
+--to-thread-workers ограничивает пул asyncio.to_thread (по умолчанию min(32, CPU+4)),
+чтобы увидеть, как насыщение пула переходит в очередь и хвост латентности.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.utils import logger
+
+# верхние границы корзин гистограммы латентности, мс
+HISTOGRAM_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def parse_mix(spec: str) -> List[Tuple[int, int]]:
+    """'100:5,2000:1' -> [(100, 5), (2000, 1)]; вес по умолчанию 1."""
+    mix = []
+    for part in spec.split(","):
+        if not part:
+            continue
+        size, _, weight = part.partition(":")
+        mix.append((int(size), int(weight or 1)))
+    if not mix:
+        raise ValueError("Пустая смесь размеров")
+    return mix
+
+
+def read_rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Текущий RSS процесса из /proc (Linux); None, если недоступно."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def histogram(latencies_ms: List[float]) -> Dict[str, int]:
+    counts: Dict[str, int] = {f"<={b}": 0 for b in HISTOGRAM_BOUNDS_MS}
+    counts[f">{HISTOGRAM_BOUNDS_MS[-1]}"] = 0
+    for v in latencies_ms:
+        for b in HISTOGRAM_BOUNDS_MS:
+            if v <= b:
+                counts[f"<={b}"] += 1
+                break
+        else:
+            counts[f">{HISTOGRAM_BOUNDS_MS[-1]}"] += 1
+    return counts
+
+
+class _Sampler:
+    """Фоновый замер RSS и числа запросов в полёте с шагом interval секунд."""
+
+    def __init__(self, interval: float, pid: Optional[int] = None):
+        self.interval = interval
+        self.pid = pid
+        self.inflight = 0
+        self.max_inflight = 0
+        self.samples: List[Dict[str, float]] = []
+        self._t0 = time.perf_counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def enter(self) -> None:
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+
+    def leave(self) -> None:
+        self.inflight -= 1
+
+    def _sample(self) -> None:
+        rss = read_rss_bytes(self.pid)
+        self.samples.append({
+            "t": round(time.perf_counter() - self._t0, 3),
+            "rss_mib": round(rss / 2 ** 20, 1) if rss is not None else -1.0,
+            "inflight": self.inflight,
+        })
+
+    async def _loop(self) -> None:
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._t0 = time.perf_counter()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._sample()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+
+async def _request_parse(client: httpx.AsyncClient, name: str, content: bytes, params: Dict[str, str]) -> int:
+    resp = await client.post("/parse-report", params=params, files={"file": (name, content, XLSX_MEDIA_TYPE)})
+    await resp.aread()
+    return resp.status_code
+
+
+async def _request_job(client: httpx.AsyncClient, name: str, content: bytes, poll_interval: float) -> int:
+    resp = await client.post("/jobs", files={"file": (name, content, XLSX_MEDIA_TYPE)})
+    if resp.status_code != 202:
+        return resp.status_code
+    result_url = resp.json()["result_url"]
+    while True:
+        resp = await client.get(result_url)
+        if resp.status_code != 202:
+            await resp.aread()
+            return resp.status_code
+        await asyncio.sleep(poll_interval)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    payloads: List[Tuple[str, int, bytes]],
+    weights: List[int],
+    endpoint: str,
+    concurrency: int,
+    requests: int,
+    sample_interval: float = 0.2,
+    poll_interval: float = 0.05,
+    params: Optional[Dict[str, str]] = None,
+    pid: Optional[int] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Один сценарий: concurrency клиентов делят между собой requests запросов."""
+    rng = random.Random(seed)
+    plan = rng.choices(range(len(payloads)), weights=weights, k=requests)
+    latencies: List[float] = []
+    by_size: Dict[int, List[float]] = {}
+    statuses: Counter = Counter()
+    sampler = _Sampler(sample_interval, pid)
+    rss_before = read_rss_bytes(pid)
+
+    async def client_loop() -> None:
+        while plan:
+            name, size, content = payloads[plan.pop()]
+            sampler.enter()
+            t0 = time.perf_counter()
+            try:
+                if endpoint == "jobs":
+                    code = await _request_job(client, name, content, poll_interval)
+                else:
+                    code = await _request_parse(client, name, content, params or {})
+            except httpx.HTTPError as e:
+                logger.warning("Ошибка запроса %s: %s", name, e)
+                code = 0
+            finally:
+                sampler.leave()
+            ms = (time.perf_counter() - t0) * 1000
+            statuses[code] += 1
+            if code == 200:
+                latencies.append(ms)
+                by_size.setdefault(size, []).append(ms)
+
+    sampler.start()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    await sampler.stop()
+
+    latencies.sort()
+    rss_values = [s["rss_mib"] for s in sampler.samples if s["rss_mib"] >= 0]
+    rss_base = rss_before / 2 ** 20 if rss_before is not None else None
+    rss_peak = max(rss_values) if rss_values else None
+    rss_delta = rss_peak - rss_base if rss_peak is not None and rss_base is not None else None
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+        "by_size_p95_ms": {str(k): percentile(sorted(v), 95) for k, v in sorted(by_size.items())},
+        "histogram_ms": histogram(latencies),
+        "rss_base_mib": rss_base,
+        "rss_peak_mib": rss_peak,
+        # грубая оценка: прирост пика RSS на один одновременный запрос
+        "rss_per_inflight_mib": rss_delta / sampler.max_inflight if rss_delta is not None and sampler.max_inflight else None,
+        "max_inflight": sampler.max_inflight,
+        "rss_timeline": sampler.samples,
+    }
+
+
+def build_payloads(mix: List[Tuple[int, int]], work_dir: str, seed: int = 0) -> Tuple[List[Tuple[str, int, bytes]], List[int]]:
+    from src.devtools.synthetic import write_statement
+
+    payloads, weights = [], []
+    for k, (size, weight) in enumerate(mix):
+        path = write_statement(os.path.join(work_dir, f"load_{size}.xlsx"), size, size, seed + k)
+        with open(path, "rb") as fh:
+            payloads.append((os.path.basename(path), size, fh.read()))
+        weights.append(weight)
+    return payloads, weights
+
+
+@contextlib.asynccontextmanager
+async def _client(url: Optional[str], timeout: float):
+    """Клиент к внешнему серверу или к src.main:app в этом процессе (со startup/shutdown)."""
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            yield client
+        return
+    from src.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            yield client
+
+
+async def run(
+    mix: List[Tuple[int, int]],
+    modes: List[str],
+    concurrency_levels: List[int],
+    endpoints: List[str],
+    requests: int,
+    url: Optional[str] = None,
+    pid: Optional[int] = None,
+    params: Optional[Dict[str, str]] = None,
+    to_thread_workers: Optional[int] = None,
+    sample_interval: float = 0.2,
+    timeout: float = 300.0,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    if to_thread_workers:
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=to_thread_workers, thread_name_prefix="to_thread")
+        )
+
+    from src.services import full_statement, http_cache
+
+    # Выписки смеси повторяются, и кэш тел ответов /parse-report отдавал бы их без разбора —
+    # режимы секций стали бы неразличимы. В процессе кэш выключаем; запущенный по --url сервер
+    # должен работать с PARSER_RESPONSE_CACHE_BYTES=0 (по умолчанию так и есть).
+    saved_cache_bytes = http_cache.RESPONSES.max_bytes
+    if not url:
+        http_cache.RESPONSES.max_bytes = 0
+    try:
+        with tempfile.TemporaryDirectory(prefix="vtb_loadtest_") as work_dir:
+            payloads, weights = build_payloads(mix, work_dir, seed)
+            report: List[Dict[str, Any]] = []
+            async with _client(url, timeout) as client:
+                for mode in modes:
+                    if not url:
+                        full_statement.SECTIONS_MODE = mode
+                    # прогрев: импорт openpyxl, запуск пулов секций в новом режиме
+                    name, _, content = payloads[0]
+                    await _request_parse(client, name, content, params or {})
+                    for endpoint in endpoints:
+                        for c in concurrency_levels:
+                            row = await run_scenario(
+                                client, payloads, weights, endpoint, c, requests,
+                                sample_interval=sample_interval, params=params, pid=pid, seed=seed,
+                            )
+                            row["mode"] = mode
+                            report.append(row)
+                            logger.warning(
+                                "mode=%s endpoint=%s c=%s: %.1f rps p95=%.0f ms",
+                                mode, endpoint, c, row["throughput_rps"], row["p95_ms"],
+                            )
+    finally:
+        http_cache.RESPONSES.max_bytes = saved_cache_bytes
+    return report
+
+
+def print_report(report: List[Dict[str, Any]], stream=sys.stdout) -> None:
+    header = (
+        f"{'режим':<8} {'эндпоинт':<8} {'C':>4} {'ok':>6} {'ошибки':>7} {'rps':>8} "
+        f"{'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'RSS пик':>8} {'MiB/запр':>9}"
+    )
+    print(header, file=stream)
+    print("-" * len(header), file=stream)
+    for row in report:
+        errors = row["requests"] - row["ok"]
+        rss = f"{row['rss_peak_mib']:.0f}" if row["rss_peak_mib"] is not None else "-"
+        per = f"{row['rss_per_inflight_mib']:.1f}" if row["rss_per_inflight_mib"] is not None else "-"
+        print(
+            f"{row['mode']:<8} {row['endpoint']:<8} {row['concurrency']:>4} {row['ok']:>6} {errors:>7} "
+            f"{row['throughput_rps']:>8.2f} {row['p50_ms']:>9.0f} {row['p95_ms']:>9.0f} {row['p99_ms']:>9.0f} "
+            f"{rss:>8} {per:>9}",
+            file=stream,
+        )
+    for row in report:
+        print(f"\n{row['mode']} {row['endpoint']} C={row['concurrency']} статусы={row['statuses']}", file=stream)
+        peak = max(row["histogram_ms"].values()) or 1
+        for bucket, n in row["histogram_ms"].items():
+            if n:
+                print(f"  {bucket:>8} ms {n:>6} {'#' * max(1, round(40 * n / peak))}", file=stream)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон сервиса разбора выписок")
+    ap.add_argument("--url", help="адрес запущенного сервера; по умолчанию — src.main:app в этом процессе")
+    ap.add_argument("--pid", type=int, help="PID сервера для замера RSS при --url")
+    ap.add_argument("--mix", default="100:5,1000:2,5000:1", help="размеры выписок и веса: размер:вес,...")
+    ap.add_argument("--modes", default="serial", help="режимы секций через запятую (serial,thread,process)")
+    ap.add_argument("--concurrency", default="1,4,16", help="уровни параллелизма через запятую")
+    ap.add_argument("--endpoint", action="append", choices=("parse", "jobs"), help="parse и/или jobs (можно оба)")
+    ap.add_argument("--requests", type=int, default=50, help="запросов на сценарий")
+    ap.add_argument("--param", action="append", default=[], help="query-параметр /parse-report: key=value")
+    ap.add_argument("--to-thread-workers", type=int, help="размер пула asyncio.to_thread в процессе")
+    ap.add_argument("--sample-interval", type=float, default=0.2, help="шаг замера RSS, с")
+    ap.add_argument("--timeout", type=float, default=300.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", dest="json_path", help="сохранить отчёт (с гистограммами и RSS во времени) в JSON")
+    args = ap.parse_args(argv)
+
+    if logger.level < logging.WARNING:
+        logger.setLevel(logging.WARNING)
+
+    modes = ["server"] if args.url else [m for m in args.modes.split(",") if m]
+    params = dict(p.split("=", 1) for p in args.param)
+    report = asyncio.run(run(
+        parse_mix(args.mix),
+        modes,
+        [int(c) for c in args.concurrency.split(",") if c],
+        args.endpoint or ["parse"],
+        args.requests,
+        url=args.url,
+        pid=args.pid,
+        params=params,
+        to_thread_workers=args.to_thread_workers,
+        sample_interval=args.sample_interval,
+        timeout=args.timeout,
+        seed=args.seed,
+    ))
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=2)
+    return 1 if any(row["ok"] < row["requests"] for row in report) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
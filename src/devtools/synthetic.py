@@ -0,0 +1,129 @@
+# src/devtools/synthetic.py
+"""
+Генератор синтетических выписок ВТБ в формате, который понимают парсеры:
+шапка (период, соглашение, № субсчета), секция "Движение денежных средств"
+и блок завершённых сделок с ценными бумагами.
+
+В данных намеренно встречаются пограничные случаи: частичные погашения, отрицательные
+купоны, перераспределение дохода, skip-list, неизвестные операции, пустой тип с комментарием,
+строки "Итого" внутри сделок, перенос ISIN на следующие строки и несколько колонок комиссий.
+
+    python -m src.devtools.synthetic out/ --sizes 100,1000,10000
+"""
+from __future__ import annotations
+import argparse
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+import pandas as pd
+
+WIDTH = 10
+
+# (тип операции, знак суммы, комментарий)
+FIN_TEMPLATES: List[Tuple[str, int, str]] = [
+    ("Купонный доход", 1, "Выплата купона ОФЗ 26238 SU26238RMFS4"),
+    ("Купонный доход", -1, "Корректировка купона 4B02-01-00214-A"),
+    ("Дивиденды", 1, "Дивиденды ПАО Сбербанк RU0009029540"),
+    ("Вознаграждение Брокера", -1, ""),
+    ("Вознаграждение компании", 1, "Возврат комиссии"),
+    ("НДФЛ", -1, ""),
+    ("НДФЛ", 1, "Возврат налога"),
+    ("Погашение ценных бумаг", 1, "Частичное погашение номинала облигации 4B02-01-00214-A"),
+    ("Погашение ценных бумаг", 1, "Погашение SU26238RMFS4"),
+    ("Перераспределение дохода", 1, ""),
+    ("Зачисление денежных средств", 1, ""),
+    ("Перевод денежных средств", -1, ""),
+    ("Вывод ДС", -1, ""),
+    ("Покупка/Продажа", -1, ""),
+    ("Сальдо расчетов по сделкам", 1, ""),
+    ("Неизвестная операция", 1, ""),
+    ("", 1, "Операция без типа"),
+]
+
+INSTRUMENTS = [
+    "ОФЗ 26238, SU26238RMFS4, 26238RMFS",
+    "Сбербанк ао, 10301481B, RU0009029540",
+    "ВТБ ао, 10401000B, RU000A0JP5V6",
+    "Сегежа 002P-01, 4B02-01-00214-A, RU000A101QW2",
+]
+
+CURRENCIES = ["RUB", "RUR", "USD", "CNY"]
+
+
+def build_statement_frame(n_fin: int, n_trades: int, seed: int = 0) -> pd.DataFrame:
+    rnd = random.Random(seed)
+    rows: List[list] = []
+
+    def r(*cells) -> None:
+        rows.append(list(cells) + [""] * (WIDTH - len(cells)))
+
+    start = datetime(2024, 1, 1)
+    r("Отчет брокера за период с 01.01.2024 по 31.12.2024")
+    r("Генеральное соглашение о предоставлении услуг на финансовых рынках", "15.03.2020")
+    r(f"№ субсчета: {rnd.randint(10000, 99999)}-{rnd.randint(100, 999)}")
+    r()
+    r("Движение денежных средств")
+    r("Дата", "Сумма", "Валюта", "Тип операции", "Комментарий")
+    for i in range(n_fin):
+        op, sign, comment = rnd.choice(FIN_TEMPLATES)
+        day = start + timedelta(days=(i * 365) // max(n_fin, 1))
+        r(day.strftime("%d.%m.%Y"), sign * round(rnd.uniform(1, 50000), 2), rnd.choice(CURRENCIES), op, comment)
+    r("Итого", "")
+    r()
+    r("Завершенные в отчетном периоде сделки с ценными бумагами (обязательства прекращены)")
+    r(
+        "Наименование ценной бумаги, № гос. регистрации, ISIN", "Дата и время заключения", "Вид сделки",
+        "Количество, шт", "Цена", "Валюта расчетов", "Сумма сделки", "НКД", "Комиссия банка", "Комиссия биржи",
+    )
+    for i in range(n_trades):
+        ts = start + timedelta(minutes=(i * 525600) // max(n_trades, 1))
+        qty = rnd.randint(1, 500)
+        price = round(rnd.uniform(80, 120), 2)
+        r(
+            rnd.choice(INSTRUMENTS) if i % 4 == 0 else "",
+            ts.strftime("%d.%m.%Y %H:%M:%S"),
+            rnd.choice(["Покупка", "Продажа"]),
+            qty,
+            price,
+            rnd.choice(CURRENCIES[:2]),
+            round(qty * price * 10, 2),
+            round(rnd.uniform(0, 50), 2),
+            round(rnd.uniform(0, 20), 2),
+            round(rnd.uniform(0, 2), 2),
+        )
+        if i % 97 == 96:
+            r("Итого по инструменту", "", "", "", "", "", 0)
+    r()
+    r("Незавершенные в отчетном периоде сделки с ценными бумагами")
+    return pd.DataFrame(rows)
+
+
+def write_statement(path: str, n_fin: int, n_trades: int, seed: int = 0) -> str:
+    build_statement_frame(n_fin, n_trades, seed).to_excel(path, header=False, index=False)
+    return path
+
+
+def generate_corpus(out_dir: str, sizes: List[int], seed: int = 0) -> List[str]:
+    """По одной выписке на размер: size финансовых операций и size сделок."""
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    return [
+        write_statement(str(Path(out_dir) / f"synthetic_{n}.xlsx"), n, n, seed + k)
+        for k, n in enumerate(sizes)
+    ]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Генерация синтетических выписок ВТБ")
+    ap.add_argument("output", help="каталог для xlsx")
+    ap.add_argument("--sizes", default="100,1000", help="размеры через запятую (строк в каждой секции)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    for path in generate_corpus(args.output, [int(x) for x in args.sizes.split(",") if x], args.seed):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
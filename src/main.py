@@ -1,15 +1,25 @@
 # src/main.py
+import hashlib
 import tempfile
 from pathlib import Path
 import asyncio
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ConfigDict
 from starlette.middleware.cors import CORSMiddleware
 
-from src.services.full_statement import parse_full_statement
+from src.constants import norm_cache_info
+from src.services.full_statement import parse_full_statement, parse_full_statement_arrow, reclassify_statement
+from src.parsers.filters import StatementFilter
+from src.parsers.layout_cache import layout_stats
+from src.services import columnar, http_cache, workbook_cache
+from src.services.instrument_index import INSTRUMENTS
+from src.services.admission import AdmissionController, AdmissionRejected
+from src.services.jobs import JOB_DONE, JOB_FAILED, JobManager, JobQueueFull
 from src.utils import logger
+from typing import Any, Dict, List, Optional
 
 
 app = FastAPI(title="VTB Statement Parser API", version="1.0")
@@ -21,28 +31,195 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+jobs = JobManager.from_env()
+admission = AdmissionController.from_env()
+
+
+@app.on_event("startup")
+async def _start_jobs():
+    await jobs.start()
+    # отпечаток исходников для ETag читает весь пакет — один раз и не на event loop
+    await asyncio.to_thread(http_cache.parser_version)
+
+
+@app.on_event("shutdown")
+async def _stop_jobs():
+    await jobs.stop()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "admission": admission.snapshot(),
+        "jobs": {"queue_depth": jobs.queue_depth, "queue_size": jobs.queue_size, "workers": jobs.workers},
+        "grid_cache": workbook_cache.cache_stats(),
+        "layout_cache": layout_stats(),
+        "norm_cache": norm_cache_info(),
+        "response_cache": http_cache.RESPONSES.stats(),
+        "instrument_index": INSTRUMENTS.stats(),
+    }
+
+
+def _upload_size(request: Request, file: UploadFile) -> int:
+    size = getattr(file, "size", None)
+    if size is None:
+        try:
+            size = int(request.headers.get("content-length", 0))
+        except ValueError:
+            size = 0
+    return size or 0
+
+
+def _parse_columnar(
+    file_path: str,
+    output_format: str,
+    filename: str,
+    order: str = "source",
+    statement_filter: Optional[StatementFilter] = None,
+    enrich: bool = False,
+) -> Response:
+    """Парсинг + сериализация в Arrow IPC / Parquet целиком вне event loop."""
+    table = parse_full_statement_arrow(
+        file_path, order=order, statement_filter=statement_filter, enrich_instruments=enrich
+    )
+    meta = columnar.statement_metadata(table)
+    logger.info("%s Аккаунт: %s, операций: %s (format=%s)", filename, meta.get("account_id"), table.num_rows, output_format)
+    if output_format == "parquet":
+        return Response(content=columnar.table_to_parquet_bytes(table), media_type=columnar.PARQUET_MEDIA_TYPE)
+    return Response(content=columnar.table_to_ipc_bytes(table), media_type=columnar.ARROW_STREAM_MEDIA_TYPE)
+
+
 @app.post("/parse-report", response_class=JSONResponse)
-async def parse_report(file: UploadFile = File(...)):
+async def parse_report(
+    request: Request,
+    file: UploadFile = File(...),
+    output_format: str = Query("json", alias="format", pattern="^(json|arrow|parquet)$"),
+    include_raw: bool = Query(False, description="добавить raw_fin_rows для /reclassify"),
+    order: str = Query("source", pattern="^(source|date|date_desc)$", description="порядок операций"),
+    portfolio: bool = Query(False, description="добавить позиции и остатки по валютам на date_end"),
+    date_from: Optional[str] = Query(None, description="операции не раньше даты (dd.mm.yyyy или ISO)"),
+    date_to: Optional[str] = Query(None, description="операции не позже даты включительно"),
+    operation_types: Optional[str] = Query(None, description="типы операций через запятую: buy,sale,coupon,..."),
+    sections: Optional[str] = Query(None, description="секции через запятую: fin,trades"),
+    enrich: bool = Query(False, description="дозаполнить isin/reg_number/ticker из справочника инструментов"),
+):
     filename = Path(file.filename).name if file.filename else "uploaded.xlsx"
     logger.info("Получен файл: %s (content_type=%s)", filename, file.content_type)
 
+    try:
+        statement_filter = StatementFilter.build(date_from, date_to, operation_types, sections)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    try:
+        async with admission.admit(_upload_size(request, file)):
+            return await _parse_report(
+                request, file, filename, output_format, include_raw, order, portfolio, statement_filter, enrich
+            )
+    except AdmissionRejected as e:
+        logger.warning("Запрос %s отклонён (%s): %s", filename, e.status_code, e.reason)
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers=headers)
+
+
+def _encoded_item(body: bytes, media_type: str, encoding: Optional[str]) -> http_cache.CachedBody:
+    data, content_encoding = http_cache.encode_body(body, encoding)
+    return data, media_type, content_encoding
+
+
+def _render_json(result: Dict[str, Any], encoding: Optional[str]) -> http_cache.CachedBody:
+    """Сериализация и сжатие JSON-ответа (вызывается вне event loop)."""
+    body = JSONResponse(content=jsonable_encoder(result)).body
+    return _encoded_item(body, "application/json", encoding)
+
+
+def _cached_response(item: http_cache.CachedBody, etag: Optional[str]) -> Response:
+    body, media_type, content_encoding = item
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+async def _parse_report(
+    request: Request,
+    file: UploadFile,
+    filename: str,
+    output_format: str,
+    include_raw: bool = False,
+    order: str = "source",
+    portfolio: bool = False,
+    statement_filter: Optional[StatementFilter] = None,
+    enrich: bool = False,
+):
+    content = await file.read()
+    params = {
+        "format": output_format,
+        "include_raw": include_raw,
+        "order": order,
+        "portfolio": portfolio,
+        "filter": statement_filter.as_dict() if statement_filter else None,
+    }
+    # Обогащённый ответ зависит от справочника инструментов, который меняется между запросами
+    # (и в других процессах), — такой ответ не получает ETag и не кэшируется.
+    etag: Optional[str] = None
+    if not enrich:
+        etag = await asyncio.to_thread(lambda: http_cache.make_etag(hashlib.sha256(content).hexdigest(), params))
+        if http_cache.etag_matches(request.headers.get("if-none-match"), etag):
+            http_cache.RESPONSES.note_not_modified()
+            logger.info("%s не изменился (ETag %s)", filename, etag)
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+
+    # Parquet уже сжат внутри файла — повторно не сжимаем
+    encoding = None if output_format == "parquet" else http_cache.negotiate_encoding(request.headers.get("accept-encoding"))
+    cached = http_cache.RESPONSES.get(etag, encoding) if etag else None
+    if cached is None and etag and encoding is not None:
+        plain = http_cache.RESPONSES.get(etag, None)
+        if plain is not None:
+            cached = await asyncio.to_thread(_encoded_item, plain[0], plain[1], encoding)
+            http_cache.RESPONSES.put(etag, encoding, cached)
+    if cached is not None:
+        logger.info("%s: ответ из кэша (ETag %s)", filename, etag)
+        return _cached_response(cached, etag)
+
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as tmp:
             tmp_path = Path(tmp.name)
-            content = await file.read()
             tmp.write(content)
             tmp.flush()
     except Exception as e:
         logger.exception("Ошибка сохранения загруженного файла: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Не удалось сохранить файл")
 
+    if output_format != "json" and columnar.pa is None:
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="pyarrow не установлен")
+
     try:
-        result = await asyncio.to_thread(parse_full_statement, str(tmp_path))
+        if output_format != "json":
+            resp = await asyncio.to_thread(
+                _parse_columnar, str(tmp_path), output_format, filename, order, statement_filter, enrich
+            )
+            item = await asyncio.to_thread(_encoded_item, resp.body, resp.media_type, encoding)
+            if etag:
+                http_cache.RESPONSES.put(etag, encoding, item)
+            return _cached_response(item, etag)
+        result = await asyncio.to_thread(
+            parse_full_statement,
+            str(tmp_path),
+            include_raw=include_raw,
+            order=order,
+            portfolio=portfolio,
+            statement_filter=statement_filter,
+            enrich_instruments=enrich,
+        )
     except Exception as e:
         logger.exception("Ошибка парсинга: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Ошибка парсинга: {e}")
@@ -71,5 +248,78 @@ async def parse_report(file: UploadFile = File(...)):
         (": " + ", ".join(unknown_fin_ops) if unknown_fin_ops else ""),
     )
 
-    return JSONResponse(content=jsonable_encoder(result))
+    item = await asyncio.to_thread(_render_json, result, encoding)
+    if etag:
+        http_cache.RESPONSES.put(etag, encoding, item)
+    return _cached_response(item, etag)
+
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(file: UploadFile = File(...)):
+    filename = Path(file.filename).name if file.filename else "uploaded.xlsx"
+    try:
+        # заполненная очередь отклоняет задачу до чтения загрузки в память
+        if jobs.is_full:
+            raise JobQueueFull(f"Очередь заполнена ({jobs.queue_size})")
+        content = await file.read()
+        job = await jobs.submit(filename, content)
+    except JobQueueFull as e:
+        logger.warning("Отказ в постановке задачи %s: %s", filename, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"},
+        )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result",
+        "queue_depth": jobs.queue_depth,
+    }
+
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    return job.to_status()
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Ошибка парсинга: {job.error}")
+    if job.status != JOB_DONE:
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job.to_status())
+    return JSONResponse(content=jsonable_encoder(job.result))
+
+
+class ReclassifyRules(BaseModel):
+    """Подмены наборов правил классификации (см. fin_operations.build_fin_rules)."""
+    model_config = ConfigDict(extra="forbid")
+
+    valid_operations: Optional[List[str]] = None
+    skip_operations: Optional[List[str]] = None
+    operation_type_map: Optional[Dict[str, str]] = None
+
+
+class ReclassifyRequest(BaseModel):
+    rows: List[Dict[str, Any]]
+    rules: Optional[ReclassifyRules] = None
+
+
+@app.post("/reclassify")
+async def reclassify(req: ReclassifyRequest):
+    try:
+        rules = req.rules.model_dump(exclude_none=True) if req.rules is not None else None
+        result = await asyncio.to_thread(reclassify_statement, req.rows, rules)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except (KeyError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Некорректные сырые строки: {e}")
+    return JSONResponse(content=jsonable_encoder(result))
@@ -0,0 +1,107 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, time
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Union
+
+from src.utils import parse_datetime
+
+SECTIONS = ("fin", "trades")
+TRADE_OPERATION_TYPES = frozenset({"buy", "sale"})
+
+
+def parse_date_bound(value: Any, end_of_day: bool = False) -> Optional[datetime]:
+    """
+    Граница периода: datetime или строка ('31.12.2024', '2024-12-31', ISO).
+    end_of_day=True — дата без времени означает конец дня (граница включительно).
+    Даты выписки не содержат часового пояса, поэтому граница с поясом ('…+03:00', '…Z')
+    отклоняется — пересчитать её в местное время выписки нельзя.
+    """
+    if value is None or value == "":
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        raise ValueError(f"Некорректная дата: {value!r}")
+    if dt.tzinfo is not None:
+        raise ValueError(f"Дата с часовым поясом не поддерживается (даты выписки без пояса): {value!r}")
+    if end_of_day and dt.time() == time(0) and not (isinstance(value, str) and ":" in value):
+        dt = datetime.combine(dt.date(), time.max)
+    return dt
+
+
+def _as_set(values: Union[None, str, Iterable[str]]) -> Optional[FrozenSet[str]]:
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = values.split(",")
+    items = frozenset(v.strip() for v in values if v and v.strip())
+    return items or None
+
+
+@dataclass(frozen=True)
+class StatementFilter:
+    """
+    Отбор операций, проталкиваемый в парсеры секций: строки вне периода отбрасываются
+    сразу после разбора даты, неподходящего типа — до создания OperationDTO,
+    а ненужные секции не сканируются вовсе. None в поле — без ограничения.
+    """
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None  # включительно
+    operation_types: Optional[FrozenSet[str]] = None
+    sections: Optional[FrozenSet[str]] = None
+
+    @classmethod
+    def build(
+        cls,
+        date_from: Any = None,
+        date_to: Any = None,
+        operation_types: Union[None, str, Iterable[str]] = None,
+        sections: Union[None, str, Iterable[str]] = None,
+    ) -> Optional["StatementFilter"]:
+        """Из параметров запроса/CLI; строки списков — через запятую. Пустой фильтр -> None."""
+        sections_set = _as_set(sections)
+        unknown = sections_set - set(SECTIONS) if sections_set else set()
+        if unknown:
+            raise ValueError(f"Неизвестные секции: {', '.join(sorted(unknown))}; допустимые: {', '.join(SECTIONS)}")
+        flt = cls(
+            date_from=parse_date_bound(date_from),
+            date_to=parse_date_bound(date_to, end_of_day=True),
+            operation_types=_as_set(operation_types),
+            sections=sections_set,
+        )
+        if flt.date_from and flt.date_to and flt.date_from > flt.date_to:
+            raise ValueError("date_from позже date_to")
+        return None if flt.is_empty() else flt
+
+    def is_empty(self) -> bool:
+        return self.date_from is None and self.date_to is None and not self.operation_types and not self.sections
+
+    def wants_section(self, name: str) -> bool:
+        if self.sections is not None and name not in self.sections:
+            return False
+        if self.operation_types is not None:
+            if name == "trades":
+                return bool(self.operation_types & TRADE_OPERATION_TYPES)
+            if name == "fin":
+                return bool(self.operation_types - TRADE_OPERATION_TYPES)
+        return True
+
+    def accepts_date(self, value: Any) -> bool:
+        if self.date_from is None and self.date_to is None:
+            return True
+        dt = parse_datetime(value)
+        if dt is None:
+            return False
+        if self.date_from is not None and dt < self.date_from:
+            return False
+        return self.date_to is None or dt <= self.date_to
+
+    def accepts_type(self, operation_type: str) -> bool:
+        return self.operation_types is None or operation_type in self.operation_types
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "date_from": self.date_from.isoformat() if self.date_from else None,
+            "date_to": self.date_to.isoformat() if self.date_to else None,
+            "operation_types": sorted(self.operation_types) if self.operation_types else None,
+            "sections": sorted(self.sections) if self.sections else None,
+        }
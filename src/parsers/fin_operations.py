@@ -1,15 +1,25 @@
 from __future__ import annotations
-from typing import Any, List, Optional, Dict, Tuple
+from functools import lru_cache
+from typing import Any, List, Optional, Dict, Tuple, Union
 import re
 import pandas as pd
 
-from src.utils import logger, extract_date, to_int_safe, to_num_safe
+import logging
+
+from src.utils import RowEventLog, logger, extract_date, to_int_safe, to_num_safe
 from src.OperationDTO import OperationDTO
+from src.parsers.filters import StatementFilter
+from src.parsers.layout_cache import LAYOUTS
+from src.parsers.row_flags import contains_any, first_true, section_flags
+from src.parsers.sheet import read_sheet
 import src.constants
 
 ISIN_RE = re.compile(r"\b[A-Z]{2}[A-Z0-9]{9}\d\b", re.IGNORECASE)
 AMORT_RE = re.compile(r"(част\w{0,6}).*(погаш\w{0,6}).*(номин|номинал|обл)", re.IGNORECASE)
 
+REG_LONG_RE = re.compile(r"\b[0-9A-ZА-Я]{1,6}[-/][0-9A-ZА-Я\-\/]{3,}[0-9A-ZА-Я]?\b", re.IGNORECASE)
+REG_SHORT_RE = re.compile(r"\b[КK]\d{3,8}\b", re.IGNORECASE)
+
 SECTION_RE_1 = re.compile(r"движен\w* денежн\w* средств", re.IGNORECASE)
 
 
@@ -67,18 +77,22 @@ def map_header_indices(header_row) -> Dict[str, int]:
     return cols
 
 
+def _fin_key_rows(df: pd.DataFrame, header_idx: int) -> List[int]:
+    return [header_idx]
+
+
 def extract_isin_and_reg(comment: str) -> Tuple[Optional[str], Optional[str]]:
-    """Возвращает (isin, reg_number), если найдены в комментарии."""
+    """Возвращает (isin, reg_number), если найдены в комментарии (разбор кэшируется по тексту)."""
     if not comment:
         return None, None
-    c = str(comment)
+    return _extract_isin_and_reg(str(comment))
 
+
+@lru_cache(maxsize=16384)
+def _extract_isin_and_reg(c: str) -> Tuple[Optional[str], Optional[str]]:
     m_isin = ISIN_RE.search(c)
     isin = m_isin.group(0).upper() if m_isin else None
 
-    REG_LONG_RE = re.compile(r"\b[0-9A-ZА-Я]{1,6}[-/][0-9A-ZА-Я\-\/]{3,}[0-9A-ZА-Я]?\b", re.IGNORECASE)
-    REG_SHORT_RE = re.compile(r"\b[КK]\d{3,8}\b", re.IGNORECASE)
-
     m_reg_long = REG_LONG_RE.search(c)
     reg = m_reg_long.group(0) if m_reg_long else None
     if not reg:
@@ -89,17 +103,8 @@ def extract_isin_and_reg(comment: str) -> Tuple[Optional[str], Optional[str]]:
     return isin, reg
 
 
-def parse_fin_operations(file_path: str) -> tuple[List[OperationDTO], dict]:
-    logger.info("Парсим финансовые операции из %s", file_path)
-    try:
-        df = pd.read_excel(file_path, header=None, dtype=object)
-    except Exception as e:
-        logger.error("Не удалось прочитать Excel %s: %s", file_path, e)
-        return [], {"error": str(e)}
-
-    df = df.fillna("")
-
-    stats = {
+def _new_fin_stats() -> dict:
+    return {
         "total_rows": 0,
         "parsed": 0,
         "skipped_section_not_found": 0,
@@ -115,12 +120,261 @@ def parse_fin_operations(file_path: str) -> tuple[List[OperationDTO], dict]:
         "reallocations_positive": 0,
     }
 
+
+RULE_OVERRIDE_KEYS = ("valid_operations", "skip_operations", "operation_type_map")
+
+
+def _check_rule_overrides(overrides: Dict[str, Any]) -> None:
+    """ValueError для подмен неверного вида: строка вместо списка иначе разошлась бы по символам."""
+    unknown = set(overrides) - set(RULE_OVERRIDE_KEYS)
+    if unknown:
+        raise ValueError(f"Неизвестные правила: {', '.join(sorted(map(str, unknown)))}")
+    for key in ("valid_operations", "skip_operations"):
+        names = overrides.get(key)
+        if names is None:
+            continue
+        if not isinstance(names, (list, tuple, set, frozenset)) or not all(isinstance(x, str) for x in names):
+            raise ValueError(f"{key}: ожидается список названий операций")
+    op_map = overrides.get("operation_type_map")
+    if op_map is not None and (
+        not isinstance(op_map, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in op_map.items())
+    ):
+        raise ValueError("operation_type_map: ожидается словарь название -> тип операции")
+
+
+def build_fin_rules(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Нормализованные правила классификации из src.constants (читаются в момент вызова).
+    overrides позволяет подменить наборы без правки модуля:
+      "valid_operations", "skip_operations" — списки названий (заменяют VALID/SKIP_OPERATIONS)
+      "operation_type_map" — словарь название -> тип (заменяет OPERATION_TYPE_MAP)
+    Подмены другого вида или с другими ключами — ValueError.
+    """
+    overrides = {k: v for k, v in (overrides or {}).items() if v is not None}
+    _check_rule_overrides(overrides)
     _norm = getattr(src.constants, "norm_str", lambda x: str(x).strip().lower() if x else "")
-    normalized_skip = { _norm(x) for x in getattr(src.constants, "SKIP_OPERATIONS", set()) }
-    normalized_valid = { _norm(x) for x in getattr(src.constants, "VALID_OPERATIONS", set()) }
-    normalized_op_map = { _norm(k): v for k, v in getattr(src.constants, "OPERATION_TYPE_MAP", {}).items() }
+    skip = overrides.get("skip_operations", getattr(src.constants, "SKIP_OPERATIONS", set()))
+    valid = overrides.get("valid_operations", getattr(src.constants, "VALID_OPERATIONS", set()))
+    op_map = overrides.get("operation_type_map", getattr(src.constants, "OPERATION_TYPE_MAP", {}))
     special_handlers = getattr(src.constants, "SPECIAL_OPERATION_HANDLERS", {})
-    normalized_special_map = { _norm(k): k for k in special_handlers.keys() }
+    return {
+        "norm": _norm,
+        "skip": {_norm(x) for x in skip},
+        "valid": {_norm(x) for x in valid},
+        "op_map": {_norm(k): v for k, v in op_map.items()},
+        "special_handlers": special_handlers,
+        "special_map": {_norm(k): k for k in special_handlers.keys()},
+    }
+
+
+def classify_fin_row(
+    raw: Dict[str, Any], stats: dict, rules: Dict[str, Any], row_log: Optional[RowEventLog] = None
+) -> Optional[str]:
+    """
+    Определяет operation_type для извлечённой сырой строки (см. parse_fin_operations).
+    Возвращает None, если строку надо пропустить; счётчики пропусков пишутся в stats.
+    row_log ограничивает построчные сообщения (по умолчанию — отдельный лог на вызов).
+    """
+    row_log = row_log or RowEventLog("fin")
+    i = raw.get("row")
+    op_raw_s = raw["raw_type"]
+    comment = raw["comment"]
+    payment_sum = raw["sum"]
+    date_val = raw["date"]
+
+    if not op_raw_s:
+        if comment:
+            stats["skipped_skiplist"] += 1
+            stats["unrecognized_names"].append(comment)
+            row_log.event("no_type", logging.WARNING, "Пропускаем неизвестную операцию (не найден type) — %s (row=%s)", comment, i)
+        return None
+
+    _norm = rules["norm"]
+    normalized_skip = rules["skip"]
+    normalized_valid = rules["valid"]
+    normalized_op_map = rules["op_map"]
+    special_handlers = rules["special_handlers"]
+    normalized_special_map = rules["special_map"]
+
+    op_low = _norm(op_raw_s)
+
+    # --- important: declare op_type early (do not reset later) ---
+    op_type: Optional[str] = None
+
+    # --- Погашение ценных бумаг ---
+    # Комментарий используется ТОЛЬКО в этой ветке для детекции амортизации
+    if "погаш" in op_low:
+        if payment_sum is None:
+            pass
+        elif payment_sum < 0:
+            op_type = "withdrawal"
+        elif payment_sum > 0:
+            # используем регулярку для устойчивой детекции частичного погашения номинала облигации
+            if AMORT_RE.search(comment):
+                op_type = "amortization"
+                stats["amortizations"] = stats.get("amortizations", 0) + 1
+            else:
+                op_type = "repayment"
+                stats["repayments"] = stats.get("repayments", 0) + 1
+
+    # --- Перераспределение дохода между субсчетами / площадками ---
+    # Приоритетнее купона; опираемся ТОЛЬКО на op_low (не на comment)
+    elif any(k in op_low for k in ("перераспредел", "перераспред", "распределение между")):
+        if payment_sum is None:
+            pass
+        elif payment_sum < 0:
+            op_type = "withdrawal"
+        elif payment_sum > 0:
+            stats["reallocations_positive"] = stats.get("reallocations_positive", 0) + 1
+            row_log.event(
+                "reallocation_positive", logging.WARNING,
+                "Positive redistribution detected (row=%s raw=%s comment=%s sum=%s) — logged as internal_transfer",
+                i, op_raw_s, comment, payment_sum
+            )
+            op_type = "internal_transfer"
+
+    # --- Купонный доход ---
+    # Смотрим ТОЛЬКО op_low (не comment). Поведение: отрицательный -> withdrawal, положительный -> coupon
+    elif any(k in op_low for k in ("купон", "купонный", "куп")):
+        if payment_sum is None:
+            pass
+        elif payment_sum < 0:
+            op_type = "withdrawal"
+            stats["coupon_negative_converted"] = stats.get("coupon_negative_converted", 0) + 1
+            row_log.event(
+                "coupon_negative", logging.DEBUG,
+                "Negative coupon converted to withdrawal (row=%s sum=%s comment=%s)", i, payment_sum, comment
+            )
+        elif payment_sum > 0:
+            op_type = "coupon"
+            stats["coupon_positive"] = stats.get("coupon_positive", 0) + 1
+
+    # --- Пропуски по skiplist ---
+    if op_low in normalized_skip or any(sk in op_low for sk in normalized_skip):
+        stats["skipped_skiplist"] += 1
+        row_log.event("skiplist", logging.DEBUG, "Пропускаем по skiplist: %s (row=%s)", op_raw_s, i)
+        return None
+
+    # --- Специальные хендлеры (не перезаписываем если op_type уже установлен) ---
+    for norm_k, orig_k in normalized_special_map.items():
+        if norm_k in op_low and not op_type:
+            handler = special_handlers.get(orig_k)
+            if callable(handler):
+                entry = {"date": date_val, "raw_type": op_raw_s, "sum": payment_sum, "comment": comment}
+                try:
+                    op_type = handler(payment_sum, entry)
+                except Exception:
+                    op_type = None
+            break
+
+    # --- Стандартная маппинг-таблица ---
+    if not op_type and op_low in normalized_op_map:
+        op_type = normalized_op_map[op_low]
+
+    if not op_type:
+        for k_norm, v in normalized_op_map.items():
+            if k_norm in op_low:
+                op_type = v
+                break
+
+    # --- Если всё ещё нет op_type, пытаемся по sign/known names ---
+    if not op_type:
+        looks_like_known = False
+        if op_low in normalized_valid:
+            looks_like_known = True
+        elif any(k in op_low for k in normalized_op_map.keys()):
+            looks_like_known = True
+
+        if looks_like_known:
+            sign = src.constants.get_sign(payment_sum)
+            if sign < 0:
+                op_type = "withdrawal"
+            elif sign > 0:
+                op_type = "deposit"
+            else:
+                stats["skipped_zero_unknown"] += 1
+                row_log.event("zero_unknown", logging.DEBUG, "Пропуск: сумма нулевая и raw неизвестен (row=%s)", i)
+                return None
+        else:
+            stats["skipped_skiplist"] += 1
+            stats["unrecognized_names"].append(op_raw_s)
+            row_log.event("unknown_raw", logging.WARNING, "Пропускаем неизвестный raw: %s (row=%s)", op_raw_s, i)
+            return None
+
+    return op_type
+
+
+def _fin_dto(raw: Dict[str, Any], op_type: str) -> OperationDTO:
+    return OperationDTO(
+        date=raw["date"],
+        operation_type=op_type,
+        payment_sum=raw["sum"],
+        currency=raw["currency"],
+        ticker=raw.get("ticker", ""),
+        isin=raw.get("isin", ""),
+        reg_number=raw.get("reg_number", ""),
+        price=raw.get("price", 0.0),
+        quantity=raw.get("quantity", 0),
+        aci=raw.get("aci", 0.0),
+        comment=raw["comment"],
+        operation_id=raw.get("operation_id", ""),
+    )
+
+
+def reclassify_fin_operations(
+    raw_rows: List[Dict[str, Any]],
+    rules: Optional[Dict[str, Any]] = None,
+) -> tuple[List[OperationDTO], dict]:
+    """
+    Повторная классификация сохранённых сырых строк (parse_fin_operations(..., keep_raw=True))
+    по текущим правилам src.constants или по overrides (см. build_fin_rules) — без чтения Excel.
+    """
+    rules_n = build_fin_rules(rules)
+    row_log = RowEventLog("fin:reclassify")
+    stats = _new_fin_stats()
+    stats["total_rows"] = len(raw_rows)
+    ops: List[OperationDTO] = []
+    for raw in raw_rows:
+        op_type = classify_fin_row(raw, stats, rules_n, row_log)
+        if op_type is None:
+            continue
+        ops.append(_fin_dto(raw, op_type))
+        stats["parsed"] += 1
+    row_log.flush()
+    stats["log_events"] = row_log.as_dict()
+    stats["unrecognized_names"] = list(dict.fromkeys(stats["unrecognized_names"]))
+    return ops, stats
+
+
+def parse_fin_operations(
+    file_path: Union[str, pd.DataFrame],
+    keep_raw: bool = False,
+    statement_filter: Optional[StatementFilter] = None,
+) -> tuple[List[OperationDTO], dict]:
+    """
+    keep_raw=True сохраняет извлечённые сырые строки в stats["raw_rows"]
+    для последующей reclassify_fin_operations.
+    stats["log_events"] — счётчики построчных событий (RowEventLog), включая подавленные в логе.
+    statement_filter отбрасывает строки вне периода сразу после разбора даты,
+    а неподходящих типов — до создания OperationDTO (счётчик stats["skipped_filtered"]).
+    """
+    is_frame = isinstance(file_path, pd.DataFrame)
+    logger.info("Парсим финансовые операции из %s", "загруженной сетки" if is_frame else file_path)
+    try:
+        df = read_sheet(file_path)
+    except Exception as e:
+        logger.error("Не удалось прочитать Excel %s: %s", file_path, e)
+        return [], {"error": str(e)}
+
+    stats = _new_fin_stats()
+    rules = build_fin_rules()
+    row_log = RowEventLog("fin")
+    # сырой словарь строки — вход классификатора, а список копится только по запросу
+    raw_rows: Optional[List[Dict[str, Any]]] = [] if keep_raw else None
+    if raw_rows is not None:
+        stats["raw_rows"] = raw_rows
+    if statement_filter is not None:
+        stats["skipped_filtered"] = 0
 
     start_idx = find_section_start(df)
     if start_idx is None:
@@ -134,19 +388,24 @@ def parse_fin_operations(file_path: str) -> tuple[List[OperationDTO], dict]:
         stats["skipped_header_not_found"] = 1
         return [], stats
 
-    header_row = df.iloc[header_idx]
-    cols = map_header_indices(header_row)
+    layout = LAYOUTS.lookup("fin", df, header_idx, _fin_key_rows)
+    if layout is not None:
+        cols = layout["cols"]
+    else:
+        header_row = df.iloc[header_idx]
+        cols = map_header_indices(header_row)
+        LAYOUTS.store("fin", df, header_idx, _fin_key_rows, cols=cols)
     logger.debug("Обнаружены колонки: %s", cols)
 
+    # Конец секции (пустая строка или итоговое ключевое слово) ищем по признакам строк листа
+    flags = section_flags(df, header_idx + 1)
+    stop_pos = first_true(flags["text"].eq("") | contains_any(flags["text"], SECTION_END_KEYWORDS))
+    end_idx = len(df) if stop_pos is None else header_idx + 1 + stop_pos
+    stats["total_rows"] = (end_idx - header_idx - 1) + (0 if stop_pos is None else 1)
+
     ops: List[OperationDTO] = []
-    for i in range(header_idx + 1, len(df)):
-        stats["total_rows"] += 1
+    for i in range(header_idx + 1, end_idx):
         row = df.iloc[i]
-        cells = [str(c).strip() for c in row if str(c).strip()]
-        joined_low = " ".join(cells).lower()
-
-        if not cells or any(k in joined_low for k in SECTION_END_KEYWORDS):
-            break
 
         def g(col_key: str) -> Any:
             idx = cols.get(col_key)
@@ -155,21 +414,25 @@ def parse_fin_operations(file_path: str) -> tuple[List[OperationDTO], dict]:
         date_val = extract_date(g("date"))
         if not date_val:
             continue
+        if statement_filter is not None and not statement_filter.accepts_date(date_val):
+            stats["skipped_filtered"] += 1
+            continue
 
         op_raw = g("type")
         op_raw_s = str(op_raw).strip() if op_raw else ""
         if not op_raw_s:
             comment_tmp = str(g("comment") or "").strip()
             if comment_tmp:
-                stats["skipped_skiplist"] += 1
-                stats["unrecognized_names"].append(comment_tmp)
-                logger.warning("Пропускаем неизвестную операцию (не найден type) — %s (row=%s)", comment_tmp, i)
+                raw = {"row": i, "date": date_val, "raw_type": "", "sum": 0.0, "currency": "", "comment": comment_tmp}
+                if raw_rows is not None:
+                    raw_rows.append(raw)
+                classify_fin_row(raw, stats, rules, row_log)
             continue
 
         payment_sum = to_num_safe(g("sum"))
         currency_raw = g("currency")
         currency = str(currency_raw).strip() if currency_raw else ""
-        currency_normalized = src.constants.CURRENCY_DICT.get(currency.upper(), currency.upper() if currency else "")
+        currency_normalized = src.constants.normalize_currency(currency)
 
         comment = str(g("comment") or "").strip()
         ticker = str(g("ticker") or "").strip() if "ticker" in cols else ""
@@ -187,129 +450,36 @@ def parse_fin_operations(file_path: str) -> tuple[List[OperationDTO], dict]:
         if "reg_number" in cols:
             reg_number = str(g("reg_number") or reg_number or "").strip()
 
-        price = to_num_safe(g("price"))
-        quantity = to_int_safe(g("quantity"))
-        aci = to_num_safe(g("aci"))
-
-        op_low = _norm(op_raw_s)
-        c_norm = _norm(comment or "")
-
-        # --- important: declare op_type early (do not reset later) ---
-        op_type: Optional[str] = None
-
-        # --- Погашение ценных бумаг ---
-        # Комментарий используется ТОЛЬКО в этой ветке для детекции амортизации
-        if "погаш" in op_low:
-            if payment_sum is None:
-                pass
-            elif payment_sum < 0:
-                op_type = "withdrawal"
-            elif payment_sum > 0:
-                # используем регулярку для устойчивой детекции частичного погашения номинала облигации
-                if AMORT_RE.search(comment):
-                    op_type = "amortization"
-                    stats["amortizations"] = stats.get("amortizations", 0) + 1
-                else:
-                    op_type = "repayment"
-                    stats["repayments"] = stats.get("repayments", 0) + 1
-
-        # --- Перераспределение дохода между субсчетами / площадками ---
-        # Приоритетнее купона; опираемся ТОЛЬКО на op_low (не на comment)
-        elif any(k in op_low for k in ("перераспредел", "перераспред", "распределение между")):
-            if payment_sum is None:
-                pass
-            elif payment_sum < 0:
-                op_type = "withdrawal"
-            elif payment_sum > 0:
-                stats["reallocations_positive"] = stats.get("reallocations_positive", 0) + 1
-                logger.warning(
-                    "Positive redistribution detected (row=%s raw=%s comment=%s sum=%s) — logged as internal_transfer",
-                    i, op_raw_s, comment, payment_sum
-                )
-                op_type = "internal_transfer"
-
-        # --- Купонный доход ---
-        # Смотрим ТОЛЬКО op_low (не comment). Поведение: отрицательный -> withdrawal, положительный -> coupon
-        elif any(k in op_low for k in ("купон", "купонный", "куп")):
-            if payment_sum is None:
-                pass
-            elif payment_sum < 0:
-                op_type = "withdrawal"
-                stats["coupon_negative_converted"] = stats.get("coupon_negative_converted", 0) + 1
-                logger.debug("Negative coupon converted to withdrawal (row=%s sum=%s comment=%s)", i, payment_sum, comment)
-            elif payment_sum > 0:
-                op_type = "coupon"
-                stats["coupon_positive"] = stats.get("coupon_positive", 0) + 1
-
-        # --- Пропуски по skiplist ---
-        if op_low in normalized_skip or any(sk in op_low for sk in normalized_skip):
-            stats["skipped_skiplist"] += 1
-            logger.debug("Пропускаем по skiplist: %s (row=%s)", op_raw_s, i)
+        raw = {
+            "row": i,
+            "date": date_val,
+            "raw_type": op_raw_s,
+            "sum": payment_sum,
+            "currency": currency_normalized,
+            "comment": comment,
+            "ticker": ticker,
+            "isin": isin or "",
+            "reg_number": reg_number or "",
+            "price": to_num_safe(g("price")),
+            "quantity": to_int_safe(g("quantity")),
+            "aci": to_num_safe(g("aci")),
+            "operation_id": str(g("operation_id") or "") or "",
+        }
+        if raw_rows is not None:
+            raw_rows.append(raw)
+
+        op_type = classify_fin_row(raw, stats, rules, row_log)
+        if op_type is None:
+            continue
+        if statement_filter is not None and not statement_filter.accepts_type(op_type):
+            stats["skipped_filtered"] += 1
             continue
 
-        # --- Специальные хендлеры (не перезаписываем если op_type уже установлен) ---
-        for norm_k, orig_k in normalized_special_map.items():
-            if norm_k in op_low and not op_type:
-                handler = special_handlers.get(orig_k)
-                if callable(handler):
-                    entry = {"date": date_val, "raw_type": op_raw_s, "sum": payment_sum, "comment": comment}
-                    try:
-                        op_type = handler(payment_sum, entry)
-                    except Exception:
-                        op_type = None
-                break
-
-        # --- Стандартная маппинг-таблица ---
-        if not op_type and op_low in normalized_op_map:
-            op_type = normalized_op_map[op_low]
-
-        if not op_type:
-            for k_norm, v in normalized_op_map.items():
-                if k_norm in op_low:
-                    op_type = v
-                    break
-
-        # --- Если всё ещё нет op_type, пытаемся по sign/known names ---
-        if not op_type:
-            looks_like_known = False
-            if op_low in normalized_valid:
-                looks_like_known = True
-            elif any(k in op_low for k in normalized_op_map.keys()):
-                looks_like_known = True
-
-            if looks_like_known:
-                sign = src.constants.get_sign(payment_sum)
-                if sign < 0:
-                    op_type = "withdrawal"
-                elif sign > 0:
-                    op_type = "deposit"
-                else:
-                    stats["skipped_zero_unknown"] += 1
-                    logger.debug("Пропуск: сумма нулевая и raw неизвестен (row=%s)", i)
-                    continue
-            else:
-                stats["skipped_skiplist"] += 1
-                stats["unrecognized_names"].append(op_raw_s)
-                logger.warning("Пропускаем неизвестный raw: %s (row=%s)", op_raw_s, i)
-                continue
-
-        dto = OperationDTO(
-            date=date_val,
-            operation_type=op_type,
-            payment_sum=payment_sum,
-            currency=currency_normalized,
-            ticker=ticker,
-            isin=(isin or ""),
-            reg_number=(reg_number or ""),
-            price=price,
-            quantity=quantity,
-            aci=aci,
-            comment=comment,
-            operation_id=str(g("operation_id") or "") or ""
-        )
-        ops.append(dto)
+        ops.append(_fin_dto(raw, op_type))
         stats["parsed"] += 1
 
+    row_log.flush()
+    stats["log_events"] = row_log.as_dict()
     logger.info("Разобрано %s финансовых операций", len(ops))
     stats["unrecognized_names"] = list(dict.fromkeys(stats["unrecognized_names"]))
     return ops, stats
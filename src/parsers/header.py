@@ -1,8 +1,9 @@
 from __future__ import annotations
 import re
 import pandas as pd
-from typing import Optional
+from typing import Any, Optional, Union
 from src.utils import logger, extract_date
+from src.parsers.sheet import read_sheet
 
 PERIOD_RE = re.compile(
     r"за период с (\d{2}\.\d{2}\.\d{4}) по (\d{2}\.\d{2}\.\d{4})", re.IGNORECASE
@@ -10,15 +11,15 @@ PERIOD_RE = re.compile(
 SUBACCOUNT_RE = re.compile(r"№\s*субсчета[:\s]*([0-9\-]+)", re.IGNORECASE)
 
 
-def parse_header(file_path: str) -> dict:
+def parse_header(file_path: Union[str, Any, pd.DataFrame]) -> dict:
     """
     Читает верхнюю часть xlsx через pandas (header=None) и извлекает:
       - account_id (№ субсчета)
       - account_date_start (дата соглашения рядом с 'о предоставлении услуг')
       - date_start / date_end (период отчёта)
+    Вместо пути можно передать уже загруженную сетку (см. read_sheet).
     """
-    df = pd.read_excel(file_path, header=None)
-    df = df.fillna("")
+    df = read_sheet(file_path)
 
     account_id: Optional[str] = None
     account_date_start: Optional[str] = None
@@ -35,20 +36,17 @@ def parse_header(file_path: str) -> dict:
             m = PERIOD_RE.search(joined)
             if m:
                 date_start, date_end = m.group(1), m.group(2)
-                logger.debug("Found period: %s - %s", date_start, date_end)
 
         if "о предоставлении услуг" in joined and not account_date_start:
             account_date_start = next(
                 (d for cell in row for d in [extract_date(cell)] if d),
                 None,
             )
-            logger.debug("Found agreement date: %s", account_date_start)
 
         if not account_id:
             m2 = SUBACCOUNT_RE.search(joined)
             if m2:
                 account_id = m2.group(1)
-                logger.debug("Found account id: %s", account_id)
 
         if account_id and account_date_start and date_start and date_end:
             break
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from src.constants import norm_str
+from src.utils import extract_date, logger
+
+# Меняется при изменении формата записи или логики определения колонок
+LAYOUT_VERSION = 2
+
+
+def row_key(row: Sequence[Any]) -> List[str]:
+    """Нормализованные ячейки строки заголовка (пустые сохраняются — важны позиции колонок)."""
+    return [norm_str(c) if str(c).strip() else "" for c in row]
+
+
+def header_like_rows(df: pd.DataFrame, header_idx: int, max_rows: int) -> List[int]:
+    """
+    Строки заголовка начиная с header_idx: подряд идущие строки только из текстовых ячеек
+    без дат. Первая строка с числом или датой — уже данные, в отпечаток она не входит.
+    """
+    rows = [header_idx]
+    for r in range(header_idx + 1, min(len(df), header_idx + max_rows)):
+        cells = [c for c in df.iloc[r] if str(c).strip()]
+        if any(not isinstance(c, str) or extract_date(c) for c in cells):
+            break
+        rows.append(r)
+    return rows
+
+
+def fingerprint(section: str, rows: List[List[str]]) -> str:
+    payload = json.dumps([LAYOUT_VERSION, section, rows], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class LayoutCache:
+    """
+    Кэш разметки таблиц выписки: отпечаток нормализованных строк заголовка ->
+    найденные индексы колонок. Выписки ВТБ выходят в нескольких версиях формата,
+    поэтому для известной разметки сопоставление колонок по ключевым словам пропускается.
+    Строку заголовка парсер всегда находит сам (это просмотр нескольких строк), и кэш
+    проверяет отпечаток именно на ней: попадание в кэш не может выбрать другую строку
+    заголовка, чем холодный разбор, в том числе при сдвинутом заголовке.
+
+    enabled переключается во время работы (disabled() — на время блока, так эталонный
+    прогон diffbench идёт без кэша); PARSER_LAYOUT_CACHE_ENABLED=0 задаёт начальное значение.
+    PARSER_LAYOUT_CACHE — путь к JSON-файлу: известные разметки переживают перезапуск,
+    а новая версия формата видна по записи в логе и по счётчику layouts в layout_stats().
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._layouts: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"hits": 0, "misses": 0, "new_layouts": 0}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def from_env(cls) -> "LayoutCache":
+        enabled = os.getenv("PARSER_LAYOUT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+        return cls(os.getenv("PARSER_LAYOUT_CACHE") or None, enabled)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать кэш разметки %s: %s", self.path, e)
+            return
+        if data.get("version") != LAYOUT_VERSION:
+            return
+        self._layouts.update(data.get("layouts", {}))
+
+    @contextlib.contextmanager
+    def disabled(self) -> Iterator[None]:
+        """Выключает кэш на время блока (для эталонного разбора)."""
+        enabled, self.enabled = self.enabled, False
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"version": LAYOUT_VERSION, "layouts": self._layouts}, fh, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить кэш разметки %s: %s", self.path, e)
+
+    def lookup(
+        self,
+        section: str,
+        df: pd.DataFrame,
+        header_idx: int,
+        key_rows: Callable[[pd.DataFrame, int], List[int]],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Разметка для строки заголовка header_idx, найденной парсером.
+        key_rows(df, header_idx) — строки, из которых строится отпечаток.
+        Возвращает запись разметки или None.
+        """
+        if not self.enabled:
+            return None
+        fp = fingerprint(section, [row_key(df.iloc[r]) for r in key_rows(df, header_idx)])
+        with self._lock:
+            self._ensure_loaded()
+            layout = self._layouts.get(fp)
+            if layout is None or layout["section"] != section:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            layout["seen"] = layout.get("seen", 0) + 1
+            return dict(layout)
+
+    def store(
+        self,
+        section: str,
+        df: pd.DataFrame,
+        header_idx: int,
+        key_rows: Callable[[pd.DataFrame, int], List[int]],
+        **layout: Any,
+    ) -> None:
+        """Запоминает найденную разметку; layout — то, что нужно парсеру (cols и т.п.)."""
+        if not self.enabled:
+            return
+        rows = [row_key(df.iloc[r]) for r in key_rows(df, header_idx)]
+        fp = fingerprint(section, rows)
+        with self._lock:
+            self._ensure_loaded()
+            if fp in self._layouts:
+                return
+            entry = {
+                "section": section,
+                "header": [" | ".join(c for c in row if c) for row in rows],
+                "first_seen": datetime.now().isoformat(timespec="seconds"),
+                "seen": 1,
+                **layout,
+            }
+            self._layouts[fp] = entry
+            self._stats["new_layouts"] += 1
+            self._save()
+        logger.info("Новая разметка секции %s (%s): %s", section, fp, entry["header"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "layouts": len(self._layouts),
+                "by_section": dict(Counter(v["section"] for v in self._layouts.values())),
+                "enabled": self.enabled,
+                "path": self.path or "",
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._layouts.clear()
+            self._stats = {"hits": 0, "misses": 0, "new_layouts": 0}
+            self._loaded = False
+
+
+LAYOUTS = LayoutCache.from_env()
+
+
+def layout_stats() -> Dict[str, Any]:
+    return LAYOUTS.stats()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import threading
+import weakref
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+# признаки, уже посчитанные для загруженного листа: id(df) -> (weakref на df, признаки)
+_GRID_FLAGS: Dict[int, Tuple["weakref.ref[pd.DataFrame]", pd.DataFrame]] = {}
+_GRID_FLAGS_LOCK = threading.Lock()
+
+
+def row_flags(df: pd.DataFrame, start: int = 0, end: Optional[int] = None) -> pd.DataFrame:
+    """
+    Построчные признаки для df.iloc[start:end], посчитанные поколоночно (без цикла по ячейкам):
+      text      — " ".join(непустых str(c).strip()).lower(), как в построчных проверках парсеров
+      blank_str — все ячейки строки — пустые строки (числа пустыми не считаются)
+      total     — есть строковая ячейка, которая после нормализации начинается с "итого"
+    Индекс результата совпадает с индексом df.
+    """
+    block = df.iloc[start:end]
+    n = len(block)
+    if not n:
+        return pd.DataFrame({"text": pd.Series(dtype=object), "blank_str": pd.Series(dtype=bool),
+                             "total": pd.Series(dtype=bool)}, index=block.index)
+    text = pd.Series([""] * n, index=block.index, dtype=object)
+    blank_str = np.ones(n, dtype=bool)
+    total = np.zeros(n, dtype=bool)
+
+    for col in block.columns:
+        s = block[col]
+        is_str = s.map(type).eq(str).to_numpy()
+        t = s.astype(str).str.strip()
+        t_empty = t.eq("")
+
+        blank_str &= is_str & t_empty.to_numpy()
+        total |= is_str & t.str.lower().str.startswith("итого").to_numpy(dtype=bool)
+
+        text_empty = text.eq("")
+        text = text.where(t_empty, t.where(text_empty, text + " " + t))
+
+    return pd.DataFrame(
+        {"text": text.str.lower(), "blank_str": blank_str, "total": total},
+        index=block.index,
+    )
+
+
+def grid_flags(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    row_flags для всего листа, посчитанные один раз на объект df: секции, разбираемые
+    по одному листу (последовательно или в потоках), берут срез вместо пересчёта хвоста.
+    Запись живёт, пока жив df (weakref), поэтому сетка из кэша воркбуков не держится лишний раз.
+    """
+    key = id(df)
+    with _GRID_FLAGS_LOCK:
+        entry = _GRID_FLAGS.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+    flags = row_flags(df)
+    with _GRID_FLAGS_LOCK:
+        _GRID_FLAGS[key] = (weakref.ref(df, lambda _, key=key: _GRID_FLAGS.pop(key, None)), flags)
+    return flags
+
+
+def section_flags(df: pd.DataFrame, start: int) -> pd.DataFrame:
+    """Признаки строк df.iloc[start:] — срез grid_flags, индекс совпадает с индексом df."""
+    return grid_flags(df).iloc[start:]
+
+
+def contains_any(text: pd.Series, needles: Iterable[str]) -> pd.Series:
+    """Поэлементно: содержит ли text хотя бы одну из подстрок."""
+    mask = pd.Series(False, index=text.index)
+    for k in needles:
+        mask |= text.str.contains(k, regex=False)
+    return mask
+
+
+def first_true(mask: pd.Series) -> Optional[int]:
+    """Позиция (0-based) первого True в маске или None."""
+    hits = np.flatnonzero(mask.to_numpy(dtype=bool))
+    return int(hits[0]) if len(hits) else None
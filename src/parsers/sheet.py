@@ -0,0 +1,13 @@
+from __future__ import annotations
+from typing import Any, Union
+import pandas as pd
+
+
+def read_sheet(source: Union[str, Any, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Сетка ячеек первого листа выписки (header=None, dtype=object, пустые -> "").
+    Если передан уже загруженный DataFrame — возвращается как есть, без повторного чтения xlsx.
+    """
+    if isinstance(source, pd.DataFrame):
+        return source
+    return pd.read_excel(source, header=None, dtype=object).fillna("")
@@ -4,13 +4,19 @@ import re
 import pandas as pd
 from datetime import datetime as _dt
 from datetime import datetime
+from functools import lru_cache
 
 from src.OperationDTO import OperationDTO
+from src.parsers.filters import StatementFilter
+from src.parsers.layout_cache import LAYOUTS, header_like_rows
+from src.parsers.row_flags import first_true, section_flags
+from src.parsers.sheet import read_sheet
 from src.utils import logger, to_num_safe, to_int_safe
 
-from src.constants import norm_str, CURRENCY_DICT
+from src.constants import norm_str, normalize_currency
 
 ISIN_RE = re.compile(r"\b[A-Za-z]{2}[A-Za-z0-9]{9}\d\b", re.IGNORECASE)
+REG_LONG_RE = re.compile(r"\b[0-9A-ZА-Я]{1,6}[-/][0-9A-ZА-Я\-\/]{3,}[0-9A-ZА-Я]?\b", re.IGNORECASE)
 
 HEADER_KEYWORDS_TRADES: Dict[str, List[str]] = {
     "instrument": ["наименование ценной бумаги", "isin", "регистрац", "№ гос. регистрац"],
@@ -25,6 +31,12 @@ HEADER_KEYWORDS_TRADES: Dict[str, List[str]] = {
     "comment": ["коммент", "комментарий"],
 }
 
+_HEADER_KEYWORDS_TRADES_NORM: Dict[str, List[str]] = {
+    key: [norm_str(kw) for kw in keywords] for key, keywords in HEADER_KEYWORDS_TRADES.items()
+}
+
+COMBINED_HEADER_ROWS = 3
+
 
 def find_trades_block_start(df: pd.DataFrame) -> Optional[int]:
     """
@@ -91,11 +103,11 @@ def map_trades_header_indices(header_row: Union[pd.Series, List[str]]) -> Dict[s
         if not cell:
             continue
         low = norm_str(cell)
-        for key, keywords in HEADER_KEYWORDS_TRADES.items():
+        for key, keywords in _HEADER_KEYWORDS_TRADES_NORM.items():
             if key in cols:
                 continue
             for kw in keywords:
-                if norm_str(kw) in low:
+                if kw in low:
                     cols[key] = idx
                     break
             if key in cols:
@@ -103,23 +115,14 @@ def map_trades_header_indices(header_row: Union[pd.Series, List[str]]) -> Dict[s
     return cols
 
 
-def parse_instrument_cell(cell: Any) -> Tuple[str, str]:
-    """
-    Из поля 'Наименование ценной бумаги, № гос. Регистрации, ISIN'
-    возвращаем (isin, reg_number).
-    """
-    s = "" if cell is None else str(cell).strip()
-    if not s:
-        return "", ""
-
+@lru_cache(maxsize=16384)
+def _split_instrument_text(s: str) -> Tuple[str, str, str]:
     m_isin = ISIN_RE.search(s)
     isin = m_isin.group(0).upper() if m_isin else ""
 
     parts = [p.strip() for p in re.split(r"[,\t;/]+", s) if p.strip()]
 
     reg_number = ""
-    REG_LONG_RE = re.compile(r"\b[0-9A-ZА-Я]{1,6}[-/][0-9A-ZА-Я\-\/]{3,}[0-9A-ZА-Я]?\b", re.IGNORECASE)
-
     for p in parts:
         if p.upper() == isin:
             continue
@@ -140,12 +143,67 @@ def parse_instrument_cell(cell: Any) -> Tuple[str, str]:
     if reg_number:
         reg_number = reg_number.strip().strip(".,;")
 
+    name = next((p for p in parts if p.upper() != isin and (not reg_number or reg_number not in p)), "")
+    return name, isin, reg_number
+
+
+def split_instrument_cell(cell: Any) -> Tuple[str, str, str]:
+    """(наименование, isin, reg_number) из поля инструмента; разбор кэшируется по тексту ячейки."""
+    s = "" if cell is None else str(cell).strip()
+    if not s:
+        return "", "", ""
+    return _split_instrument_text(s)
+
+
+def parse_instrument_cell(cell: Any) -> Tuple[str, str]:
+    """
+    Из поля 'Наименование ценной бумаги, № гос. Регистрации, ISIN'
+    возвращаем (isin, reg_number).
+    """
+    _, isin, reg_number = split_instrument_cell(cell)
     return isin, reg_number
 
 
-def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int], combined_header: List[str]) -> tuple[List[OperationDTO], dict]:
+def _commission_cols(combined_header: List[str]) -> List[int]:
+    return [idx for idx, h in enumerate(combined_header) if "комис" in h]
+
+
+def _trades_key_rows(df: pd.DataFrame, header_idx: int) -> List[int]:
+    return header_like_rows(df, header_idx, COMBINED_HEADER_ROWS)
+
+
+def _detect_trades_layout(df: pd.DataFrame, header_idx: int) -> Tuple[Dict[str, int], List[str]]:
+    combined_header = _build_combined_header(df, header_idx, max_rows=COMBINED_HEADER_ROWS)
+    cols = map_trades_header_indices(combined_header)
+    if not cols:
+        header_row = df.iloc[header_idx]
+        cols = map_trades_header_indices(header_row)
+    return cols, combined_header
+
+
+def _layout_is_header_only(df: pd.DataFrame, header_idx: int, cols: Dict[str, int], combined_header: List[str]) -> bool:
+    """
+    Объединённый заголовок захватывает и первые строки данных. Разметку можно кэшировать,
+    только если она получается той же по одним строкам заголовка — иначе она зависит от данных.
+    """
+    rows = _trades_key_rows(df, header_idx)
+    header_only = _build_combined_header(df, header_idx, max_rows=len(rows))
+    cols_h = map_trades_header_indices(header_only) or map_trades_header_indices(df.iloc[header_idx])
+    return cols_h == cols and _commission_cols(header_only) == _commission_cols(combined_header)
+
+
+def parse_trades_table(
+    df: pd.DataFrame,
+    header_idx: int,
+    cols: Dict[str, int],
+    combined_header: List[str],
+    commission_cols: Optional[List[int]] = None,
+    statement_filter: Optional[StatementFilter] = None,
+) -> tuple[List[OperationDTO], dict]:
     results: List[OperationDTO] = []
     curr_isin, curr_reg = "", ""
+    # связки наименование/ISIN/рег. номер для справочника инструментов
+    instruments: Dict[Tuple[str, str, str], None] = {}
 
     total_rows = 0
     parsed_rows = 0
@@ -154,36 +212,46 @@ def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int],
     skipped_no_qty = 0
     skipped_no_type = 0
     skipped_itogo = 0
-
-    commission_cols: List[int] = [idx for idx, h in enumerate(combined_header) if "комис" in h]
-
-    for r_idx in range(header_idx + 1, len(df)):
+    skipped_filtered = 0
+
+    if commission_cols is None:
+        commission_cols = _commission_cols(combined_header)
+
+    # Структурные признаки строк (конец блока, "Итого") считаются поколоночно один раз на лист
+    start = header_idx + 1
+    flags = section_flags(df, start)
+    text = flags["text"]
+    unfinished = text.str.contains("незавершенные", regex=False) & text.str.contains("сделки с ценными бумагами", regex=False)
+    stop_pos = first_true(unfinished | flags["blank_str"])
+    end_idx = len(df) if stop_pos is None else start + stop_pos
+    if stop_pos is not None:
         total_rows += 1
-        row = df.iloc[r_idx]
-        cells = list(row)
-        text_row = " ".join(str(c).strip() for c in cells if str(c).strip()).lower()
-
-        if "незавершенные" in text_row and "сделки с ценными бумагами" in text_row:
-            logger.debug("Reached 'Незавершенные' trades block at row %s: %s", r_idx, text_row)
-            break
-
-        if all((c is None or (isinstance(c, str) and not c.strip())) for c in cells):
-            logger.debug("Reached empty row -> end of trades block at row %s", r_idx)
-            break
+        if unfinished.iloc[stop_pos]:
+            logger.debug("Reached 'Незавершенные' trades block at row %s: %s", end_idx, text.iloc[stop_pos])
+        else:
+            logger.debug("Reached empty row -> end of trades block at row %s", end_idx)
+    is_total = flags["total"].to_numpy()
 
-        if any(isinstance(c, str) and norm_str(c).startswith("итого") for c in cells):
+    for r_idx in range(start, end_idx):
+        total_rows += 1
+        if is_total[r_idx - start]:
             skipped_itogo += 1
             continue
 
+        row = df.iloc[r_idx]
+        cells = list(row)
+
         inst_idx = cols.get("instrument")
         if inst_idx is not None and inst_idx < len(cells):
             inst_cell = cells[inst_idx]
             if inst_cell is not None and str(inst_cell).strip():
-                isin_val, regno = parse_instrument_cell(inst_cell)
+                name, isin_val, regno = split_instrument_cell(inst_cell)
                 if isin_val:
                     curr_isin = isin_val
                 if regno:
                     curr_reg = regno
+                if name and (isin_val or regno):
+                    instruments[(name, isin_val, regno)] = None
 
         date_val = None
         dt_idx = cols.get("datetime")
@@ -206,11 +274,14 @@ def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int],
         if date_val is None:
             skipped_no_date += 1
             continue
+        if statement_filter is not None and not statement_filter.accepts_date(date_val):
+            skipped_filtered += 1
+            continue
 
         op_type_raw = ""
         t_idx = cols.get("type")
         if t_idx is not None and t_idx < len(cells):
-            op_type_raw = str(cells[t_idx]).strip().lower()
+            op_type_raw = norm_str(cells[t_idx])
         if "покуп" in op_type_raw:
             op = "buy"
         elif "продаж" in op_type_raw or "продажа" in op_type_raw or "продать" in op_type_raw:
@@ -220,6 +291,9 @@ def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int],
         if op is None:
             skipped_no_type += 1
             continue
+        if statement_filter is not None and not statement_filter.accepts_type(op):
+            skipped_filtered += 1
+            continue
 
         qty = 0
         q_idx = cols.get("quantity")
@@ -238,8 +312,7 @@ def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int],
         cur_idx = cols.get("currency_calc")
         if cur_idx is not None and cur_idx < len(cells):
             currency_raw = str(cells[cur_idx]).strip()
-            currency = CURRENCY_DICT.get(currency_raw.upper(),
-                                                       currency_raw.upper() if currency_raw else "")
+            currency = normalize_currency(currency_raw)
 
         total = 0.0
         s_idx = cols.get("sum")
@@ -296,6 +369,9 @@ def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int],
         "skipped_no_type": skipped_no_type,
         "skipped_itogo": skipped_itogo,
     }
+    if statement_filter is not None:
+        stats["skipped_filtered"] = skipped_filtered
+    stats["instruments"] = [{"name": n, "isin": i, "reg_number": r} for n, i, r in instruments]
 
     logger.info(
         "Trades parsing stats: total_rows=%s parsed=%s skipped_empty=%s skipped_no_date=%s skipped_no_qty=%s skipped_no_type=%s skipped_itogo=%s",
@@ -305,8 +381,10 @@ def parse_trades_table(df: pd.DataFrame, header_idx: int, cols: Dict[str, int],
     return results, stats
 
 
-def parse_stock_bond_trades(file_path: Union[str, Any]) -> tuple[List[OperationDTO], dict]:
-    df = pd.read_excel(file_path, header=None, dtype=object).fillna("")
+def parse_stock_bond_trades(
+    file_path: Union[str, Any], statement_filter: Optional[StatementFilter] = None
+) -> tuple[List[OperationDTO], dict]:
+    df = read_sheet(file_path)
     start_idx = find_trades_block_start(df)
     if start_idx is None:
         logger.info("Trades block not found")
@@ -317,26 +395,26 @@ def parse_stock_bond_trades(file_path: Union[str, Any]) -> tuple[List[OperationD
         logger.warning("Trades header row not found after block start; attempting to use start_idx as header")
         header_idx = start_idx
 
-    combined_header = _build_combined_header(df, header_idx, max_rows=3)
-    cols = map_trades_header_indices(combined_header)
+    layout = LAYOUTS.lookup("trades", df, header_idx, _trades_key_rows)
+    if layout is not None:
+        cols = layout["cols"]
+        combined_header, commission_cols = [], layout["commission_cols"]
+    else:
+        cols, combined_header = _detect_trades_layout(df, header_idx)
+        if not cols:
+            logger.warning("Could not map any trade columns from header row(s): %s", combined_header[:10])
+            return [], {}
+        commission_cols = _commission_cols(combined_header)
+        if _layout_is_header_only(df, header_idx, cols, combined_header):
+            LAYOUTS.store(
+                "trades", df, header_idx, _trades_key_rows,
+                cols=cols, commission_cols=commission_cols,
+            )
     logger.debug("Обнаружены колонки: %s", cols)
-    if not cols:
-        header_row = df.iloc[header_idx]
-        cols = map_trades_header_indices(header_row)
-    if not cols:
-        logger.warning("Could not map any trade columns from header row(s): %s", combined_header[:10])
-        return [], {}
-
-    results, stats = parse_trades_table(df, header_idx, cols, combined_header)
 
-    def key_fn(o: OperationDTO):
-        d = o.date
-        if isinstance(d, datetime):
-            return d
-        try:
-            return pd.to_datetime(d, dayfirst=True, errors="coerce")
-        except Exception:
-            return pd.NaT
+    results, stats = parse_trades_table(
+        df, header_idx, cols, combined_header, commission_cols=commission_cols, statement_filter=statement_filter
+    )
 
-    results_sorted = sorted(results, key=key_fn)
+    results_sorted = sorted(results, key=lambda o: o.sort_key)
     return results_sorted, stats
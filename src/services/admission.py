@@ -0,0 +1,123 @@
+# src/services/admission.py
+"""
+Контроль допуска запросов на парсинг.
+
+Каждый парсинг держит в памяти загруженный файл и несколько DataFrame,
+поэтому ограничиваем одновременно:
+  - число парсингов в работе (PARSER_MAX_INFLIGHT, 4);
+  - суммарный размер загрузок в работе (PARSER_MAX_INFLIGHT_BYTES, 256 MiB);
+  - длину очереди ожидания (PARSER_MAX_WAITING, 16) — сверх неё сразу 429;
+  - время ожидания в очереди (PARSER_ADMISSION_TIMEOUT, 30 с) — по истечении 503.
+Файл больше всего бюджета байт не может быть допущен никогда — 413.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int = 0):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight: int = 4,
+        max_inflight_bytes: int = 256 * 1024 * 1024,
+        max_waiting: int = 16,
+        wait_timeout: float = 30.0,
+    ):
+        self.max_inflight = max(1, max_inflight)
+        self.max_inflight_bytes = max(1, max_inflight_bytes)
+        self.max_waiting = max(0, max_waiting)
+        self.wait_timeout = wait_timeout
+
+        self._cond = asyncio.Condition()
+        self.inflight = 0
+        self.inflight_bytes = 0
+        self.waiting = 0
+
+        self.admitted_total = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_too_large = 0
+        self.peak_waiting = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_inflight=int(os.getenv("PARSER_MAX_INFLIGHT", "4")),
+            max_inflight_bytes=int(os.getenv("PARSER_MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024))),
+            max_waiting=int(os.getenv("PARSER_MAX_WAITING", "16")),
+            wait_timeout=float(os.getenv("PARSER_ADMISSION_TIMEOUT", "30")),
+        )
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.inflight < self.max_inflight and self.inflight_bytes + nbytes <= self.max_inflight_bytes
+
+    @asynccontextmanager
+    async def admit(self, nbytes: int) -> AsyncIterator[None]:
+        """
+        Ждёт свободного слота и бюджета под nbytes, иначе бросает AdmissionRejected.
+        Слот освобождается при выходе из контекста.
+        """
+        nbytes = max(0, int(nbytes or 0))
+        if nbytes > self.max_inflight_bytes:
+            self.rejected_too_large += 1
+            raise AdmissionRejected(413, f"Файл {nbytes} байт превышает лимит {self.max_inflight_bytes}")
+
+        started = time.perf_counter()
+        async with self._cond:
+            if self.waiting or not self._fits(nbytes):
+                if self.waiting >= self.max_waiting:
+                    self.rejected_queue_full += 1
+                    raise AdmissionRejected(429, "Слишком много запросов в очереди", retry_after=1)
+                self.waiting += 1
+                self.peak_waiting = max(self.peak_waiting, self.waiting)
+                try:
+                    await asyncio.wait_for(self._cond.wait_for(lambda: self._fits(nbytes)), self.wait_timeout)
+                except asyncio.TimeoutError:
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected(503, "Превышено время ожидания в очереди", retry_after=5)
+                finally:
+                    self.waiting -= 1
+            self.inflight += 1
+            self.inflight_bytes += nbytes
+            self.admitted_total += 1
+
+        waited = time.perf_counter() - started
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.inflight -= 1
+                self.inflight_bytes -= nbytes
+                self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "inflight_bytes": self.inflight_bytes,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "max_inflight": self.max_inflight,
+            "max_inflight_bytes": self.max_inflight_bytes,
+            "max_waiting": self.max_waiting,
+            "admitted_total": self.admitted_total,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "rejected_too_large": self.rejected_too_large,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.admitted_total, 4) if self.admitted_total else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 4),
+        }
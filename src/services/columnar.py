@@ -0,0 +1,139 @@
+# src/services/columnar.py
+"""
+Колоночное представление операций (Arrow / Parquet).
+
+Схема типизирована: date — timestamp, суммы — float64, quantity — int64,
+operation_type и currency — словарные (категориальные) колонки.
+pyarrow — опциональная зависимость: без неё модуль импортируется,
+но функции экспорта бросают ImportError.
+"""
+from __future__ import annotations
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from src.OperationDTO import OperationDTO
+from src.utils import parse_datetime, to_int_safe, to_num_safe
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - зависит от окружения
+    pa = None
+    pa_ipc = None
+    pq = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+FLOAT_COLUMNS = ("payment_sum", "price", "aci", "commission")
+INT_COLUMNS = ("quantity",)
+CATEGORY_COLUMNS = ("operation_type", "currency")
+STRING_COLUMNS = ("ticker", "isin", "reg_number", "comment", "operation_id")
+
+COLUMN_ORDER = (
+    "date", "operation_type", "payment_sum", "currency", "ticker", "isin", "reg_number",
+    "price", "quantity", "aci", "comment", "operation_id", "commission",
+)
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Для колоночного экспорта требуется пакет pyarrow (pip install pyarrow)")
+
+
+def to_datetime_value(v: Any) -> Optional[datetime]:
+    """datetime как есть; строки 'dd.mm.yyyy[ HH:MM:SS]' и ISO — в datetime; иначе None."""
+    return parse_datetime(v)
+
+
+def _as_record(op: Union[OperationDTO, Dict[str, Any]]) -> Dict[str, Any]:
+    if isinstance(op, OperationDTO):
+        rec = {k: getattr(op, k) for k in COLUMN_ORDER}
+        rec["date"] = op.parsed_date  # уже разобранная при создании DTO дата
+        return rec
+    return op
+
+
+def operations_to_arrow(
+    operations: Iterable[Union[OperationDTO, Dict[str, Any]]],
+    metadata: Optional[Dict[str, Any]] = None,
+):
+    """
+    Строит pyarrow.Table из OperationDTO или словарей OperationDTO.to_dict().
+    Ключи словарей вне основной схемы (например source_file) добавляются строковыми колонками.
+    metadata сохраняется в метаданных схемы под ключом b"statement" (JSON).
+    """
+    _require_pyarrow()
+
+    records = [_as_record(op) for op in operations]
+    columns: Dict[str, List[Any]] = {k: [] for k in COLUMN_ORDER}
+    extra_keys: List[str] = []
+    for rec in records:
+        for k in rec:
+            if k not in columns and k not in extra_keys:
+                extra_keys.append(k)
+
+    for rec in records:
+        columns["date"].append(to_datetime_value(rec.get("date")))
+        for k in FLOAT_COLUMNS:
+            columns[k].append(to_num_safe(rec.get(k)))
+        for k in INT_COLUMNS:
+            columns[k].append(to_int_safe(rec.get(k)))
+        for k in CATEGORY_COLUMNS + STRING_COLUMNS:
+            v = rec.get(k)
+            columns[k].append("" if v is None else str(v))
+
+    arrays = {
+        "date": pa.array(columns["date"], type=pa.timestamp("us")),
+        **{k: pa.array(columns[k], type=pa.float64()) for k in FLOAT_COLUMNS},
+        **{k: pa.array(columns[k], type=pa.int64()) for k in INT_COLUMNS},
+        **{k: pa.array(columns[k], type=pa.string()).dictionary_encode() for k in CATEGORY_COLUMNS},
+        **{k: pa.array(columns[k], type=pa.string()) for k in STRING_COLUMNS},
+    }
+    names = list(COLUMN_ORDER)
+    data = [arrays[k] for k in COLUMN_ORDER]
+    for k in extra_keys:
+        names.append(k)
+        data.append(pa.array([None if rec.get(k) is None else str(rec.get(k)) for rec in records], type=pa.string()))
+
+    table = pa.Table.from_arrays(data, names=names)
+    if metadata:
+        table = table.replace_schema_metadata(
+            {b"statement": json.dumps(metadata, ensure_ascii=False, default=str).encode("utf-8")}
+        )
+    return table
+
+
+def statement_metadata(table) -> Dict[str, Any]:
+    """Обратное к operations_to_arrow(metadata=...): достаёт заголовок/мету выписки из схемы."""
+    raw = (table.schema.metadata or {}).get(b"statement")
+    return json.loads(raw.decode("utf-8")) if raw else {}
+
+
+def table_to_ipc_bytes(table) -> bytes:
+    """Сериализует таблицу в Arrow IPC stream."""
+    _require_pyarrow()
+    sink = pa.BufferOutputStream()
+    with pa_ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def table_to_parquet_bytes(table, compression: str = "zstd") -> bytes:
+    _require_pyarrow()
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression=compression)
+    return sink.getvalue().to_pybytes()
+
+
+def write_parquet(table, path: str, compression: str = "zstd") -> None:
+    _require_pyarrow()
+    pq.write_table(table, path, compression=compression)
+
+
+def parquet_writer(path: str, schema, compression: str = "zstd"):
+    """ParquetWriter для потоковой записи таблиц одной схемы (закрывается вызывающим)."""
+    _require_pyarrow()
+    return pq.ParquetWriter(path, schema, compression=compression)
@@ -1,9 +1,24 @@
 # src/services/full_statement.py
 from src.parsers.header import parse_header
-from src.parsers.fin_operations import parse_fin_operations
+from src.parsers.fin_operations import parse_fin_operations, reclassify_fin_operations
+from src.parsers.filters import StatementFilter
 from src.parsers.stocks_bonds import parse_stock_bond_trades
+from src.services.columnar import operations_to_arrow
+from src.services.instrument_index import INSTRUMENTS
+from src.services.portfolio import build_portfolio
+from src.services.grid import GridHandle, SharedGrid, attach_grid
+from src.services.workbook_cache import load_workbook_grid
+from src.OperationDTO import OperationDTO
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import heapq
+import os
+import threading
+import pandas as pd
+
+# progress(section, info): вызывается по завершении каждой секции ("header", "fin", "trades")
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
 
 
 def _make_fingerprint(op: Any) -> tuple:
@@ -23,7 +38,216 @@ def _make_fingerprint(op: Any) -> tuple:
     return ("fp", dstr, t, s_norm, ticker, isin)
 
 
-def parse_full_statement(file_path: str) -> Dict:
+def _report(progress: Optional[ProgressCallback], section: str, stats: Dict) -> None:
+    if progress is None:
+        return
+    try:
+        progress(section, {"rows": stats.get("total_rows", 0), "parsed": stats.get("parsed", 0)})
+    except Exception:
+        pass
+
+
+# Режим выполнения секций внутри одной выписки:
+#   serial  — последовательно в текущем потоке (по умолчанию: парсеры секций — чистый Python
+#             под GIL, пул потоков даёт только накладные расходы)
+#   thread  — fin и trades в общем пуле потоков
+#   process — fin и trades в общем пуле процессов (сетка передаётся воркеру)
+SECTION_MODES = ("serial", "thread", "process")
+SECTIONS_MODE = os.getenv("PARSER_SECTIONS_MODE", "serial")
+SECTION_WORKERS = int(os.getenv("PARSER_SECTION_WORKERS", str(min(8, (os.cpu_count() or 1) * 2))))
+# Как сетка попадает в процессы-воркеры: shm (shared_memory), mmap (временный файл) или pickle
+GRID_TRANSPORT = os.getenv("PARSER_GRID_TRANSPORT", "shm")
+
+_SECTION_PARSERS: Dict[str, Callable[[pd.DataFrame], Tuple[List[OperationDTO], dict]]] = {
+    "fin": parse_fin_operations,
+    "trades": parse_stock_bond_trades,
+}
+
+# Порядок операций в ответе:
+#   source    — как в выписке: сначала финансовые операции, затем сделки (по умолчанию)
+#   date      — хронологически, слиянием уже упорядоченных потоков fin и trades
+#   date_desc — обратный хронологический
+ORDER_MODES = ("source", "date", "date_desc")
+
+_executors: Dict[str, Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(mode: str) -> Executor:
+    with _executors_lock:
+        ex = _executors.get(mode)
+        if ex is None:
+            if mode == "process":
+                ex = ProcessPoolExecutor(max_workers=SECTION_WORKERS)
+            else:
+                ex = ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix="section")
+            _executors[mode] = ex
+        return ex
+
+
+def _run_section(name: str, df: pd.DataFrame, kwargs: Dict[str, Any]) -> Tuple[List[OperationDTO], dict]:
+    ops, stats = _SECTION_PARSERS[name](df, **kwargs)
+    return ops, stats or {}
+
+
+def _run_section_shared(name: str, handle: GridHandle, kwargs: Dict[str, Any]) -> Tuple[List[OperationDTO], dict]:
+    """Точка входа воркера в режиме process: сетка берётся из shared memory / mmap по дескриптору."""
+    return _run_section(name, attach_grid(handle), kwargs)
+
+
+def _run_sections(
+    df: pd.DataFrame,
+    mode: str,
+    progress: Optional[ProgressCallback],
+    section_kwargs: Optional[Dict[str, Dict[str, Any]]] = None,
+    names: Optional[List[str]] = None,
+) -> Dict[str, Tuple[List[OperationDTO], dict]]:
+    """
+    Запускает парсеры секций над одной загруженной сеткой.
+    section_kwargs — дополнительные аргументы парсеров по имени секции.
+    names — какие секции запускать (по умолчанию все из _SECTION_PARSERS).
+    Результат — словарь по имени секции, поэтому порядок завершения на итог не влияет.
+    """
+    section_kwargs = section_kwargs or {}
+    names = list(_SECTION_PARSERS) if names is None else names
+    if mode not in SECTION_MODES:
+        raise ValueError(f"Неизвестный режим секций: {mode}")
+
+    results: Dict[str, Tuple[List[OperationDTO], dict]] = {}
+    if mode == "serial":
+        for name in names:
+            results[name] = _run_section(name, df, section_kwargs.get(name, {}))
+            _report(progress, name, results[name][1])
+        return results
+
+    executor = _get_executor(mode)
+    shared: Optional[SharedGrid] = None
+    try:
+        if mode == "process" and GRID_TRANSPORT in ("shm", "mmap"):
+            shared = SharedGrid.create(df, GRID_TRANSPORT)
+            futures = {
+                executor.submit(_run_section_shared, name, shared.handle, section_kwargs.get(name, {})): name
+                for name in names
+            }
+        else:
+            futures = {
+                executor.submit(_run_section, name, df, section_kwargs.get(name, {})): name
+                for name in names
+            }
+        for fut in as_completed(futures):
+            name = futures[fut]
+            results[name] = fut.result()
+            _report(progress, name, results[name][1])
+    finally:
+        if shared is not None:
+            shared.close()
+    return results
+
+
+def _sort_key(op: OperationDTO) -> datetime:
+    return op.sort_key
+
+
+def order_operations(
+    fin_ops: List[OperationDTO], trade_ops: List[OperationDTO], order: str = "source"
+) -> List[OperationDTO]:
+    """
+    Объединяет потоки fin и trades в заданном порядке (см. ORDER_MODES).
+    Сделки приходят из парсера уже отсортированными, финансовые операции в выписке
+    почти всегда хронологические, поэтому вместо полной сортировки — k-way merge;
+    при равных датах финансовые операции идут раньше сделок (в обоих направлениях),
+    операции без даты — в конце.
+    """
+    if order not in ORDER_MODES:
+        raise ValueError(f"Неизвестный порядок операций: {order}")
+    if order == "source":
+        return fin_ops + trade_ops
+
+    streams = []
+    for ops in (fin_ops, trade_ops):
+        keys = [op.sort_key for op in ops]
+        if any(a > b for a, b in zip(keys, keys[1:])):
+            ops = sorted(ops, key=_sort_key)
+        streams.append(ops)
+
+    merged = list(heapq.merge(*streams, key=_sort_key))
+    if order == "date_desc":
+        # стабильная сортировка по убыванию сохраняет порядок равных дат из date,
+        # а операции без даты, как и там, остаются в конце
+        dated = [op for op in merged if op.parsed_date is not None]
+        dated.sort(key=_sort_key, reverse=True)
+        merged = dated + merged[len(dated):]
+    return merged
+
+
+def _parse_statement(
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+    mode: Optional[str] = None,
+    keep_raw: bool = False,
+    order: str = "source",
+    statement_filter: Optional[StatementFilter] = None,
+    enrich_instruments: bool = False,
+) -> Tuple[Dict, List[OperationDTO], Dict, List[Dict[str, Any]]]:
+    """
+    Общая часть parse_full_statement / parse_full_statement_arrow:
+    (header, operations, meta, сырые строки fin-секции — только при keep_raw).
+    Секции, не нужные statement_filter, не запускаются; их stats пустые.
+    Справочник инструментов пополняется при PARSER_INSTRUMENT_LEARN=1 (INSTRUMENTS.learning),
+    операции дообогащаются — при enrich_instruments.
+    """
+    df = load_workbook_grid(file_path)
+
+    header = parse_header(df)
+    _report(progress, "header", {"parsed": int(bool(header.get("account_id")))})
+
+    section_kwargs: Dict[str, Dict[str, Any]] = {"fin": {"keep_raw": keep_raw}, "trades": {}}
+    names = list(_SECTION_PARSERS)
+    if statement_filter is not None:
+        names = [n for n in names if statement_filter.wants_section(n)]
+        for kwargs in section_kwargs.values():
+            kwargs["statement_filter"] = statement_filter
+    sections = _run_sections(df, mode or SECTIONS_MODE, progress, section_kwargs, names)
+    fin_ops, fin_stats = sections.get("fin", ([], {}))
+    trade_ops, trade_stats = sections.get("trades", ([], {}))
+    raw_rows = fin_stats.pop("raw_rows", [])
+    instruments = trade_stats.pop("instruments", [])
+    log_events = {name: stats.pop("log_events") for name, (_, stats) in sections.items() if "log_events" in stats}
+
+    fin_count = fin_stats.get("parsed", len(fin_ops))
+    trade_count = trade_stats.get("parsed", len(trade_ops))
+
+    meta = {
+        "fin_ops_raw_count": fin_count,
+        "trade_ops_raw_count": trade_count,
+        "total_operations": len(fin_ops) + len(trade_ops),
+        "fin_stats": fin_stats,
+        "trade_stats": trade_stats,
+        "unknown_fin_ops": fin_stats.get("unrecognized_names", []),
+        "log_events": log_events,
+    }
+    if statement_filter is not None:
+        meta["filter"] = statement_filter.as_dict()
+
+    if INSTRUMENTS.learning:
+        INSTRUMENTS.learn(instruments, fin_ops + trade_ops)
+    if enrich_instruments:
+        meta["instruments_enriched"] = INSTRUMENTS.enrich(fin_ops + trade_ops)
+    if INSTRUMENTS.learning:
+        INSTRUMENTS.save()
+    return header, order_operations(fin_ops, trade_ops, order), meta, raw_rows
+
+
+def parse_full_statement(
+    file_path: str,
+    progress: Optional[ProgressCallback] = None,
+    mode: Optional[str] = None,
+    include_raw: bool = False,
+    order: str = "source",
+    portfolio: bool = False,
+    statement_filter: Optional[StatementFilter] = None,
+    enrich_instruments: bool = False,
+) -> Dict:
     """
     Парсит заголовок, финансовые операции и сделки с ценными бумагами.
     Возвращает структуру:
@@ -37,33 +261,70 @@ def parse_full_statement(file_path: str) -> Dict:
           "fin_stats": {...},      # raw stats from fin parser
           "trade_stats": {...},    # raw stats from trades parser
           "unknown_fin_ops": [...],# список нераспознанных названий
+          "log_events": {"fin": {...}},  # счётчики построчных событий по секциям
       }
     }
+    progress — необязательный колбэк прогресса по секциям (см. ProgressCallback).
+    mode — режим выполнения секций (serial/thread/process), по умолчанию PARSER_SECTIONS_MODE.
+    include_raw — добавить "raw_fin_rows": сырые строки fin-секции для reclassify_statement.
+    order — порядок операций: source (как в выписке), date, date_desc (см. ORDER_MODES).
+    portfolio — добавить "portfolio": позиции и остатки на date_end (см. services.portfolio).
+    statement_filter — отбор по периоду, типам операций и секциям внутри парсеров
+    (см. parsers.filters.StatementFilter.build); применённый фильтр попадает в meta["filter"].
+    enrich_instruments — дозаполнить isin/reg_number/ticker из справочника инструментов
+    (см. services.instrument_index); число изменённых операций — meta["instruments_enriched"].
     """
-    header = parse_header(file_path)
-
-    fin_ops, fin_stats = parse_fin_operations(file_path)
-    trade_ops, trade_stats = parse_stock_bond_trades(file_path)
+    header, ops, meta, raw_rows = _parse_statement(
+        file_path, progress, mode, keep_raw=include_raw, order=order,
+        statement_filter=statement_filter, enrich_instruments=enrich_instruments,
+    )
 
-    fin_stats = fin_stats or {}
-    trade_stats = trade_stats or {}
+    operations = [*map(lambda o: o.to_dict(), ops)]
 
-    fin_count = fin_stats.get("parsed", len(fin_ops))
-    trade_count = trade_stats.get("parsed", len(trade_ops))
-
-    meta = {
-        "fin_ops_raw_count": fin_count,
-        "trade_ops_raw_count": trade_count,
-        "total_operations": len(fin_ops) + len(trade_ops),
-        "fin_stats": fin_stats,
-        "trade_stats": trade_stats,
-        "unknown_fin_ops": fin_stats.get("unrecognized_names", []),
+    result = {
+        **header,
+        "operations": operations,
+        "meta": meta,
     }
+    if include_raw:
+        result["raw_fin_rows"] = raw_rows
+    if portfolio:
+        result["portfolio"] = build_portfolio(ops, as_of=header.get("date_end"))
+    return result
 
-    operations = [*map(lambda o: o.to_dict(), fin_ops + trade_ops)]
 
+def reclassify_statement(raw_fin_rows: List[Dict[str, Any]], rules: Optional[Dict[str, Any]] = None) -> Dict:
+    """
+    Перезапускает классификацию финансовых операций по сохранённым сырым строкам
+    (parse_full_statement(..., include_raw=True)["raw_fin_rows"]) без разбора Excel.
+    rules — необязательные подмены наборов правил (см. fin_operations.build_fin_rules).
+    """
+    fin_ops, fin_stats = reclassify_fin_operations(raw_fin_rows, rules)
     return {
-        **header,
-        "operations": operations,
-        "meta": meta,
+        "operations": [o.to_dict() for o in fin_ops],
+        "meta": {
+            "fin_ops_raw_count": fin_stats.get("parsed", len(fin_ops)),
+            "fin_stats": fin_stats,
+            "unknown_fin_ops": fin_stats.get("unrecognized_names", []),
+            "log_events": {"fin": fin_stats.pop("log_events", {})},
+        },
     }
+
+
+def parse_full_statement_arrow(
+    file_path: str,
+    mode: Optional[str] = None,
+    order: str = "source",
+    statement_filter: Optional[StatementFilter] = None,
+    enrich_instruments: bool = False,
+):
+    """
+    То же, что parse_full_statement, но операции возвращаются как pyarrow.Table
+    с типизированными колонками (см. src.services.columnar).
+    Заголовок и meta лежат в метаданных схемы: columnar.statement_metadata(table).
+    """
+    header, ops, meta, _ = _parse_statement(
+        file_path, mode=mode, order=order,
+        statement_filter=statement_filter, enrich_instruments=enrich_instruments,
+    )
+    return operations_to_arrow(ops, metadata={**header, "meta": meta})
@@ -0,0 +1,221 @@
+# src/services/http_cache.py
+"""
+Сжатие и условные ответы для /parse-report.
+
+ETag — sha256 содержимого загруженной выписки + версия парсера + параметры запроса,
+поэтому повторная отправка той же выписки с If-None-Match получает 304 без разбора,
+а без него — готовое сжатое тело из LRU-кэша, если он включён (PARSER_RESPONSE_CACHE_BYTES).
+ETag слабый (W/"…"): тела в разных Content-Encoding побайтно различаются, но равнозначны,
+и 304 по ETag, полученному с gzip, верен и для ответа без сжатия. If-None-Match: * не
+поддерживается — у POST /parse-report нет «текущего представления», с которым его сравнивать.
+
+Кодировка выбирается по Accept-Encoding: zstd и br — если установлены пакеты
+zstandard / brotli, gzip — всегда. Сжатие выполняется вне event loop (asyncio.to_thread).
+
+Переменные окружения:
+  PARSER_VERSION               — метка версии в ETag; к ней всегда добавляется отпечаток исходников
+                                 пакета src и правил классификации, так что деплой с исправлением
+                                 парсера меняет ETag и без ручной смены версии
+  PARSER_RESPONSE_CACHE_BYTES  — лимит LRU-кэша тел ответов, байт (по умолчанию 0 — кэш выключен)
+  PARSER_COMPRESS_MIN_BYTES    — ответы меньше порога не сжимаются
+  PARSER_GZIP_LEVEL            — уровень gzip (по умолчанию 6)
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import src.constants
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - зависит от окружения
+    brotli = None
+
+PARSER_VERSION = os.getenv("PARSER_VERSION", "1.0")
+RESPONSE_CACHE_BYTES = int(os.getenv("PARSER_RESPONSE_CACHE_BYTES", "0"))
+# корень пакета src: его исходники входят в отпечаток версии парсера
+_PACKAGE_ROOT = Path(src.constants.__file__).resolve().parent
+COMPRESS_MIN_BYTES = int(os.getenv("PARSER_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("PARSER_GZIP_LEVEL", "6"))
+
+# порядок предпочтения при равных q
+ENCODING_PREFERENCE = ("zstd", "br", "gzip")
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return tuple(
+        e for e in ENCODING_PREFERENCE
+        if (e == "zstd" and zstandard is not None) or (e == "br" and brotli is not None) or e == "gzip"
+    )
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Лучшая доступная кодировка из Accept-Encoding (с учётом q и '*'); None — без сжатия."""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for enc in available_encodings():
+        q = weights.get(enc, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=5)
+    return body
+
+
+def _source_digest(root: Path = _PACKAGE_ROOT) -> str:
+    """sha256 исходников пакета (кроме devtools): любая правка кода парсеров меняет результат."""
+    h = hashlib.sha256()
+    for path in sorted(root.rglob("*.py")):
+        rel = path.relative_to(root)
+        if rel.parts[0] == "devtools":
+            continue
+        h.update(rel.as_posix().encode("utf-8") + b"\0")
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def _rules_digest() -> str:
+    """Отпечаток правил классификации в том виде, в каком они загружены (включая обработчики)."""
+    rules: Dict[str, Any] = {}
+    for name in ("VALID_OPERATIONS", "SKIP_OPERATIONS", "OPERATION_TYPE_MAP", "CURRENCY_DICT"):
+        value = getattr(src.constants, name, ())
+        if isinstance(value, dict):
+            rules[name] = sorted((str(k), str(v)) for k, v in value.items())
+        else:
+            rules[name] = sorted(map(str, value))
+    handlers = getattr(src.constants, "SPECIAL_OPERATION_HANDLERS", {})
+    rules["SPECIAL_OPERATION_HANDLERS"] = sorted(
+        (str(k), f"{getattr(v, '__module__', '')}.{getattr(v, '__qualname__', repr(v))}") for k, v in handlers.items()
+    )
+    return hashlib.sha256(json.dumps(rules, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def parser_version() -> str:
+    """
+    PARSER_VERSION + отпечаток исходников и правил. Считается один раз на процесс:
+    код меняется только с перезапуском, а он и сбрасывает кэш.
+    Первый вызов читает все исходники пакета — сервис делает его при старте вне event loop.
+    """
+    try:
+        code = _source_digest()
+    except OSError:
+        # исходники недоступны (например, запуск из zip) — ETag не должен переживать процесс
+        code = uuid.uuid4().hex
+    return f"{PARSER_VERSION}+{code[:8]}.{_rules_digest()[:8]}"
+
+
+def make_etag(content_digest: str, params: Dict[str, Any]) -> str:
+    """Слабый ETag ответа: один для всех Content-Encoding одного и того же результата."""
+    payload = json.dumps([content_digest, parser_version(), params], ensure_ascii=False, sort_keys=True, default=str)
+    return 'W/"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: список ETag через запятую; слабое сравнение (W/ не учитывается), '*' не совпадает."""
+    if not if_none_match:
+        return False
+    value = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == value for tag in if_none_match.split(","))
+
+
+# тело, media_type, Content-Encoding (None — без сжатия)
+CachedBody = Tuple[bytes, str, Optional[str]]
+
+
+class ResponseCache:
+    """LRU тел ответов (уже сжатых) по (ETag, запрошенная кодировка), ограниченный суммарным размером."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Tuple[str, str], CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "not_modified": 0}
+
+    def get(self, etag: str, encoding: Optional[str]) -> Optional[CachedBody]:
+        with self._lock:
+            item = self._items.get((etag, encoding or "identity"))
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            self._items.move_to_end((etag, encoding or "identity"))
+            self._stats["hits"] += 1
+            return item
+
+    def put(self, etag: str, encoding: Optional[str], item: CachedBody) -> None:
+        body = item[0]
+        if len(body) > self.max_bytes:
+            return
+        key = (etag, encoding or "identity")
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._items[key] = item
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted[0])
+                self._stats["evictions"] += 1
+
+    def note_not_modified(self) -> None:
+        with self._lock:
+            self._stats["not_modified"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "encodings": list(available_encodings()),
+                "parser_version": parser_version(),
+            }
+
+
+RESPONSES = ResponseCache(RESPONSE_CACHE_BYTES)
+
+
+def encode_body(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Сжимает тело, если оно не меньше COMPRESS_MIN_BYTES; возвращает (тело, фактическая кодировка)."""
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    return compress(body, encoding), encoding
@@ -0,0 +1,242 @@
+# src/services/instrument_index.py
+"""
+Локальный справочник инструментов: ISIN <-> рег. номер <-> наименование <-> тикер.
+
+Справочник пополняется из каждой разобранной выписки (сделки дают связку
+наименование/ISIN/рег. номер, финансовые операции — ISIN и рег. номер из комментария)
+и отвечает на запросы словарными lookup'ами. По нему операции дообогащаются:
+купон или погашение, в комментарии которых есть только рег. номер, получают ISIN,
+а тикер подставляется для всех операций по инструменту, если он известен.
+
+PARSER_INSTRUMENT_INDEX — путь к JSON-файлу: справочник переживает перезапуск и
+может быть дополнен вручную (например, тикерами, которых в выписках ВТБ нет).
+Файл общий для процессов (воркеры CLI, несколько воркеров сервера): save() под
+файловой блокировкой перечитывает его и сливает с записями процесса.
+PARSER_INSTRUMENT_LEARN=1 — пополнять справочник из каждой разобранной выписки;
+по умолчанию выключено, и разбор не трогает общее состояние и файл.
+"""
+from __future__ import annotations
+import contextlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - не POSIX
+    fcntl = None
+
+from src.OperationDTO import OperationDTO
+from src.constants import norm_str
+from src.utils import logger
+
+FIELDS = ("isin", "reg_number", "name", "ticker")
+
+
+def _keys(isin: str = "", reg_number: str = "", name: str = "", ticker: str = "") -> List[tuple]:
+    keys = []
+    if isin:
+        keys.append(("isin", isin.upper()))
+    if reg_number:
+        keys.append(("reg_number", reg_number.upper()))
+    if ticker:
+        keys.append(("ticker", ticker.upper()))
+    if name:
+        keys.append(("name", norm_str(name)))
+    return keys
+
+
+class InstrumentIndex:
+    """
+    Записи справочника и индекс (поле, нормализованное значение) -> номер записи.
+    Конфликтующие связки (ISIN уже привязан к другой записи) не перезаписываются.
+    """
+
+    def __init__(self, path: Optional[str] = None, learning: bool = False):
+        self.path = path
+        # пополнять ли справочник из разобранных выписок (см. full_statement)
+        self.learning = learning
+        self._records: List[Dict[str, str]] = []
+        self._index: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        # растёт при каждом изменении справочника
+        self.generation = 0
+
+    @classmethod
+    def from_env(cls) -> "InstrumentIndex":
+        learning = os.getenv("PARSER_INSTRUMENT_LEARN", "0").lower() in ("1", "true", "yes")
+        return cls(os.getenv("PARSER_INSTRUMENT_INDEX") or None, learning)
+
+    def _read_file(self) -> List[Dict[str, str]]:
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать справочник инструментов %s: %s", self.path, e)
+            return []
+        return [{k: str(rec.get(k) or "").strip() for k in FIELDS} for rec in data.get("instruments", [])]
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Межпроцессная блокировка на соседнем файле <path>.lock (без fcntl — только в процессе)."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        for rec in self._read_file():
+            self._observe(rec)
+        self._dirty = False
+
+    def _find(self, keys: Iterable[tuple]) -> Optional[int]:
+        for key in keys:
+            rid = self._index.get(key)
+            if rid is not None:
+                return rid
+        return None
+
+    def _observe(self, rec: Dict[str, str]) -> bool:
+        keys = _keys(**rec)
+        if not keys:
+            return False
+        rid = self._find(keys)
+        if rid is None:
+            rid = len(self._records)
+            self._records.append({k: "" for k in FIELDS})
+        target = self._records[rid]
+        changed = False
+        for field in FIELDS:
+            if rec.get(field) and not target[field]:
+                target[field] = rec[field]
+                changed = True
+        for key in _keys(**target):
+            if key not in self._index:
+                self._index[key] = rid
+                changed = True
+        if changed:
+            self._dirty = True
+            self.generation += 1
+        return changed
+
+    def observe(self, isin: str = "", reg_number: str = "", name: str = "", ticker: str = "") -> bool:
+        """Добавляет/дополняет запись; True — справочник изменился."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._observe({"isin": isin or "", "reg_number": reg_number or "", "name": name or "", "ticker": ticker or ""})
+
+    def resolve(self, isin: str = "", reg_number: str = "", name: str = "", ticker: str = "") -> Optional[Dict[str, str]]:
+        """Запись по любому из известных идентификаторов (копия) или None."""
+        with self._lock:
+            self._ensure_loaded()
+            rid = self._find(_keys(isin or "", reg_number or "", name or "", ticker or ""))
+            return dict(self._records[rid]) if rid is not None else None
+
+    def learn(self, instruments: Iterable[Dict[str, str]], operations: Iterable[OperationDTO]) -> int:
+        """Пополнение из выписки: связки из блока сделок и операции с ISIN и рег. номером сразу."""
+        added = 0
+        with self._lock:
+            self._ensure_loaded()
+            for rec in instruments:
+                added += self._observe({k: rec.get(k, "") for k in FIELDS})
+            for op in operations:
+                if op.isin and op.reg_number:
+                    added += self._observe({"isin": op.isin, "reg_number": op.reg_number, "name": "", "ticker": op.ticker or ""})
+        return added
+
+    def enrich(self, operations: Iterable[OperationDTO]) -> int:
+        """Дозаполняет isin / reg_number / ticker у операций; возвращает число изменённых."""
+        changed = 0
+        with self._lock:
+            self._ensure_loaded()
+            for op in operations:
+                if not (op.isin or op.reg_number or op.ticker):
+                    continue
+                rid = self._find(_keys(op.isin or "", op.reg_number or "", "", op.ticker or ""))
+                if rid is None:
+                    continue
+                rec = self._records[rid]
+                touched = False
+                for field in ("isin", "reg_number", "ticker"):
+                    if not getattr(op, field) and rec[field]:
+                        setattr(op, field, rec[field])
+                        touched = True
+                changed += touched
+        return changed
+
+    def save(self) -> None:
+        """
+        Сохраняет справочник в PARSER_INSTRUMENT_INDEX, если он изменился. Под файловой
+        блокировкой файл перечитывается и сливается со снимком записей — записи, сохранённые
+        другими процессами, не теряются (при конфликте связок побеждают уже известные здесь)
+        и затем подмешиваются в память. Ожидание блокировки и файловый ввод-вывод идут
+        без self._lock: resolve/enrich других запросов на это время не блокируются.
+        """
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            snapshot = [dict(rec) for rec in self._records]
+            # изменения после снимка снова выставят флаг и попадут в следующий save()
+            self._dirty = False
+
+        merged = InstrumentIndex(learning=self.learning)
+        merged._loaded = True
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self._file_lock():
+                for rec in snapshot + self._read_file():
+                    merged._observe(rec)
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump({"instruments": merged._records}, fh, ensure_ascii=False, indent=1)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить справочник инструментов %s: %s", self.path, e)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            with self._lock:
+                self._dirty = True
+            return
+
+        with self._lock:
+            dirty = self._dirty
+            for rec in merged._records:
+                self._observe(rec)
+            # подмешанное из файла в нём уже есть — новым изменением это не считается
+            self._dirty = dirty
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "instruments": len(self._records),
+                "with_isin": sum(1 for r in self._records if r["isin"]),
+                "with_ticker": sum(1 for r in self._records if r["ticker"]),
+                "generation": self.generation,
+                "learning": self.learning,
+                "path": self.path or "",
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._index.clear()
+            self._loaded = False
+            self._dirty = False
+            self.generation += 1
+
+
+INSTRUMENTS = InstrumentIndex.from_env()
@@ -0,0 +1,278 @@
+# src/services/jobs.py
+"""
+Асинхронная очередь задач парсинга для больших выписок.
+
+POST /jobs сохраняет загрузку и ставит задачу в ограниченную asyncio-очередь;
+фиксированный пул воркеров разбирает её через parse_full_statement в отдельных потоках.
+Состояние задач хранится в памяти или, если задан PARSER_JOB_DB, в локальной SQLite —
+тогда незавершённые задачи переживают перезапуск сервиса.
+
+Настройки (env):
+  PARSER_JOB_WORKERS     — число одновременных парсингов (2)
+  PARSER_JOB_QUEUE_SIZE  — ёмкость очереди; при переполнении submit бросает JobQueueFull (100).
+                           Задачи, поднятые из базы при старте, ставятся в очередь все,
+                           даже сверх ёмкости — новые submit отклоняются, пока она не разгрузится
+  PARSER_JOB_DIR         — каталог для загруженных файлов (<tmp>/vtb_parser_jobs)
+  PARSER_JOB_DB          — путь к SQLite для персистентного хранения (не задан -> только память)
+  PARSER_JOB_TTL         — сколько секунд хранить завершённые задачи (3600)
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.services.full_statement import parse_full_statement
+from src.utils import logger
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Очередь заполнена — клиенту следует повторить запрос позже."""
+
+
+@dataclass
+class Job:
+    id: str
+    filename: str
+    upload_path: str
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    # progress пишется из потока парсинга, а читается обработчиками запросов
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def set_progress(self, section: str, info: Dict[str, Any]) -> None:
+        with self._lock:
+            self.progress = {**self.progress, section: dict(info)}
+
+    def to_status(self) -> Dict[str, Any]:
+        """Публичное представление задачи без результата."""
+        with self._lock:
+            data = {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+            data["progress"] = {k: dict(v) for k, v in self.progress.items()}
+        data.pop("result", None)
+        data.pop("upload_path", None)
+        return data
+
+
+class MemoryJobStore:
+    """Хранилище задач в памяти процесса."""
+
+    persistent = False
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+
+class SqliteJobStore(MemoryJobStore):
+    """
+    Персистентное хранилище: каждая запись дублируется в SQLite.
+    Чтение идёт из памяти; при старте задачи поднимаются из базы.
+    """
+
+    persistent = True
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, filename TEXT, upload_path TEXT, status TEXT,"
+            " created_at REAL, started_at REAL, finished_at REAL,"
+            " progress TEXT, error TEXT, result TEXT)"
+        )
+        self._db.commit()
+        for row in self._db.execute(
+            "SELECT id, filename, upload_path, status, created_at, started_at, finished_at, progress, error, result FROM jobs"
+        ):
+            job = Job(
+                id=row[0], filename=row[1], upload_path=row[2], status=row[3],
+                created_at=row[4], started_at=row[5], finished_at=row[6],
+                progress=json.loads(row[7] or "{}"), error=row[8],
+                result=json.loads(row[9]) if row[9] else None,
+            )
+            self._jobs[job.id] = job
+
+    def save(self, job: Job) -> None:
+        super().save(job)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, job.filename, job.upload_path, job.status,
+                    job.created_at, job.started_at, job.finished_at,
+                    json.dumps(job.progress, ensure_ascii=False),
+                    job.error,
+                    json.dumps(job.result, ensure_ascii=False, default=str) if job.result is not None else None,
+                ),
+            )
+            self._db.commit()
+
+    def delete(self, job_id: str) -> None:
+        super().delete(job_id)
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+
+
+class JobManager:
+    def __init__(
+        self,
+        workers: int = 2,
+        queue_size: int = 100,
+        upload_dir: Optional[str] = None,
+        store: Optional[MemoryJobStore] = None,
+        ttl: float = 3600.0,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.upload_dir = Path(upload_dir or Path(tempfile.gettempdir()) / "vtb_parser_jobs")
+        self.store = store or MemoryJobStore()
+        self.ttl = ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # места, занятые submit'ами, которые ещё пишут загрузку на диск
+        self._reserved = 0
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        db_path = os.getenv("PARSER_JOB_DB")
+        return cls(
+            workers=int(os.getenv("PARSER_JOB_WORKERS", "2")),
+            queue_size=int(os.getenv("PARSER_JOB_QUEUE_SIZE", "100")),
+            upload_dir=os.getenv("PARSER_JOB_DIR") or None,
+            store=SqliteJobStore(db_path) if db_path else MemoryJobStore(),
+            ttl=float(os.getenv("PARSER_JOB_TTL", "3600")),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def is_full(self) -> bool:
+        """Новый submit сейчас будет отклонён — проверка до чтения загрузки в память."""
+        return self.queue_depth + self._reserved >= self.queue_size
+
+    async def start(self) -> None:
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        # ёмкость контролирует submit (с учётом резерва), сама очередь не ограничена:
+        # иначе поднятые после перезапуска задачи сверх ёмкости навсегда остались бы queued
+        self._queue = asyncio.Queue()
+        self._reserved = 0
+        # после перезапуска возвращаем в очередь всё, что не успело завершиться
+        for job in sorted(self.store.list(), key=lambda j: j.created_at):
+            if job.status in (JOB_QUEUED, JOB_RUNNING):
+                job.status = JOB_QUEUED
+                job.started_at = None
+                await asyncio.to_thread(self.store.save, job)
+                self._queue.put_nowait(job.id)
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info("Очередь задач запущена: workers=%s queue_size=%s persistent=%s",
+                    self.workers, self.queue_size, self.store.persistent)
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, filename: str, content: bytes) -> Job:
+        if self._queue is None:
+            raise RuntimeError("JobManager не запущен")
+        # место резервируется до первого await: параллельные submit не проскочат проверку вместе
+        if self.is_full:
+            raise JobQueueFull(f"Очередь заполнена ({self.queue_size})")
+        self._reserved += 1
+        try:
+            await asyncio.to_thread(self._purge_expired)
+            job_id = uuid.uuid4().hex
+            upload_path = self.upload_dir / f"{job_id}{Path(filename).suffix}"
+            try:
+                await asyncio.to_thread(upload_path.write_bytes, content)
+                job = Job(id=job_id, filename=filename, upload_path=str(upload_path))
+                await asyncio.to_thread(self.store.save, job)
+            except BaseException:
+                # задача не поставлена — загрузка не должна остаться на диске
+                upload_path.unlink(missing_ok=True)
+                raise
+            self._queue.put_nowait(job_id)
+        finally:
+            self._reserved -= 1
+        logger.info("Задача %s поставлена в очередь: %s (%s байт)", job_id, filename, len(content))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        for job in self.store.list():
+            if job.status in (JOB_DONE, JOB_FAILED) and job.finished_at and now - job.finished_at > self.ttl:
+                self.store.delete(job.id)
+
+    def _run(self, job: Job) -> Dict[str, Any]:
+        def on_progress(section: str, info: Dict[str, Any]) -> None:
+            job.set_progress(section, info)
+            self.store.save(job)
+
+        return parse_full_statement(job.upload_path, progress=on_progress)
+
+    async def _worker(self, n: int) -> None:
+        assert self._queue is not None
+        while True:
+            job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            try:
+                if job is None:
+                    continue
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                await asyncio.to_thread(self.store.save, job)
+                try:
+                    job.result = await asyncio.to_thread(self._run, job)
+                    job.status = JOB_DONE
+                except Exception as e:
+                    logger.exception("Задача %s завершилась ошибкой: %s", job_id, e)
+                    job.status = JOB_FAILED
+                    job.error = str(e)
+                job.finished_at = time.time()
+                # json.dumps результата и commit SQLite — вне event loop
+                await asyncio.to_thread(self.store.save, job)
+                Path(job.upload_path).unlink(missing_ok=True)
+                logger.info("Задача %s: %s за %.2fs", job_id, job.status, job.finished_at - job.started_at)
+            finally:
+                self._queue.task_done()
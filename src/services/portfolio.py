@@ -0,0 +1,213 @@
+# src/services/portfolio.py
+"""
+Позиции по инструментам и остатки денежных средств по валютам поверх разобранных операций.
+
+Вход — операции parse_full_statement (OperationDTO или словари to_dict()).
+Суммы по инструментам и валютам считаются векторно (groupby / cumsum по DataFrame),
+посделочно проходится только FIFO-учёт лотов, и только по строкам buy/sale.
+
+Знаки денежного потока:
+  buy  — −(payment_sum + aci), sale — +(payment_sum + aci);
+  комиссия сделки (commission) — отдельный расход, если trade_commissions=True;
+  финансовые операции — payment_sum как в выписке (расходы уже отрицательные).
+Остатки — обороты за период выписки: входящее сальдо в выписке не публикуется,
+его можно передать через opening_cash.
+"""
+from __future__ import annotations
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.OperationDTO import OperationDTO
+from src.parsers.filters import parse_date_bound
+from src.utils import parse_datetime, to_int_safe, to_num_safe
+
+TRADE_TYPES = ("buy", "sale")
+# доходы и возвраты номинала, которые относятся к инструменту
+INSTRUMENT_INCOME_TYPES = ("coupon", "dividend", "amortization", "repayment")
+
+_COLUMNS = ("date", "operation_type", "payment_sum", "currency", "isin", "reg_number", "quantity", "aci", "commission")
+
+
+def _frame(operations: Iterable[Union[OperationDTO, Dict[str, Any]]]) -> pd.DataFrame:
+    rows = []
+    for op in operations:
+        if isinstance(op, OperationDTO):
+            rows.append((
+                op.parsed_date, op.operation_type, op.payment_sum, op.currency, op.isin,
+                op.reg_number, op.quantity, op.aci, op.commission,
+            ))
+        else:
+            rows.append((
+                parse_datetime(op.get("date")), op.get("operation_type"), op.get("payment_sum"), op.get("currency"),
+                op.get("isin"), op.get("reg_number"), op.get("quantity"), op.get("aci"), op.get("commission"),
+            ))
+    df = pd.DataFrame.from_records(rows, columns=list(_COLUMNS))
+    for col in ("payment_sum", "aci", "commission"):
+        df[col] = [to_num_safe(v) for v in df[col]]
+    df["quantity"] = np.asarray([to_int_safe(v) for v in df["quantity"]], dtype=np.int64)
+    for col in ("operation_type", "currency", "isin", "reg_number"):
+        df[col] = df[col].fillna("").astype(object).map(lambda v: str(v).strip())
+    return df
+
+
+def _fifo(trades: pd.DataFrame) -> Dict[str, Any]:
+    """
+    FIFO по сделкам одного инструмента (в хронологическом порядке).
+    Стоимость лота — сумма сделки + НКД + комиссия; продажа закрывает самые старые лоты.
+    Продажи сверх открытых лотов (история неполная) попадают в unmatched_quantity.
+    """
+    lots: Deque[List[float]] = deque()  # [количество, стоимость за штуку]
+    realized = 0.0
+    unmatched = 0
+    for op_type, qty, amount, aci, commission in zip(
+        trades["operation_type"], trades["quantity"], trades["payment_sum"], trades["aci"], trades["commission"]
+    ):
+        qty = abs(int(qty))
+        if qty == 0:
+            continue
+        if op_type == "buy":
+            lots.append([qty, (abs(amount) + aci + commission) / qty])
+            continue
+        proceeds = abs(amount) + aci - commission
+        left = qty
+        cost = 0.0
+        while left and lots:
+            lot = lots[0]
+            take = min(left, lot[0])
+            cost += take * lot[1]
+            lot[0] -= take
+            left -= take
+            if lot[0] == 0:
+                lots.popleft()
+        if left:
+            unmatched += left
+            proceeds *= (qty - left) / qty
+        realized += proceeds - cost
+    return {
+        "cost_basis": sum(q * p for q, p in lots),
+        "open_lots": len(lots),
+        "realized_pnl": realized,
+        "unmatched_quantity": unmatched,
+    }
+
+
+def _round(v: float) -> float:
+    return round(float(v), 6)
+
+
+def build_portfolio(
+    operations: Iterable[Union[OperationDTO, Dict[str, Any]]],
+    as_of: Any = None,
+    opening_cash: Optional[Dict[str, float]] = None,
+    trade_commissions: bool = True,
+) -> Dict[str, Any]:
+    """
+    Позиции, FIFO-себестоимость и остатки по валютам на дату as_of (включительно).
+    as_of — datetime или строка ('31.12.2024', ISO); None — по всем операциям.
+    opening_cash — входящие остатки по валютам, прибавляются к оборотам.
+    trade_commissions — вычитать комиссии сделок из денег (False, если брокер
+    дублирует их отдельными операциями «Вознаграждение Брокера»).
+    Возвращает {"as_of", "positions": [...], "cash": [...], "meta": {...}}.
+    """
+    df = _frame(operations)
+    limit = parse_date_bound(as_of, end_of_day=True)
+    no_date = int(df["date"].isna().sum())
+    df = df[df["date"].notna()]
+    if limit is not None:
+        df = df[df["date"] <= limit]
+    after_as_of = len(df)
+    df = df.sort_values("date", kind="stable").reset_index(drop=True)
+
+    is_trade = df["operation_type"].isin(TRADE_TYPES).to_numpy()
+    is_buy = df["operation_type"].eq("buy").to_numpy()
+    gross = df["payment_sum"].abs() + df["aci"]
+    df["cash_flow"] = np.where(is_trade, np.where(is_buy, -gross, gross), df["payment_sum"])
+    if trade_commissions:
+        df["cash_flow"] -= np.where(is_trade, df["commission"], 0.0)
+    df["qty_delta"] = np.where(is_trade, np.where(is_buy, df["quantity"].abs(), -df["quantity"].abs()), 0)
+    df["instrument"] = df["isin"].where(df["isin"] != "", df["reg_number"])
+
+    # ---- позиции ----
+    inst = df[df["instrument"] != ""]
+    positions: List[Dict[str, Any]] = []
+    if len(inst):
+        running = inst.groupby("instrument", sort=False)["qty_delta"].cumsum()
+        by_inst = inst.assign(running=running).groupby("instrument", sort=True)
+        summary = by_inst.agg(
+            quantity=("qty_delta", "sum"),
+            min_running=("running", "min"),
+            first_date=("date", "min"),
+            last_date=("date", "max"),
+        )
+        income = (
+            inst[inst["operation_type"].isin(INSTRUMENT_INCOME_TYPES)]
+            .pivot_table(index="instrument", columns="operation_type", values="payment_sum", aggfunc="sum")
+            .reindex(index=summary.index, columns=list(INSTRUMENT_INCOME_TYPES))
+            .fillna(0.0)
+        )
+        trades = inst[is_trade[inst.index]]
+        trade_totals = trades.groupby("instrument")[["commission", "aci"]].sum().reindex(summary.index).fillna(0.0)
+        # последние непустые реквизиты инструмента (GroupBy.last пропускает NaN)
+        ids = (
+            inst[["instrument", "isin", "reg_number", "currency"]]
+            .replace("", np.nan)
+            .groupby("instrument")
+            .last()
+            .reindex(summary.index)
+            .fillna("")
+        )
+        fifo = {name: _fifo(group) for name, group in trades.groupby("instrument", sort=False)}
+
+        for name, row in summary.iterrows():
+            f = fifo.get(name, {"cost_basis": 0.0, "open_lots": 0, "realized_pnl": 0.0, "unmatched_quantity": 0})
+            qty = int(row["quantity"])
+            positions.append({
+                "isin": ids.at[name, "isin"],
+                "reg_number": ids.at[name, "reg_number"],
+                "currency": ids.at[name, "currency"],
+                "quantity": qty,
+                "cost_basis": _round(f["cost_basis"]),
+                "avg_price": _round(f["cost_basis"] / qty) if qty > 0 else 0.0,
+                "open_lots": f["open_lots"],
+                "realized_pnl": _round(f["realized_pnl"]),
+                "coupons": _round(income.at[name, "coupon"]),
+                "dividends": _round(income.at[name, "dividend"]),
+                "amortizations": _round(income.at[name, "amortization"]),
+                "repayments": _round(income.at[name, "repayment"]),
+                "trade_commissions": _round(trade_totals.at[name, "commission"]),
+                "aci": _round(trade_totals.at[name, "aci"]),
+                "first_date": row["first_date"].isoformat(),
+                "last_date": row["last_date"].isoformat(),
+                # позиция уходила в минус — в выписке нет части истории покупок
+                "incomplete_history": bool(row["min_running"] < 0 or f["unmatched_quantity"] > 0),
+            })
+
+    # ---- деньги ----
+    cash: List[Dict[str, Any]] = []
+    opening_cash = opening_cash or {}
+    flows = df[df["currency"] != ""]
+    by_type = flows.pivot_table(index="currency", columns="operation_type", values="cash_flow", aggfunc="sum").fillna(0.0)
+    for cur in sorted(set(by_type.index) | set(opening_cash)):
+        turnover = by_type.loc[cur] if cur in by_type.index else pd.Series(dtype=float)
+        opening = to_num_safe(opening_cash.get(cur, 0.0))
+        cash.append({
+            "currency": cur,
+            "opening": _round(opening),
+            "turnover": _round(turnover.sum()),
+            "balance": _round(opening + turnover.sum()),
+            "by_type": {k: _round(v) for k, v in turnover.items() if v},
+        })
+
+    return {
+        "as_of": limit.isoformat() if limit is not None else None,
+        "positions": positions,
+        "cash": cash,
+        "meta": {
+            "operations_used": after_as_of,
+            "skipped_no_date": no_date,
+            "trade_commissions_in_cash": trade_commissions,
+        },
+    }
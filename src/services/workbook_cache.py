@@ -0,0 +1,184 @@
+# src/services/workbook_cache.py
+"""
+Дисковый кэш декодированных сеток xlsx.
+
+Распаковка и XML-разбор xlsx — самая дорогая часть парсинга, а при изменении правил
+в src/constants.py архив выписок приходится разбирать заново. Поэтому сетка каждого
+файла сохраняется под ключом sha256 содержимого и при повторном разборе читается
+без openpyxl.
+
+Формат записи — .npz с типизированными массивами (вид ячейки, числа, даты, строки
+одним UTF-8 блоком) и читается с allow_pickle=False: подложенный в каталог файл может
+испортить только сетку, но не выполнить код. Сетки с ячейками других типов
+(время, Decimal и т.п.) не кэшируются. pickle из src.services.grid остаётся только
+для передачи сетки между процессами одного запуска.
+
+Кэш включается переменной PARSER_GRID_CACHE_DIR (каталог); без неё — обычное чтение.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.parsers.sheet import read_sheet
+from src.utils import logger
+
+# меняется при несовместимых изменениях формата сетки или способа чтения xlsx
+CACHE_VERSION = 3
+
+_stats = {"hits": 0, "misses": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def cache_dir() -> Optional[Path]:
+    d = os.getenv("PARSER_GRID_CACHE_DIR")
+    return Path(d) if d else None
+
+
+def file_digest(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _entry_path(root: Path, digest: str) -> Path:
+    return root / digest[:2] / f"{digest}.v{CACHE_VERSION}.npz"
+
+
+def _bump(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+# виды ячеек в массиве kinds
+_EMPTY, _STR, _FLOAT, _INT, _BOOL, _DATETIME = range(6)
+
+
+def _encode_grid(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Раскладывает object-сетку по типизированным массивам; ValueError — сетку не кэшировать."""
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        raise ValueError("сетка с нестандартным индексом")
+    if list(df.columns) != list(range(df.shape[1])):
+        raise ValueError("сетка с нестандартными колонками")
+    cells = df.to_numpy(dtype=object).ravel()
+    kinds = np.empty(len(cells), dtype=np.uint8)
+    strs, floats, ints, dates = [], [], [], []
+    for i, v in enumerate(cells):
+        t = type(v)
+        if t is str:
+            kinds[i] = _STR
+            strs.append(v)
+        elif t is float:
+            kinds[i] = _FLOAT
+            floats.append(v)
+        elif t is int:
+            kinds[i] = _INT
+            ints.append(v)
+        elif v is None:
+            kinds[i] = _EMPTY
+        elif t is bool:
+            kinds[i] = _BOOL
+            ints.append(int(v))
+        elif isinstance(v, datetime) and v.tzinfo is None:
+            kinds[i] = _DATETIME
+            dates.append(v)
+        else:
+            raise ValueError(f"ячейка типа {t.__name__}")
+    lengths = np.fromiter((len(x) for x in strs), dtype=np.int64, count=len(strs))
+    return {
+        "shape": np.array(df.shape, dtype=np.int64),
+        "kinds": kinds,
+        "floats": np.array(floats, dtype=np.float64),
+        "ints": np.array(ints, dtype=np.int64),  # OverflowError для чисел вне int64
+        "dates": np.array(dates, dtype="datetime64[us]"),
+        "str_lengths": lengths,
+        "str_blob": np.frombuffer("".join(strs).encode("utf-8"), dtype=np.uint8),
+    }
+
+
+def _decode_grid(arrays) -> pd.DataFrame:
+    rows, cols = (int(x) for x in arrays["shape"])
+    kinds = arrays["kinds"]
+    if kinds.shape != (rows * cols,):
+        raise ValueError("размер сетки не совпадает с числом ячеек")
+    cells = np.empty(len(kinds), dtype=object)
+    cells[kinds == _EMPTY] = None
+    cells[kinds == _FLOAT] = arrays["floats"].astype(object)
+    ints = arrays["ints"]
+    int_kinds = kinds[(kinds == _INT) | (kinds == _BOOL)]
+    cells[kinds == _INT] = ints[int_kinds == _INT].astype(object)
+    cells[kinds == _BOOL] = ints[int_kinds == _BOOL].astype(bool).astype(object)
+    cells[kinds == _DATETIME] = arrays["dates"].astype("datetime64[us]").astype(object)
+    text = arrays["str_blob"].tobytes().decode("utf-8")
+    ends = np.cumsum(arrays["str_lengths"]).tolist()
+    strs = np.empty(len(ends), dtype=object)
+    strs[:] = [text[a:b] for a, b in zip([0] + ends[:-1], ends)]
+    cells[kinds == _STR] = strs
+    return pd.DataFrame(cells.reshape(rows, cols), dtype=object)
+
+
+def _read_entry(entry: Path) -> pd.DataFrame:
+    with np.load(entry, allow_pickle=False) as arrays:
+        return _decode_grid(arrays)
+
+
+def _write_entry(path: Path, df: pd.DataFrame) -> None:
+    arrays = _encode_grid(df)
+    with open(path, "wb") as fh:
+        np.savez(fh, **arrays)
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return {**_stats, "dir": str(cache_dir() or "")}
+
+
+def load_workbook_grid(source: Union[str, Any, pd.DataFrame], digest: Optional[str] = None) -> pd.DataFrame:
+    """
+    Сетка ячеек выписки с учётом дискового кэша.
+    digest — sha256 содержимого, если уже посчитан вызывающим (иначе считается здесь).
+    """
+    root = cache_dir()
+    if root is None or isinstance(source, pd.DataFrame) or not isinstance(source, (str, Path)):
+        return read_sheet(source)
+
+    try:
+        digest = digest or file_digest(source)
+    except OSError:
+        return read_sheet(source)
+
+    entry = _entry_path(root, digest)
+    if entry.exists():
+        try:
+            df = _read_entry(entry)
+            _bump("hits")
+            return df
+        except Exception as e:
+            _bump("errors")
+            logger.warning("Повреждённая запись кэша %s: %s — читаем xlsx заново", entry, e)
+
+    _bump("misses")
+    df = read_sheet(source)
+    # кэш — best effort: любая ошибка упаковки или записи не должна ронять разбор
+    tmp = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        _write_entry(tmp, df)
+        os.replace(tmp, entry)
+    except Exception as e:
+        _bump("errors")
+        logger.warning("Не удалось сохранить сетку в кэш %s: %s", entry, e)
+    finally:
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+    return df
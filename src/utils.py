@@ -1,12 +1,35 @@
 from __future__ import annotations
+import atexit
+import queue
 import re
 import logging
+import logging.handlers
 import os
+from collections import Counter
 from datetime import datetime
-from typing import Any, Optional
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_queue_listener(log_queue: queue.SimpleQueue, target: logging.Handler) -> None:
+    global _queue_listener
+    _queue_listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+    _queue_listener.start()
+
+
+def _stop_queue_listener() -> None:
+    if _queue_listener is not None:
+        _queue_listener.stop()
 
 
 def get_logger(name: str = "parser_vtb") -> logging.Logger:
+    """
+    PARSER_LOGLEVEL — уровень (DEBUG по умолчанию).
+    PARSER_LOG_QUEUE=1 — неблокирующий режим: записи кладутся в очередь (QueueHandler),
+    а в поток вывода их пишет отдельный поток QueueListener.
+    """
     level_name = os.getenv("PARSER_LOGLEVEL", "DEBUG").upper()
     level = getattr(logging, level_name, logging.INFO)
     logger = logging.getLogger(name)
@@ -14,12 +37,63 @@ def get_logger(name: str = "parser_vtb") -> logging.Logger:
         handler = logging.StreamHandler()
         fmt = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
         handler.setFormatter(logging.Formatter(fmt))
+        if os.getenv("PARSER_LOG_QUEUE", "").lower() in ("1", "true", "yes"):
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            target = handler
+            _start_queue_listener(log_queue, target)
+            atexit.register(_stop_queue_listener)
+            # поток слушателя не переживает fork — в дочерних процессах пулов запускаем свой
+            os.register_at_fork(after_in_child=lambda: _start_queue_listener(log_queue, target))
+            handler = logging.handlers.QueueHandler(log_queue)
         logger.addHandler(handler)
     logger.setLevel(level)
     return logger
 
 logger = get_logger()
 
+# Сколько одинаковых построчных сообщений писать на секцию выписки; -1 — без ограничения
+ROW_LOG_LIMIT = int(os.getenv("PARSER_ROW_LOG_LIMIT", "5"))
+
+
+class RowEventLog:
+    """
+    Построчные события парсера в рамках одной секции выписки.
+    Каждое событие считается по ключу; в лог пишутся только первые limit сообщений
+    каждого ключа, остальные лишь увеличивают счётчик. flush() выводит одну сводную строку.
+    """
+
+    def __init__(self, section: str, limit: Optional[int] = None, log: Optional[logging.Logger] = None):
+        self.section = section
+        self.limit = ROW_LOG_LIMIT if limit is None else limit
+        self.log = log or logger
+        self.counts: Counter = Counter()
+
+    def event(self, key: str, level: int, msg: str, *args: Any) -> None:
+        self.counts[key] += 1
+        n = self.counts[key]
+        if not self.log.isEnabledFor(level):
+            return
+        if self.limit < 0 or n <= self.limit:
+            self.log.log(level, msg, *args)
+        elif n == self.limit + 1:
+            self.log.log(level, "[%s] дальнейшие события '%s' только считаются (лимит %s)", self.section, key, self.limit)
+
+    def suppressed(self) -> int:
+        if self.limit < 0:
+            return 0
+        return sum(max(0, c - self.limit) for c in self.counts.values())
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+    def flush(self) -> None:
+        if not self.counts:
+            return
+        self.log.info(
+            "[%s] события по строкам: %s (подавлено сообщений: %s)",
+            self.section, ", ".join(f"{k}={v}" for k, v in self.counts.items()), self.suppressed(),
+        )
+
 DATE_RE = re.compile(r"\d{2}[,.]\d{2}[,.]\d{4}")
 
 def format_date_from_match(value: str) -> str:
@@ -38,6 +112,33 @@ def extract_date(value: Any) -> Optional[str]:
 
     return None
 
+_DATETIME_FORMATS = ("%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S")
+
+
+@lru_cache(maxsize=65536)
+def _parse_datetime_str(s: str) -> Optional[datetime]:
+    for fmt in _DATETIME_FORMATS:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        return None
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """
+    datetime как есть; строки 'dd.mm.yyyy[ HH:MM[:SS]]' и ISO — в datetime (с кэшем по строке);
+    пустые и нераспознанные значения -> None.
+    """
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    return _parse_datetime_str(str(value).strip())
+
 def to_num_safe(v: Any) -> float:
     """
     Пытаемся превратить значение в float, возвращаем 0.0 при ошибке / пустом значении.
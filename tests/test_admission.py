@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from src.services.admission import AdmissionController, AdmissionRejected
+
+
+def test_too_large_rejected_immediately():
+    async def scenario():
+        ctl = AdmissionController(max_inflight_bytes=100)
+        with pytest.raises(AdmissionRejected) as exc:
+            async with ctl.admit(101):
+                pass
+        return ctl, exc.value
+
+    ctl, err = asyncio.run(scenario())
+    assert err.status_code == 413
+    assert ctl.rejected_too_large == 1
+    assert ctl.inflight == 0
+
+
+def test_waiting_queue_overflow_is_429():
+    async def scenario():
+        ctl = AdmissionController(max_inflight=1, max_waiting=1, wait_timeout=5)
+        release = asyncio.Event()
+        entered = asyncio.Event()
+
+        async def hold():
+            async with ctl.admit(1):
+                entered.set()
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await entered.wait()
+        waiter = asyncio.create_task(hold())
+        while not ctl.waiting:
+            await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            async with ctl.admit(1):
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return ctl, exc.value
+
+    ctl, err = asyncio.run(scenario())
+    assert err.status_code == 429
+    assert ctl.admitted_total == 2
+    assert ctl.inflight == 0 and ctl.inflight_bytes == 0 and ctl.waiting == 0
+
+
+def test_wait_timeout_is_503():
+    async def scenario():
+        ctl = AdmissionController(max_inflight=1, max_waiting=4, wait_timeout=0.05)
+        async with ctl.admit(1):
+            with pytest.raises(AdmissionRejected) as exc:
+                async with ctl.admit(1):
+                    pass
+        return ctl, exc.value
+
+    ctl, err = asyncio.run(scenario())
+    assert err.status_code == 503
+    assert ctl.rejected_timeout == 1
+    assert ctl.waiting == 0 and ctl.inflight == 0
+
+
+def test_byte_budget_limits_concurrency():
+    async def scenario():
+        ctl = AdmissionController(max_inflight=10, max_inflight_bytes=100, wait_timeout=5)
+        peak = 0
+
+        async def parse():
+            nonlocal peak
+            async with ctl.admit(40):
+                peak = max(peak, ctl.inflight_bytes)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(parse() for _ in range(6)))
+        return ctl, peak
+
+    ctl, peak = asyncio.run(scenario())
+    assert peak <= 100
+    assert ctl.admitted_total == 6
+    assert ctl.inflight_bytes == 0
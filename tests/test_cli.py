@@ -0,0 +1,93 @@
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from src import cli
+from src.devtools.synthetic import write_statement
+
+
+@pytest.fixture(scope="module")
+def statements(tmp_path_factory):
+    root = tmp_path_factory.mktemp("in")
+    (root / "nested").mkdir()
+    paths = [
+        write_statement(str(root / "a.xlsx"), 30, 20, seed=1),
+        write_statement(str(root / "nested" / "b.xlsx"), 25, 15, seed=2),
+        write_statement(str(root / "nested" / "a.xlsx"), 10, 10, seed=3),
+    ]
+    (root / "~$a.xlsx").write_bytes(b"lock file")
+    return root, paths
+
+
+def _journal(out):
+    with (out / cli.JOURNAL_NAME).open(encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def _summary(capsys):
+    return json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+
+
+def test_collect_inputs_dedups_and_skips_temp(statements):
+    root, paths = statements
+    found = cli.collect_inputs([str(root), str(root / "a.xlsx"), str(root / "**" / "*.xlsx")])
+    assert sorted(map(str, found)) == sorted(paths)
+
+
+def test_parallel_parquet_run_then_resume(statements, tmp_path, capsys):
+    root, paths = statements
+    out = tmp_path / "out"
+    assert cli.main([str(root), "-o", str(out), "-f", "parquet", "-j", "2"]) == 0
+    first = _summary(capsys)
+    journal = _journal(out)
+    assert first["files"] == 3 and first["failed"] == 0
+    assert sorted(r["file"] for r in journal) == sorted(paths)
+    assert {r["status"] for r in journal} == {"ok"}
+
+    table = pq.read_table(out / "operations.parquet")
+    assert table.num_rows == first["combined_rows"] == sum(r["rows"] for r in journal)
+    assert {"account_id", "source_file"} <= set(table.column_names)
+    assert sorted(set(table.column("source_file").to_pylist())) == sorted(paths)
+    # одинаковый stem у двух выписок -> разные части
+    assert len(list((out / cli.PARTS_DIR).glob("a*.ndjson"))) == 2
+
+    assert cli.main([str(root), "-o", str(out), "-f", "parquet", "--resume", "-j", "2"]) == 0
+    resumed = _summary(capsys)
+    assert resumed["files"] == 0 and resumed["skipped_resume"] == 3
+    assert resumed["combined_rows"] == first["combined_rows"]
+    assert len(_journal(out)) == 3
+
+
+def test_resume_reprocesses_changed_and_failed(statements, tmp_path, capsys):
+    root, paths = statements
+    out = tmp_path / "out"
+    assert cli.main([str(root), "-o", str(out), "-f", "ndjson", "-j", "1"]) == 0
+    capsys.readouterr()
+    journal = _journal(out)
+    # обрываем журнал посередине записи и помечаем одну выписку как упавшую
+    failed = dict(journal[1], status="error")
+    with (out / cli.JOURNAL_NAME).open("w", encoding="utf-8") as fh:
+        fh.write(json.dumps(journal[0]) + "\n" + json.dumps(failed) + "\n" + json.dumps(journal[2])[:20])
+
+    assert cli.main([str(root), "-o", str(out), "-f", "ndjson", "--resume"]) == 0
+    summary = _summary(capsys)
+    assert summary["skipped_resume"] == 1 and summary["files"] == 2
+
+    # смена формата — повторная обработка всех файлов
+    assert cli.main([str(root), "-o", str(out), "-f", "json", "--resume"]) == 0
+    assert _summary(capsys)["files"] == 3
+    assert len(list(out.glob("*.json"))) == 3
+
+
+def test_combine_parts_streams_csv(tmp_path):
+    parts = tmp_path / cli.PARTS_DIR
+    parts.mkdir()
+    (parts / "x.ndjson").write_text('{"date": "2024-01-01", "payment_sum": 1.5, "currency": "RUB"}\n', encoding="utf-8")
+    (parts / "y.ndjson").write_text('{"currency": "USD", "date": "2024-01-02", "payment_sum": 2}\n\n', encoding="utf-8")
+    (parts / "empty.ndjson").write_text("", encoding="utf-8")
+    target, rows = cli._combine_parts(tmp_path, "csv", ["x", "empty", "missing", "y"])
+    assert rows == 2
+    assert target.read_text(encoding="utf-8").splitlines() == [
+        "date,payment_sum,currency", "2024-01-01,1.5,RUB", "2024-01-02,2,USD",
+    ]
@@ -0,0 +1,93 @@
+import io
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from src.OperationDTO import OperationDTO
+from src.services import columnar
+
+
+def _ops():
+    return [
+        OperationDTO(date="01.02.2024 10:30:00", operation_type="buy", payment_sum=-1000.5, currency="RUB",
+                     ticker="SBER", isin="RU0009029540", price=250.125, quantity=4, aci="1,5", commission="0,25"),
+        OperationDTO(date=None, operation_type="coupon", payment_sum="12.3", currency=None, comment="без даты"),
+        OperationDTO(date=datetime(2024, 3, 1), operation_type="buy", payment_sum=1.0, currency="USD", quantity=None),
+    ]
+
+
+EXPECTED_TYPES = {
+    "date": pa.timestamp("us"),
+    "operation_type": pa.dictionary(pa.int32(), pa.string()),
+    "payment_sum": pa.float64(),
+    "currency": pa.dictionary(pa.int32(), pa.string()),
+    "ticker": pa.string(),
+    "quantity": pa.int64(),
+    "aci": pa.float64(),
+    "commission": pa.float64(),
+}
+
+
+def _check(table):
+    assert table.column_names[: len(columnar.COLUMN_ORDER)] == list(columnar.COLUMN_ORDER)
+    for name, typ in EXPECTED_TYPES.items():
+        assert table.schema.field(name).type == typ, name
+    rows = table.to_pylist()
+    assert rows[0]["date"] == datetime(2024, 2, 1, 10, 30)
+    assert rows[0]["payment_sum"] == -1000.5 and rows[0]["aci"] == 1.5 and rows[0]["commission"] == 0.25
+    assert rows[0]["quantity"] == 4 and rows[0]["operation_type"] == "buy"
+    assert rows[1]["date"] is None and rows[1]["currency"] == "" and rows[1]["payment_sum"] == 12.3
+    assert rows[2]["date"] == datetime(2024, 3, 1) and rows[2]["quantity"] == 0
+    assert columnar.statement_metadata(table) == {"account_id": "123", "meta": {"n": 3}}
+
+
+def test_table_schema_and_values():
+    _check(columnar.operations_to_arrow(_ops(), metadata={"account_id": "123", "meta": {"n": 3}}))
+
+
+def test_dicts_match_dtos_and_keep_extra_columns():
+    ops = _ops()
+    from_dicts = columnar.operations_to_arrow([{**op.to_dict(), "source_file": None if i else "a.xlsx"}
+                                              for i, op in enumerate(ops)])
+    from_dtos = columnar.operations_to_arrow(ops)
+    assert from_dicts.select(list(columnar.COLUMN_ORDER)).equals(from_dtos)
+    assert from_dicts.column("source_file").to_pylist() == ["a.xlsx", None, None]
+
+
+def test_ipc_and_parquet_roundtrip():
+    table = columnar.operations_to_arrow(_ops(), metadata={"account_id": "123", "meta": {"n": 3}})
+    _check(pa_ipc.open_stream(columnar.table_to_ipc_bytes(table)).read_all())
+    _check(pq.read_table(io.BytesIO(columnar.table_to_parquet_bytes(table))))
+
+
+@pytest.mark.parametrize("fmt, reader", [
+    ("arrow", lambda body: pa_ipc.open_stream(body).read_all()),
+    ("parquet", lambda body: pq.read_table(io.BytesIO(body))),
+])
+def test_parse_report_columnar_matches_json(tmp_path, fmt, reader):
+    from src.devtools.synthetic import write_statement
+    from src.main import app
+
+    path = write_statement(str(tmp_path / "s.xlsx"), 30, 30, seed=11)
+    with open(path, "rb") as fh:
+        content = fh.read()
+    with TestClient(app) as client:
+        def post(f):
+            return client.post("/parse-report", params={"format": f}, files={"file": ("s.xlsx", content, "application/octet-stream")})
+
+        expected = post("json").json()
+        resp = post(fmt)
+    assert resp.status_code == 200
+    table = reader(resp.content)
+    assert table.schema.field("date").type == pa.timestamp("us")
+    assert table.num_rows == len(expected["operations"])
+    rows = table.to_pylist()
+    for row, op in zip(rows, expected["operations"]):
+        assert row["operation_type"] == op["operation_type"]
+        assert row["payment_sum"] == pytest.approx(float(op["payment_sum"]))
+        assert row["isin"] == (op["isin"] or "")
+    assert columnar.statement_metadata(table)["account_id"] == expected["account_id"]
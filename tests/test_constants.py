@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+from src import constants
+from src.constants import norm_str, normalize_currency
+
+
+def test_normalize_currency_sees_dict_updates(monkeypatch):
+    assert normalize_currency("usdt") == "USDT"
+    monkeypatch.setitem(constants.CURRENCY_DICT, "USDT", "USD")
+    assert normalize_currency("usdt") == "USD"
+    assert normalize_currency("руб") == "RUB"
+
+
+def test_metrics_exposes_norm_cache():
+    from src import main
+
+    norm_str("  Итого по  разделу ")
+    with TestClient(main.app) as client:
+        stats = client.get("/metrics").json()["norm_cache"]
+    assert stats["currsize"] >= 1
+    assert {"hits", "misses", "maxsize"} <= set(stats)
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+
+from src.parsers.filters import StatementFilter, parse_date_bound
+
+
+def test_empty_filter_is_none():
+    assert StatementFilter.build() is None
+    assert StatementFilter.build(date_from="", operation_types=" , ", sections="") is None
+
+
+def test_date_to_without_time_includes_whole_day():
+    flt = StatementFilter.build(date_from="01.03.2024", date_to="31.03.2024")
+    assert flt.accepts_date(datetime(2024, 3, 1, 0, 0))
+    assert flt.accepts_date(datetime(2024, 3, 31, 23, 59, 59))
+    assert flt.accepts_date("31.03.2024 18:30:00")
+    assert not flt.accepts_date(datetime(2024, 2, 29, 23, 59, 59))
+    assert not flt.accepts_date(datetime(2024, 4, 1))
+
+
+def test_date_to_with_explicit_time_is_exact():
+    flt = StatementFilter.build(date_to="2024-03-31 00:00")
+    assert flt.accepts_date(datetime(2024, 3, 31, 0, 0))
+    assert not flt.accepts_date(datetime(2024, 3, 31, 0, 1))
+    assert parse_date_bound("2024-03-31", end_of_day=True).date() == datetime(2024, 3, 31).date()
+
+
+def test_unparseable_row_date_is_rejected_only_with_date_bounds():
+    assert not StatementFilter.build(date_from="01.01.2024").accepts_date("не дата")
+    assert StatementFilter.build(operation_types="coupon").accepts_date("не дата")
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"date_from": "32.13.2024"},
+    {"date_from": "02.01.2024", "date_to": "01.01.2024"},
+    {"sections": "fin,unknown"},
+])
+def test_invalid_filters_raise(kwargs):
+    with pytest.raises(ValueError):
+        StatementFilter.build(**kwargs)
+
+
+def test_operation_types_select_sections():
+    coupons = StatementFilter.build(operation_types="coupon, dividend")
+    assert coupons.operation_types == frozenset({"coupon", "dividend"})
+    assert coupons.wants_section("fin") and not coupons.wants_section("trades")
+    assert coupons.accepts_type("coupon") and not coupons.accepts_type("buy")
+
+    trades = StatementFilter.build(operation_types=["buy"])
+    assert trades.wants_section("trades") and not trades.wants_section("fin")
+
+    mixed = StatementFilter.build(operation_types="sale,coupon", sections="trades")
+    assert mixed.wants_section("trades") and not mixed.wants_section("fin")
+
+
+def test_as_dict_is_stable():
+    flt = StatementFilter.build(date_from="01.01.2024", operation_types="sale,buy")
+    assert flt.as_dict() == {
+        "date_from": "2024-01-01T00:00:00",
+        "date_to": None,
+        "operation_types": ["buy", "sale"],
+        "sections": None,
+    }
+
+
+@pytest.fixture(scope="module")
+def statement(tmp_path_factory):
+    from src.devtools.synthetic import write_statement
+
+    return write_statement(str(tmp_path_factory.mktemp("stmt") / "s.xlsx"), 120, 120, seed=3)
+
+
+def test_pushdown_matches_filtering_full_output(statement):
+    from src.services.full_statement import parse_full_statement
+    from src.utils import parse_datetime
+
+    full = parse_full_statement(statement, mode="serial")["operations"]
+    flt = StatementFilter.build(date_from="01.03.2024", date_to="30.06.2024", operation_types="coupon,buy")
+    filtered = parse_full_statement(statement, mode="serial", statement_filter=flt)["operations"]
+    expected = [
+        op for op in full
+        if op["operation_type"] in ("coupon", "buy")
+        and datetime(2024, 3, 1) <= parse_datetime(op["date"]) <= datetime(2024, 6, 30, 23, 59, 59)
+    ]
+    assert filtered and filtered == expected
+
+
+@pytest.mark.parametrize("bound", [
+    "2024-03-01T00:00:00+03:00",
+    "2024-03-01T00:00:00Z",
+    datetime.fromisoformat("2024-03-01T00:00:00+00:00"),
+])
+def test_timezone_aware_bounds_are_rejected(bound):
+    with pytest.raises(ValueError):
+        parse_date_bound(bound)
+    with pytest.raises(ValueError):
+        StatementFilter.build(date_to=bound)
+
+
+def test_parse_report_rejects_aware_bound_with_422(statement):
+    from fastapi.testclient import TestClient
+
+    from src import main
+
+    with TestClient(main.app) as client, open(statement, "rb") as fh:
+        resp = client.post(
+            "/parse-report", params={"date_from": "2024-03-01T00:00:00+03:00"}, files={"file": ("s.xlsx", fh)}
+        )
+    assert resp.status_code == 422
+    assert "часовым поясом" in resp.json()["detail"]
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from src.services.grid import SharedGrid, attach_grid, pack_grid, unpack_grid, GridHandle
+
+
+def _grid() -> pd.DataFrame:
+    return pd.DataFrame(
+        [["Дата", 1, 2.5, datetime(2024, 1, 2, 3, 4, 5)], ["", None, float("nan"), pd.Timestamp("2024-02-01")]],
+        dtype=object,
+    )
+
+
+def test_pack_roundtrip():
+    df = _grid()
+    pd.testing.assert_frame_equal(unpack_grid(pack_grid(df)), df)
+
+
+def test_unpack_rejects_foreign_buffer():
+    with pytest.raises(ValueError):
+        unpack_grid(b"not a grid at all")
+
+
+@pytest.mark.parametrize("backend", ["shm", "mmap"])
+def test_attach_roundtrip_outlives_owner(backend):
+    df = _grid()
+    with SharedGrid.create(df, backend) as shared:
+        attached = attach_grid(shared.handle)
+    pd.testing.assert_frame_equal(attached, df)
+
+
+def test_attach_error_is_not_masked_by_buffer_error():
+    with SharedGrid.create(_grid(), "shm") as shared:
+        shared._shm.buf[:8] = b"BROKEN!!"
+        with pytest.raises(ValueError):
+            attach_grid(shared.handle)
+
+
+def test_attach_truncated_buffer():
+    with SharedGrid.create(_grid(), "shm") as shared:
+        handle = GridHandle("shm", shared.handle.name, shared.handle.nbytes // 2)
+        with pytest.raises(Exception) as exc:
+            attach_grid(handle)
+        assert not isinstance(exc.value, BufferError)
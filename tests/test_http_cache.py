@@ -0,0 +1,166 @@
+import gzip
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.constants
+from src.services import http_cache
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("*", http_cache.available_encodings()[0]),
+    ("*;q=0.1, gzip;q=0", next((e for e in http_cache.available_encodings() if e != "gzip"), None)),
+])
+def test_negotiate_encoding(header, expected):
+    assert http_cache.negotiate_encoding(header) == expected
+
+
+def test_etag_matches():
+    etag = 'W/"abc"'
+    assert http_cache.etag_matches('W/"abc"', etag)
+    assert http_cache.etag_matches('"x", "abc"', etag)
+    assert http_cache.etag_matches('"x",W/"abc"', '"abc"')
+    assert not http_cache.etag_matches("*", etag)
+    assert not http_cache.etag_matches('"abcd"', etag)
+    assert not http_cache.etag_matches(None, etag)
+
+
+def test_make_etag_is_weak():
+    etag = http_cache.make_etag("digest", {"format": "json"})
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag != http_cache.make_etag("digest", {"format": "arrow"})
+
+
+def test_encode_body_respects_threshold():
+    small = b"{}"
+    assert http_cache.encode_body(small, "gzip") == (small, None)
+    big = b"x" * (http_cache.COMPRESS_MIN_BYTES + 1)
+    data, enc = http_cache.encode_body(big, "gzip")
+    assert enc == "gzip" and gzip.decompress(data) == big
+
+
+def test_parser_version_tracks_handlers(monkeypatch):
+    http_cache.parser_version.cache_clear()
+    before = http_cache.parser_version()
+    handlers = dict(getattr(src.constants, "SPECIAL_OPERATION_HANDLERS", {}))
+    handlers["новая операция"] = lambda row, ctx: "other"
+    monkeypatch.setattr(src.constants, "SPECIAL_OPERATION_HANDLERS", handlers)
+    http_cache.parser_version.cache_clear()
+    try:
+        assert http_cache.parser_version() != before
+    finally:
+        monkeypatch.undo()
+        http_cache.parser_version.cache_clear()
+
+
+def test_source_digest_tracks_code(tmp_path):
+    (tmp_path / "parsers").mkdir()
+    (tmp_path / "devtools").mkdir()
+    module = tmp_path / "parsers" / "fin.py"
+    module.write_text("X = 1\n")
+    before = http_cache._source_digest(tmp_path)
+    (tmp_path / "devtools" / "bench.py").write_text("Y = 2\n")
+    assert http_cache._source_digest(tmp_path) == before
+    module.write_text("X = 2\n")
+    assert http_cache._source_digest(tmp_path) != before
+
+
+def test_response_cache_disabled_by_default():
+    if "PARSER_RESPONSE_CACHE_BYTES" not in os.environ:
+        assert http_cache.RESPONSES.max_bytes == 0
+    cache = http_cache.ResponseCache(0)
+    cache.put('"e"', None, (b"body", "application/json", None))
+    assert cache.get('"e"', None) is None
+
+
+def test_response_cache_lru_by_bytes():
+    cache = http_cache.ResponseCache(10)
+    cache.put("a", None, (b"12345", "t", None))
+    cache.put("b", None, (b"12345", "t", None))
+    assert cache.get("a", None) is not None  # a — самый свежий
+    cache.put("c", "gzip", (b"123", "t", "gzip"))
+    assert cache.get("b", None) is None
+    assert cache.get("a", None) and cache.get("c", "gzip")
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.fixture(scope="module")
+def statement(tmp_path_factory):
+    from src.devtools.synthetic import write_statement
+
+    path = write_statement(str(tmp_path_factory.mktemp("stmt") / "s.xlsx"), 60, 60, seed=5)
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+@pytest.fixture
+def client():
+    from src.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+def _post(client, content, headers=None, params=None):
+    return client.post(
+        "/parse-report",
+        params=params,
+        headers=headers or {},
+        files={"file": ("s.xlsx", content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+    )
+
+
+def test_parse_report_etag_and_304(client, statement):
+    first = _post(client, statement)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert "Accept-Encoding" in first.headers["vary"]
+
+    again = _post(client, statement, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and not again.content
+
+    other = _post(client, statement, headers={"If-None-Match": etag}, params={"order": "date"})
+    assert other.status_code == 200 and other.headers["etag"] != etag
+
+
+def test_parse_report_gzip(client, statement):
+    plain = _post(client, statement, headers={"Accept-Encoding": "identity"})
+    zipped = _post(client, statement, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in plain.headers
+    assert zipped.headers["content-encoding"] == "gzip"
+    # байты тел различаются, поэтому общий для обеих кодировок ETag — только слабый
+    assert zipped.headers["etag"] == plain.headers["etag"]
+    assert zipped.headers["etag"].startswith('W/"')
+    assert zipped.json() == plain.json()
+
+    revalidated = _post(client, statement, headers={"Accept-Encoding": "identity", "If-None-Match": zipped.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_parse_report_ignores_if_none_match_star(client, statement):
+    resp = _post(client, statement, headers={"If-None-Match": "*"})
+    assert resp.status_code == 200 and resp.json()["operations"]
+
+
+def test_parser_version_is_computed_at_startup():
+    from src.main import app
+
+    http_cache.parser_version.cache_clear()
+    with TestClient(app):
+        assert http_cache.parser_version.cache_info().currsize == 1
+
+
+def test_parse_report_uses_response_cache_when_enabled(client, statement, monkeypatch):
+    monkeypatch.setattr(http_cache.RESPONSES, "max_bytes", 64 * 2 ** 20)
+    hits = http_cache.RESPONSES.stats()["hits"]
+    first = _post(client, statement, params={"order": "date_desc"})
+    second = _post(client, statement, params={"order": "date_desc"})
+    assert second.json() == first.json()
+    assert http_cache.RESPONSES.stats()["hits"] == hits + 1
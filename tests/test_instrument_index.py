@@ -0,0 +1,168 @@
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+from src.OperationDTO import OperationDTO
+from src.services import instrument_index
+from src.services.instrument_index import InstrumentIndex
+
+
+def _save_one(path: str, n: int) -> None:
+    idx = InstrumentIndex(path)
+    idx.observe(isin=f"RU000A10{n:04d}", reg_number=f"4B02-{n:02d}-00000-A", name=f"Облигация {n}")
+    idx.save()
+
+
+def test_observe_links_identifiers():
+    idx = InstrumentIndex()
+    assert idx.observe(isin="SU26238RMFS4", reg_number="26238RMFS", name="ОФЗ 26238")
+    assert idx.resolve(reg_number="26238rmfs")["isin"] == "SU26238RMFS4"
+    assert idx.resolve(name="  офз 26238 ")["reg_number"] == "26238RMFS"
+    assert not idx.observe(isin="SU26238RMFS4")
+    # связка уже занятого ISIN не перезаписывается
+    idx.observe(isin="SU26238RMFS4", reg_number="OTHER")
+    assert idx.resolve(isin="SU26238RMFS4")["reg_number"] == "26238RMFS"
+
+
+def test_enrich_fills_missing_fields():
+    idx = InstrumentIndex()
+    idx.observe(isin="RU0009029540", reg_number="10301481B", ticker="SBER")
+    ops = [
+        OperationDTO(date="01.01.2024", operation_type="dividend", payment_sum=1.0, currency="RUB", reg_number="10301481B"),
+        OperationDTO(date="01.01.2024", operation_type="coupon", payment_sum=1.0, currency="RUB", isin="XS0000000000"),
+    ]
+    assert idx.enrich(ops) == 1
+    assert (ops[0].isin, ops[0].ticker) == ("RU0009029540", "SBER")
+    assert ops[1].reg_number == ""
+
+
+def test_two_instances_on_one_file_merge(tmp_path):
+    path = str(tmp_path / "instruments.json")
+    a, b = InstrumentIndex(path), InstrumentIndex(path)
+    a.observe(isin="SU26238RMFS4", reg_number="26238RMFS")
+    b.observe(isin="RU0009029540", reg_number="10301481B")
+    a.save()
+    b.save()
+    with open(path, encoding="utf-8") as fh:
+        isins = sorted(r["isin"] for r in json.load(fh)["instruments"])
+    assert isins == ["RU0009029540", "SU26238RMFS4"]
+    # b подхватил запись a при слиянии
+    assert b.resolve(reg_number="26238RMFS")["isin"] == "SU26238RMFS4"
+
+
+def test_concurrent_processes_do_not_lose_records(tmp_path):
+    path = str(tmp_path / "instruments.json")
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_save_one, args=(path, n)) for n in range(6)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+    assert InstrumentIndex(path).stats()["instruments"] == 6
+
+
+def test_stats_loads_file(tmp_path):
+    path = tmp_path / "instruments.json"
+    path.write_text(json.dumps({"instruments": [{"isin": "SU26238RMFS4", "ticker": "OFZ"}]}), encoding="utf-8")
+    stats = InstrumentIndex(str(path)).stats()
+    assert (stats["instruments"], stats["with_isin"], stats["with_ticker"]) == (1, 1, 1)
+
+
+def test_save_without_changes_does_not_write(tmp_path):
+    path = tmp_path / "instruments.json"
+    InstrumentIndex(str(path)).save()
+    assert not path.exists()
+
+
+@pytest.fixture(scope="module")
+def statement(tmp_path_factory):
+    from src.devtools.synthetic import write_statement
+
+    return write_statement(str(tmp_path_factory.mktemp("stmt") / "s.xlsx"), 40, 40, seed=7)
+
+
+@pytest.mark.parametrize("learning", [False, True])
+def test_parse_learns_only_when_enabled(statement, tmp_path, monkeypatch, learning):
+    from src.services import full_statement
+
+    idx = InstrumentIndex(str(tmp_path / "instruments.json"), learning=learning)
+    monkeypatch.setattr(full_statement, "INSTRUMENTS", idx)
+    full_statement.parse_full_statement(statement, mode="serial")
+    assert (idx.stats()["instruments"] > 0) is learning
+    assert (tmp_path / "instruments.json").exists() is learning
+
+
+def test_enriched_response_is_not_cached(statement, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from src.main import app
+    from src.services import http_cache
+
+    monkeypatch.setattr(http_cache.RESPONSES, "max_bytes", 64 * 2 ** 20)
+    with open(statement, "rb") as fh:
+        content = fh.read()
+    files = {"file": ("s.xlsx", content, "application/octet-stream")}
+    with TestClient(app) as client:
+        entries = http_cache.RESPONSES.stats()["entries"]
+        resp = client.post("/parse-report", params={"enrich": "true"}, files=files, headers={"If-None-Match": "*"})
+        assert resp.status_code == 200
+        assert "etag" not in resp.headers
+        assert "instruments_enriched" in resp.json()["meta"]
+        assert http_cache.RESPONSES.stats()["entries"] == entries
+
+
+@pytest.mark.skipif(instrument_index.fcntl is None, reason="нужна файловая блокировка fcntl")
+def test_save_does_not_hold_lock_during_file_wait(tmp_path):
+    path = str(tmp_path / "instruments.json")
+    idx = InstrumentIndex(path)
+    idx.observe(isin="SU26238RMFS4", reg_number="26238RMFS")
+    other = InstrumentIndex(path)
+    other.observe(isin="RU0009029540", reg_number="10301481B")
+
+    with other._file_lock():
+        saver = threading.Thread(target=idx.save)
+        saver.start()
+        saver.join(0.2)
+        assert saver.is_alive()  # ждёт файловую блокировку
+        # ...но чтения и пополнение справочника при этом не блокируются
+        done = threading.Event()
+        worker = threading.Thread(target=lambda: (
+            idx.resolve(isin="SU26238RMFS4"), idx.observe(isin="RU000A1000A1", reg_number="4B02-01-00001-A"), done.set()
+        ))
+        worker.start()
+        assert done.wait(2)
+        # пока idx ждёт, другой экземпляр успевает записать файл
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"instruments": other._records}, fh)
+    saver.join(5)
+    assert not saver.is_alive()
+
+    with open(path, encoding="utf-8") as fh:
+        saved = sorted(r["isin"] for r in json.load(fh)["instruments"])
+    assert saved == ["RU0009029540", "SU26238RMFS4"]
+    # запись из файла подмешана в память; изменение во время save ждёт следующего сохранения
+    assert idx.resolve(reg_number="10301481B")["isin"] == "RU0009029540"
+    idx.save()
+    with open(path, encoding="utf-8") as fh:
+        saved = sorted(r["isin"] for r in json.load(fh)["instruments"])
+    assert saved == ["RU0009029540", "RU000A1000A1", "SU26238RMFS4"]
+
+
+def test_failed_save_keeps_changes_dirty(tmp_path, monkeypatch):
+    path = str(tmp_path / "instruments.json")
+    idx = InstrumentIndex(path)
+    idx.observe(isin="SU26238RMFS4", reg_number="26238RMFS")
+
+    def broken_replace(src, dst):
+        raise OSError("read-only")
+
+    monkeypatch.setattr(instrument_index.os, "replace", broken_replace)
+    idx.save()
+    monkeypatch.undo()
+    assert list(tmp_path.glob("*.tmp")) == []
+    idx.save()
+    with open(path, encoding="utf-8") as fh:
+        assert [r["isin"] for r in json.load(fh)["instruments"]] == ["SU26238RMFS4"]
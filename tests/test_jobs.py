@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.services import jobs as jobs_mod
+from src.services.jobs import JOB_DONE, JOB_QUEUED, Job, JobManager, JobQueueFull, SqliteJobStore
+
+
+async def _stopped_manager(tmp_path, **kwargs) -> JobManager:
+    """Менеджер с очередью, но без воркеров: задачи остаются в очереди."""
+    manager = JobManager(upload_dir=str(tmp_path / "uploads"), **kwargs)
+    await manager.start()
+    await manager.stop()
+    return manager
+
+
+def test_submit_rejects_when_full(tmp_path):
+    async def scenario():
+        manager = await _stopped_manager(tmp_path, queue_size=2)
+        await manager.submit("a.xlsx", b"1")
+        await manager.submit("b.xlsx", b"2")
+        with pytest.raises(JobQueueFull):
+            await manager.submit("c.xlsx", b"3")
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.queue_depth == 2
+    assert len(list((tmp_path / "uploads").iterdir())) == 2
+
+
+def test_concurrent_submits_never_overfill(tmp_path):
+    async def scenario():
+        manager = await _stopped_manager(tmp_path, queue_size=2)
+        results = await asyncio.gather(
+            *(manager.submit(f"{n}.xlsx", b"x" * 1024) for n in range(6)), return_exceptions=True
+        )
+        return manager, results
+
+    manager, results = asyncio.run(scenario())
+    assert sum(isinstance(r, Job) for r in results) == 2
+    assert sum(isinstance(r, JobQueueFull) for r in results) == 4
+    assert manager.queue_depth == 2
+    assert len(list((tmp_path / "uploads").iterdir())) == 2
+
+
+def test_failed_submit_removes_upload(tmp_path, monkeypatch):
+    async def scenario():
+        manager = await _stopped_manager(tmp_path, queue_size=2)
+
+        def broken_save(job):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(manager.store, "save", broken_save)
+        with pytest.raises(OSError):
+            await manager.submit("a.xlsx", b"1")
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.queue_depth == 0
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+
+def test_restart_requeues_jobs_beyond_capacity(tmp_path, monkeypatch):
+    db = str(tmp_path / "jobs.db")
+    store = SqliteJobStore(db)
+    for n in range(5):
+        store.save(Job(id=f"job{n}", filename=f"{n}.xlsx", upload_path=str(tmp_path / f"{n}.xlsx"), created_at=n))
+
+    monkeypatch.setattr(jobs_mod, "parse_full_statement", lambda path, progress=None: {"path": path})
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=2, upload_dir=str(tmp_path / "uploads"), store=SqliteJobStore(db))
+        await manager.start()
+        assert manager.queue_depth == 5
+        # пока очередь перегружена восстановленными задачами, новые отклоняются
+        with pytest.raises(JobQueueFull):
+            await manager.submit("new.xlsx", b"1")
+        deadline = time.monotonic() + 5
+        while manager.queue_depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await manager._queue.join()
+        await manager.stop()
+        return manager
+
+    manager = asyncio.run(scenario())
+    statuses = {job.id: job.status for job in SqliteJobStore(db).list()}
+    assert statuses == {f"job{n}": JOB_DONE for n in range(5)}
+    assert all(manager.get(f"job{n}").result for n in range(5))
+    assert JOB_QUEUED not in statuses.values()
+
+
+def test_store_io_runs_off_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_mod, "parse_full_statement", lambda path, progress=None: {"path": path})
+    loop_thread = []
+
+    async def scenario():
+        manager = JobManager(workers=1, queue_size=2, upload_dir=str(tmp_path / "uploads"),
+                             store=SqliteJobStore(str(tmp_path / "jobs.db")))
+        save = manager.store.save
+        save_threads = []
+
+        def tracking_save(job):
+            save_threads.append(threading.get_ident())
+            save(job)
+
+        monkeypatch.setattr(manager.store, "save", tracking_save)
+        loop_thread.append(threading.get_ident())
+        await manager.start()
+        await manager.submit("a.xlsx", b"1")
+        await manager._queue.join()
+        await manager.stop()
+        return save_threads
+
+    save_threads = asyncio.run(scenario())
+    assert save_threads
+    assert loop_thread[0] not in save_threads
+
+
+def test_progress_snapshot_is_consistent(tmp_path):
+    job = Job(id="j", filename="a.xlsx", upload_path=str(tmp_path / "a.xlsx"))
+    stop = threading.Event()
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            job.set_progress(f"s{n % 50}", {"rows": n})
+            n += 1
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        for _ in range(500):
+            status = job.to_status()
+            assert "result" not in status and "upload_path" not in status
+            assert all(isinstance(v, dict) for v in status["progress"].values())
+    finally:
+        stop.set()
+        t.join()
+
+
+def test_create_job_rejects_full_queue_before_reading(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from starlette.datastructures import UploadFile
+
+    from src import main
+
+    reads = []
+    read = UploadFile.read
+
+    async def tracking_read(self, *args, **kwargs):
+        reads.append(self.filename)
+        return await read(self, *args, **kwargs)
+
+    monkeypatch.setattr(UploadFile, "read", tracking_read)
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(type(main.jobs), "is_full", property(lambda self: True))
+        resp = client.post("/jobs", files={"file": ("a.xlsx", b"data")})
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "5"
+    assert reads == []
@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+from src.devtools.synthetic import write_statement
+from src.parsers.fin_operations import find_section_start
+from src.parsers.layout_cache import LAYOUTS
+from src.parsers.sheet import read_sheet
+from src.parsers.stocks_bonds import find_trades_block_start
+from src.services.full_statement import parse_full_statement
+
+
+@pytest.fixture
+def layouts(monkeypatch):
+    monkeypatch.setattr(LAYOUTS, "path", None)
+    monkeypatch.setattr(LAYOUTS, "enabled", True)
+    LAYOUTS.clear()
+    yield LAYOUTS
+    LAYOUTS.clear()
+
+
+@pytest.fixture(scope="module")
+def grid(tmp_path_factory):
+    path = tmp_path_factory.mktemp("layouts") / "statement.xlsx"
+    write_statement(str(path), n_fin=30, n_trades=15, seed=11)
+    return read_sheet(str(path))
+
+
+def _insert_rows(df, at, rows):
+    width = df.shape[1]
+    extra = pd.DataFrame([list(r) + [""] * (width - len(r)) for r in rows], dtype=object)
+    return pd.concat([df.iloc[:at], extra, df.iloc[at:]], ignore_index=True)
+
+
+def _parse(df):
+    result = parse_full_statement(df.copy())
+    return result["operations"], result["meta"]
+
+
+def _cold(df):
+    with LAYOUTS.disabled():
+        return _parse(df)
+
+
+def test_disabled_is_a_runtime_toggle(layouts, grid):
+    with layouts.disabled():
+        _parse(grid)
+        assert layouts.stats()["layouts"] == 0
+    assert layouts.enabled
+    _parse(grid)
+    assert layouts.stats()["by_section"] == {"fin": 1, "trades": 1}
+
+
+def test_cache_hit_matches_cold_detection(layouts, grid):
+    cold = _cold(grid)
+    assert _parse(grid) == cold  # промах: разметка определяется и сохраняется
+    hits = layouts.stats()["hits"]
+    assert _parse(grid) == cold
+    assert layouts.stats()["hits"] == hits + 2
+
+
+@pytest.mark.parametrize("shift", [
+    [[""], [""]],
+    [["Выписка сформирована автоматически"]],
+    # строка, похожая на заголовок: холодный поиск выберет её первой — кэш обязан сделать то же
+    [["Дата отчёта", "Сумма по счёту"]],
+])
+def test_shifted_headers_match_cold_detection(layouts, grid, shift):
+    _parse(grid)  # известные разметки — по исходной выписке
+    shifted = _insert_rows(grid, find_section_start(grid) + 1, shift)
+    shifted = _insert_rows(shifted, find_trades_block_start(shifted), shift)
+    assert _parse(shifted) == _cold(shifted)
+    assert _parse(shifted) == _cold(shifted)
+
+
+def test_known_layout_below_header_like_row(layouts, grid):
+    start = find_section_start(grid)
+    header = grid.iloc[start + 1].tolist()
+    variant = grid.copy()
+    variant.iloc[start + 1] = [("Примечание" if str(c).startswith("Коммент") else c) for c in header]
+    # вариант заголовка известен со смещением 2 от начала секции
+    _parse(_insert_rows(variant, start + 1, [[""]]))
+    decoy = _insert_rows(variant, start + 1, [["Дата отчёта", "Сумма по счёту"]])
+    assert _parse(decoy) == _cold(decoy)
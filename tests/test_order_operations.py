@@ -0,0 +1,59 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.OperationDTO import OperationDTO
+from src.services.full_statement import ORDER_MODES, order_operations
+
+
+def _op(date, op_id, op_type="deposit"):
+    return OperationDTO(date=date, operation_type=op_type, payment_sum=1.0, currency="RUB", operation_id=op_id)
+
+
+def _ids(ops):
+    return [op.operation_id for op in ops]
+
+
+@pytest.fixture
+def streams():
+    rng = random.Random(7)
+    base = datetime(2024, 1, 1)
+    days = [base + timedelta(days=rng.randrange(20), hours=rng.choice((0, 0, 12))) for _ in range(60)]
+    # даты fin как строки выписки (в т.ч. без времени) и не по порядку, сделки — datetime по порядку
+    fin = [_op(d.strftime("%d.%m.%Y") if d.hour == 0 else d.strftime("%d.%m.%Y %H:%M:%S"), f"f{n}")
+           for n, d in enumerate(days[:40])]
+    fin.append(_op(None, "f-undated"))
+    fin.insert(5, _op("", "f-empty"))
+    trades = [_op(d, f"t{n}", "buy") for n, d in enumerate(sorted(days[40:]))]
+    return fin, trades
+
+
+def test_date_matches_stable_sort_by_typed_key(streams):
+    fin, trades = streams
+    assert _ids(order_operations(fin, trades, "date")) == _ids(sorted(fin + trades, key=lambda op: op.sort_key))
+
+
+def test_ties_keep_section_then_source_order():
+    fin = [_op("02.01.2024", "f1"), _op("01.01.2024", "f2"), _op("02.01.2024 00:00:00", "f3")]
+    trades = [_op(datetime(2024, 1, 2), "t1", "buy"), _op(datetime(2024, 1, 2), "t2", "buy")]
+    assert _ids(order_operations(fin, trades, "date")) == ["f2", "f1", "f3", "t1", "t2"]
+    assert _ids(order_operations(fin, trades, "date_desc")) == ["f1", "f3", "t1", "t2", "f2"]
+
+
+def test_date_desc_is_stable_descending_with_undated_last(streams):
+    fin, trades = streams
+    merged = fin + trades
+    dated = sorted((op for op in merged if op.parsed_date), key=lambda op: op.sort_key, reverse=True)
+    undated = [op for op in merged if op.parsed_date is None]
+    result = order_operations(fin, trades, "date_desc")
+    assert _ids(result) == _ids(dated + undated)
+    assert _ids(result[-2:]) == ["f-empty", "f-undated"]
+
+
+def test_source_and_unknown_order(streams):
+    fin, trades = streams
+    assert order_operations(fin, trades, "source") == fin + trades
+    assert set(ORDER_MODES) == {"source", "date", "date_desc"}
+    with pytest.raises(ValueError):
+        order_operations(fin, trades, "random")
@@ -0,0 +1,125 @@
+import pytest
+
+from src.OperationDTO import OperationDTO
+from src.devtools.synthetic import write_statement
+from src.services.full_statement import parse_full_statement
+from src.services.portfolio import build_portfolio
+
+
+def _trade(date, op_type, isin, qty, amount, aci=0.0, commission=0.0, currency="RUB"):
+    return OperationDTO(date=date, operation_type=op_type, payment_sum=amount, currency=currency, isin=isin,
+                        quantity=qty, aci=aci, commission=commission)
+
+
+def _fin(date, op_type, amount, currency="RUB", isin=""):
+    return OperationDTO(date=date, operation_type=op_type, payment_sum=amount, currency=currency, isin=isin)
+
+
+@pytest.fixture
+def operations():
+    return [
+        _trade("10.01.2024", "buy", "RU000A", 10, 1000.0, aci=10.0, commission=1.0),
+        _trade("15.01.2024", "buy", "RU000A", 10, 1200.0, commission=2.0),
+        # закрывает первый лот целиком и половину второго
+        _trade("20.01.2024 12:00:00", "sale", "RU000A", 15, 1800.0, aci=5.0, commission=3.0),
+        _fin("25.01.2024", "coupon", 50.0, isin="RU000A"),
+        _fin("26.01.2024", "amortization", 100.0, isin="RU000A"),
+        _fin("27.01.2024", "repayment", 200.0, isin="RU000A"),
+        _fin("28.01.2024", "commission", -30.0),
+        # продажа без открытых лотов: история покупок не попала в выписку
+        _trade("05.02.2024", "sale", "US000B", 5, 500.0, commission=1.0, currency="USD"),
+        _fin("06.02.2024", "dividend", 20.0, currency="USD", isin="US000B"),
+        _fin("07.02.2024", "deposit", 1000.0, currency="EUR"),
+        # после даты отсечки и без даты — не учитываются
+        _trade("01.02.2025", "buy", "RU000A", 100, 9999.0),
+        _fin(None, "deposit", 7.0),
+    ]
+
+
+def _by(items, key):
+    return {item[key]: item for item in items}
+
+
+def test_fifo_positions(operations):
+    result = build_portfolio(operations, as_of="31.12.2024")
+    positions = _by(result["positions"], "isin")
+    a = positions["RU000A"]
+    assert a["quantity"] == 5
+    assert a["open_lots"] == 1
+    assert a["cost_basis"] == pytest.approx(601.0)
+    assert a["avg_price"] == pytest.approx(120.2)
+    # выручка 1800 + 5 − 3 против себестоимости 10 × 101.1 + 5 × 120.2
+    assert a["realized_pnl"] == pytest.approx(1802.0 - 1612.0)
+    assert (a["coupons"], a["amortizations"], a["repayments"], a["dividends"]) == (50.0, 100.0, 200.0, 0.0)
+    assert a["trade_commissions"] == pytest.approx(6.0)
+    assert a["aci"] == pytest.approx(15.0)
+    assert a["first_date"].startswith("2024-01-10") and a["last_date"].startswith("2024-01-27")
+    assert not a["incomplete_history"]
+
+
+def test_sale_without_open_lots_is_incomplete(operations):
+    b = _by(build_portfolio(operations, as_of="31.12.2024")["positions"], "isin")["US000B"]
+    assert b["quantity"] == -5
+    assert b["open_lots"] == 0
+    assert b["cost_basis"] == 0.0 and b["avg_price"] == 0.0
+    assert b["realized_pnl"] == 0.0
+    assert b["dividends"] == 20.0
+    assert b["currency"] == "USD"
+    assert b["incomplete_history"]
+
+
+def test_partially_unmatched_sale_scales_proceeds():
+    ops = [
+        _trade("10.01.2024", "buy", "RU000C", 10, 1000.0),
+        _trade("11.01.2024", "sale", "RU000C", 15, 1800.0),
+    ]
+    c = build_portfolio(ops)["positions"][0]
+    assert c["quantity"] == -5
+    assert c["realized_pnl"] == pytest.approx(1800.0 * 10 / 15 - 1000.0)
+    assert c["incomplete_history"]
+
+
+def test_cash_by_currency(operations):
+    result = build_portfolio(operations, as_of="31.12.2024", opening_cash={"EUR": 50.0, "CNY": 10.0})
+    cash = _by(result["cash"], "currency")
+    assert sorted(cash) == ["CNY", "EUR", "RUB", "USD"]
+    assert cash["RUB"]["by_type"] == {
+        "buy": -2213.0, "sale": 1802.0, "coupon": 50.0, "amortization": 100.0, "repayment": 200.0, "commission": -30.0,
+    }
+    assert cash["RUB"]["balance"] == pytest.approx(-91.0)
+    assert cash["USD"]["balance"] == pytest.approx(519.0)
+    assert (cash["EUR"]["opening"], cash["EUR"]["turnover"], cash["EUR"]["balance"]) == (50.0, 1000.0, 1050.0)
+    assert (cash["CNY"]["turnover"], cash["CNY"]["balance"], cash["CNY"]["by_type"]) == (0.0, 10.0, {})
+
+
+def test_trade_commissions_can_be_left_out_of_cash(operations):
+    cash = _by(build_portfolio(operations, as_of="31.12.2024", trade_commissions=False)["cash"], "currency")
+    assert cash["RUB"]["balance"] == pytest.approx(-91.0 + 6.0)
+    assert cash["USD"]["balance"] == pytest.approx(520.0)
+
+
+def test_as_of_cutoff_and_undated(operations):
+    result = build_portfolio(operations, as_of="31.12.2024")
+    assert result["as_of"].startswith("2024-12-31T23:59:59")
+    assert result["meta"]["operations_used"] == len(operations) - 2
+    assert result["meta"]["skipped_no_date"] == 1
+
+    everything = build_portfolio(operations)
+    assert everything["as_of"] is None
+    assert _by(everything["positions"], "isin")["RU000A"]["quantity"] == 105
+    assert build_portfolio(operations, as_of="25.01.2024")["meta"]["operations_used"] == 4
+
+
+def test_dicts_and_dtos_agree(operations):
+    assert build_portfolio([op.to_dict() for op in operations], as_of="31.12.2024") == build_portfolio(
+        operations, as_of="31.12.2024"
+    )
+
+
+def test_statement_portfolio_uses_date_end(tmp_path):
+    path = tmp_path / "statement.xlsx"
+    write_statement(str(path), n_fin=40, n_trades=20, seed=5)
+    result = parse_full_statement(str(path), portfolio=True)
+    assert result["date_end"] == "31.12.2024"
+    assert result["portfolio"]["as_of"].startswith("2024-12-31T23:59:59")
+    assert result["portfolio"]["meta"]["operations_used"] <= len(result["operations"])
@@ -0,0 +1,97 @@
+from collections import Counter
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from src import constants
+from src.devtools.synthetic import write_statement
+from src.parsers.fin_operations import build_fin_rules, parse_fin_operations, reclassify_fin_operations
+from src.services.full_statement import parse_full_statement
+
+UNKNOWN = "Неизвестная операция"
+
+
+@pytest.fixture(scope="module")
+def parsed(tmp_path_factory):
+    path = tmp_path_factory.mktemp("reclassify") / "statement.xlsx"
+    write_statement(str(path), n_fin=40, n_trades=5, seed=3)
+    return path, parse_full_statement(str(path), include_raw=True)
+
+
+def _fin(ops):
+    return [(o["date"], o["operation_type"], o["payment_sum"]) for o in ops if o["operation_type"] not in ("buy", "sale")]
+
+
+def test_reclassify_with_current_rules_matches_parse(parsed):
+    path, result = parsed
+    fin_ops, _ = parse_fin_operations(str(path))
+    ops, stats = reclassify_fin_operations(result["raw_fin_rows"])
+    assert [o.to_dict() for o in ops] == [o.to_dict() for o in fin_ops]
+    assert UNKNOWN in stats["unrecognized_names"]
+
+
+def _remap_unknown_rules():
+    return {
+        "valid_operations": sorted(constants.VALID_OPERATIONS | {UNKNOWN}),
+        "operation_type_map": {**constants.OPERATION_TYPE_MAP, UNKNOWN: "deposit"},
+    }
+
+
+def test_reclassify_with_changed_mapping(parsed):
+    _, result = parsed
+    raw = result["raw_fin_rows"]
+    unknown_rows = sum(r["raw_type"] == UNKNOWN for r in raw)
+    assert unknown_rows
+
+    before, _ = reclassify_fin_operations(raw)
+    after, stats = reclassify_fin_operations(raw, _remap_unknown_rules())
+    types_before = Counter(o.operation_type for o in before)
+    types_after = Counter(o.operation_type for o in after)
+    assert types_after - types_before == Counter({"deposit": unknown_rows})
+    assert types_before - types_after == Counter()
+    assert UNKNOWN not in stats["unrecognized_names"]
+
+
+def test_reclassify_endpoint(parsed):
+    from src import main
+
+    _, result = parsed
+    rows = jsonable_encoder(result["raw_fin_rows"])
+    with TestClient(main.app) as client:
+        plain = client.post("/reclassify", json={"rows": rows})
+        remapped = client.post("/reclassify", json={
+            "rows": rows,
+            "rules": _remap_unknown_rules(),
+        })
+        bad_list = client.post("/reclassify", json={"rows": rows, "rules": {"valid_operations": UNKNOWN}})
+        bad_key = client.post("/reclassify", json={"rows": rows, "rules": {"valid": [UNKNOWN]}})
+    assert plain.status_code == 200
+    assert _fin(plain.json()["operations"]) == _fin(jsonable_encoder(result["operations"]))
+    assert remapped.status_code == 200
+    deposits = Counter(o["operation_type"] for o in remapped.json()["operations"])["deposit"]
+    unknown_rows = sum(r["raw_type"] == UNKNOWN for r in rows)
+    assert deposits == Counter(o["operation_type"] for o in plain.json()["operations"])["deposit"] + unknown_rows
+    assert UNKNOWN not in remapped.json()["meta"]["unknown_fin_ops"]
+    assert bad_list.status_code == 422
+    assert bad_key.status_code == 422
+
+
+@pytest.mark.parametrize("overrides", [
+    {"valid_operations": "Дивиденды"},
+    {"skip_operations": [1, 2]},
+    {"operation_type_map": ["Дивиденды"]},
+    {"operation_type_map": {"Дивиденды": None}},
+    {"unknown_rule": []},
+])
+def test_invalid_overrides_raise(overrides):
+    with pytest.raises(ValueError):
+        build_fin_rules(overrides)
+
+
+def test_raw_rows_kept_only_on_request(parsed):
+    path, result = parsed
+    _, stats = parse_fin_operations(str(path))
+    assert "raw_rows" not in stats
+    _, stats = parse_fin_operations(str(path), keep_raw=True)
+    assert len(stats["raw_rows"]) == len(result["raw_fin_rows"])
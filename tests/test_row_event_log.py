@@ -0,0 +1,67 @@
+import logging
+
+from src.devtools.synthetic import write_statement
+from src.services.full_statement import parse_full_statement, reclassify_statement
+from src.utils import RowEventLog
+
+
+def _log(caplog):
+    log = logging.getLogger("test_row_event_log")
+    caplog.set_level(logging.DEBUG, logger=log.name)
+    return log
+
+
+def test_messages_are_rate_limited_per_key(caplog):
+    row_log = RowEventLog("fin", limit=2, log=_log(caplog))
+    for n in range(5):
+        row_log.event("unknown_raw", logging.WARNING, "unknown row=%s", n)
+    row_log.event("skiplist", logging.DEBUG, "skip row=%s", 9)
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages == [
+        "unknown row=0",
+        "unknown row=1",
+        "[fin] дальнейшие события 'unknown_raw' только считаются (лимит 2)",
+        "skip row=9",
+    ]
+    assert row_log.as_dict() == {"unknown_raw": 5, "skiplist": 1}
+    assert row_log.suppressed() == 3
+
+
+def test_counts_events_even_when_level_disabled(caplog):
+    log = _log(caplog)
+    log.setLevel(logging.WARNING)
+    try:
+        row_log = RowEventLog("fin", limit=-1, log=log)
+        for _ in range(3):
+            row_log.event("coupon_negative", logging.DEBUG, "coupon")
+    finally:
+        log.setLevel(logging.NOTSET)
+    assert caplog.records == []
+    assert row_log.as_dict() == {"coupon_negative": 3}
+    assert row_log.suppressed() == 0
+
+
+def test_flush_writes_summary(caplog):
+    row_log = RowEventLog("fin", limit=1, log=_log(caplog))
+    row_log.flush()
+    assert caplog.records == []
+    row_log.event("no_type", logging.WARNING, "no type")
+    row_log.event("no_type", logging.WARNING, "no type")
+    caplog.clear()
+    row_log.flush()
+    assert [r.getMessage() for r in caplog.records] == ["[fin] события по строкам: no_type=2 (подавлено сообщений: 1)"]
+
+
+def test_statement_meta_reports_log_events(tmp_path):
+    path = tmp_path / "statement.xlsx"
+    write_statement(str(path), n_fin=40, n_trades=5, seed=3)
+    result = parse_full_statement(str(path), include_raw=True)
+    events = result["meta"]["log_events"]
+    assert set(events) == {"fin"}
+    assert events["fin"]["unknown_raw"] == sum(r["raw_type"] == "Неизвестная операция" for r in result["raw_fin_rows"])
+    assert events["fin"]["reallocation_positive"] == result["meta"]["fin_stats"]["reallocations_positive"]
+    assert "log_events" not in result["meta"]["fin_stats"]
+
+    again = reclassify_statement(result["raw_fin_rows"])
+    assert again["meta"]["log_events"] == events
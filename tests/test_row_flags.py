@@ -0,0 +1,42 @@
+import gc
+
+import pandas as pd
+
+from src.parsers import row_flags as rf
+
+
+def _grid(n_rows: int) -> pd.DataFrame:
+    rows = [["01.01.2024", str(i), "Итого" if i % 7 == 0 else "x"] for i in range(n_rows)]
+    rows[n_rows // 2] = ["", "", ""]
+    return pd.DataFrame(rows, dtype=object)
+
+
+def test_row_flags_end_bound():
+    df = _grid(20)
+    bounded = rf.row_flags(df, 3, 9)
+    assert list(bounded.index) == list(range(3, 9))
+    pd.testing.assert_frame_equal(bounded, rf.row_flags(df).iloc[3:9])
+    assert rf.row_flags(df, 20).empty
+
+
+def test_grid_flags_computed_once_per_grid(monkeypatch):
+    df = _grid(20)
+    calls = []
+    orig = rf.row_flags
+    monkeypatch.setattr(rf, "row_flags", lambda *a, **k: calls.append(a) or orig(*a, **k))
+    first = rf.section_flags(df, 2)
+    second = rf.section_flags(df, 11)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, orig(df, 2))
+    pd.testing.assert_frame_equal(second, orig(df, 11))
+    assert first["blank_str"].tolist()[8] and first["total"].tolist()[5]
+
+
+def test_grid_flags_released_with_grid():
+    df = _grid(5)
+    rf.grid_flags(df)
+    key = id(df)
+    assert key in rf._GRID_FLAGS
+    del df
+    gc.collect()
+    assert key not in rf._GRID_FLAGS
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.services import workbook_cache
+
+
+@pytest.fixture
+def grid(monkeypatch, tmp_path):
+    df = pd.DataFrame([["Дата", 1.5], ["01.01.2024", 2]], dtype=object)
+    reads = []
+    monkeypatch.setattr(workbook_cache, "read_sheet", lambda source: reads.append(source) or df.copy())
+    monkeypatch.setenv("PARSER_GRID_CACHE_DIR", str(tmp_path / "cache"))
+    src = tmp_path / "statement.xlsx"
+    src.write_bytes(b"xlsx bytes")
+    return df, src, reads, tmp_path / "cache"
+
+
+def test_second_load_is_served_from_cache(grid):
+    df, src, reads, _ = grid
+    pd.testing.assert_frame_equal(workbook_cache.load_workbook_grid(str(src)), df)
+    pd.testing.assert_frame_equal(workbook_cache.load_workbook_grid(str(src)), df)
+    assert len(reads) == 1
+
+
+def test_pack_failure_falls_back_and_leaves_no_tmp(grid, monkeypatch):
+    df, src, reads, cache = grid
+
+    def broken_encode(_):
+        raise RuntimeError("cannot encode")
+
+    monkeypatch.setattr(workbook_cache, "_encode_grid", broken_encode)
+    errors = workbook_cache.cache_stats()["errors"]
+    pd.testing.assert_frame_equal(workbook_cache.load_workbook_grid(str(src)), df)
+    assert workbook_cache.cache_stats()["errors"] == errors + 1
+    assert [p for p in cache.rglob("*") if p.is_file()] == []
+
+
+def test_round_trip_keeps_cell_types(grid, monkeypatch):
+    _, src, reads, _ = grid
+    df = pd.DataFrame(
+        [["Дата", 1.5, 7, None], [datetime(2024, 1, 2, 3, 4, 5), True, "", "ёж\u00a0€"]], dtype=object
+    )
+    monkeypatch.setattr(workbook_cache, "read_sheet", lambda source: reads.append(source) or df.copy())
+    workbook_cache.load_workbook_grid(str(src))
+    cached = workbook_cache.load_workbook_grid(str(src))
+    assert len(reads) == 1
+    pd.testing.assert_frame_equal(cached, df)
+    assert [type(v) for v in cached.to_numpy().ravel()] == [type(v) for v in df.to_numpy().ravel()]
+
+
+def test_entry_with_pickled_objects_is_not_loaded(grid, monkeypatch):
+    df, src, reads, cache = grid
+    entry = workbook_cache._entry_path(cache, workbook_cache.file_digest(src))
+    entry.parent.mkdir(parents=True)
+    with open(entry, "wb") as fh:
+        np.savez(fh, kinds=np.array([object()], dtype=object))
+    errors = workbook_cache.cache_stats()["errors"]
+    pd.testing.assert_frame_equal(workbook_cache.load_workbook_grid(str(src)), df)
+    assert workbook_cache.cache_stats()["errors"] == errors + 1
+    assert len(reads) == 1
+
+
+def test_unsupported_cell_type_is_not_cached(grid, monkeypatch):
+    _, src, reads, cache = grid
+    df = pd.DataFrame([[object()]], dtype=object)
+    monkeypatch.setattr(workbook_cache, "read_sheet", lambda source: reads.append(source) or df)
+    workbook_cache.load_workbook_grid(str(src))
+    assert [p for p in cache.rglob("*") if p.is_file()] == []